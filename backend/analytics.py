@@ -0,0 +1,314 @@
+"""Materialized detection rollups behind the dashboard analytics endpoint.
+
+Counts and confidence sums are kept per (dimension, bucket, status,
+prediction) in a small collection: ``total``, ``day`` and ``hour`` of the
+timestamp (UTC), ``cell`` (a geohash prefix) and ``location`` (the address).
+Writes adjust the affected rows with ``$inc``; a periodic aggregation
+pipeline rebuilds the whole collection with ``$out`` to correct drift and
+pick up writes made outside the app.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+from geocache import geohash_encode
+from repository import to_iso, utc_now
+
+logger = logging.getLogger(__name__)
+
+GEOHASH_PRECISION = 7  # stored on each detection; rollup cells are prefixes of it
+DIMENSIONS = ("total", "day", "hour", "cell", "location")
+BACKFILL_BATCH_SIZE = 1000
+DAY_FORMAT = "%Y-%m-%d"
+HOUR_FORMAT = "%Y-%m-%dT%H"
+MAX_CACHE_ENTRIES = 32
+
+
+def detection_geohash(lat, lon):
+    return geohash_encode(lat, lon, GEOHASH_PRECISION)
+
+
+def rollup_id(dimension, bucket, status, prediction):
+    return f"{dimension}|{bucket}|{status}|{prediction}"
+
+
+def date_bucket(fmt):
+    # Missing or not-yet-converted timestamps fall in the "" bucket, as in AnalyticsRollups.buckets
+    return {
+        "$cond": [
+            {"$eq": [{"$type": "$timestamp"}, "date"]},
+            {"$dateToString": {"format": fmt, "date": "$timestamp"}},
+            "",
+        ]
+    }
+
+
+def rollup_pipeline(cell_precision, out):
+    """Recount every detection into ``out``; the buckets match ``AnalyticsRollups.buckets``."""
+    return [
+        {
+            "$project": {
+                "_id": 0,
+                "status": {"$ifNull": ["$status", ""]},
+                "prediction": {"$ifNull": ["$prediction", ""]},
+                "confidence": 1,
+                "buckets": {
+                    "total": "all",
+                    "day": date_bucket(DAY_FORMAT),
+                    "hour": date_bucket(HOUR_FORMAT),
+                    "cell": {"$substr": [{"$ifNull": ["$geohash", ""]}, 0, cell_precision]},
+                    "location": {"$ifNull": ["$location_name", ""]},
+                },
+            }
+        },
+        {"$project": {"status": 1, "prediction": 1, "confidence": 1, "buckets": {"$objectToArray": "$buckets"}}},
+        {"$unwind": "$buckets"},
+        {
+            "$group": {
+                "_id": {"$concat": ["$buckets.k", "|", "$buckets.v", "|", "$status", "|", "$prediction"]},
+                "dimension": {"$first": "$buckets.k"},
+                "bucket": {"$first": "$buckets.v"},
+                "status": {"$first": "$status"},
+                "prediction": {"$first": "$prediction"},
+                "count": {"$sum": 1},
+                "confidence_sum": {"$sum": "$confidence"},
+            }
+        },
+        {"$out": out},
+    ]
+
+
+def format_row(row, with_bucket=True):
+    formatted = {
+        "status": row["status"],
+        "prediction": row["prediction"],
+        "count": row["count"],
+        "avg_confidence": row["confidence_sum"] / row["count"],
+    }
+    if with_bucket:
+        formatted["bucket"] = row["bucket"]
+    return formatted
+
+
+class AnalyticsRollups:
+    """Incrementally maintained rollups of ``source`` in ``rollups``, with a TTL cache of the summaries.
+
+    Call ``apply(before, after)`` after every write (``before=None`` for
+    an insert, ``after=None`` for a delete). It also invalidates this
+    process's cache; other processes see the change once ``cache_ttl``
+    runs out. A rebuild racing a write may lose or double count it until
+    the next rebuild.
+    """
+
+    def __init__(self, source, rollups, cell_precision=5, cache_ttl=10.0, rebuild_interval=3600.0):
+        if not 1 <= cell_precision <= GEOHASH_PRECISION:
+            raise ValueError(f"cell_precision must be between 1 and {GEOHASH_PRECISION}")
+        self.source = source
+        self.rollups = rollups
+        self.cell_precision = cell_precision
+        self.cache_ttl = cache_ttl
+        self.rebuild_interval = rebuild_interval
+        self.rebuilt_at = None
+        self.counters = {"applied": 0, "write_failures": 0, "rebuilds": 0, "cache_hits": 0, "cache_misses": 0}
+        self._cache = {}  # (days, hours) -> (summary, expires_at)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = threading.Event()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def ensure_indexes(self):
+        self.rollups.create_index([("dimension", ASCENDING), ("bucket", ASCENDING)], name="dimension_bucket")
+
+    # Incremental updates
+    def buckets(self, detection):
+        """The rollup rows one detection counts towards, as ``{_id: fields}``."""
+        timestamp = detection.get("timestamp")
+        geohash = detection.get("geohash") or ""
+        status = detection.get("status") or ""
+        prediction = detection.get("prediction") or ""
+        buckets = {
+            "total": "all",
+            "day": timestamp.strftime(DAY_FORMAT) if isinstance(timestamp, datetime) else "",
+            "hour": timestamp.strftime(HOUR_FORMAT) if isinstance(timestamp, datetime) else "",
+            "cell": geohash[: self.cell_precision],
+            "location": detection.get("location_name") or "",
+        }
+        return {
+            rollup_id(dimension, bucket, status, prediction): {
+                "dimension": dimension,
+                "bucket": bucket,
+                "status": status,
+                "prediction": prediction,
+            }
+            for dimension, bucket in buckets.items()
+        }
+
+    def _deltas(self, before, after):
+        deltas = {}
+        for sign, detection in ((-1, before), (1, after)):
+            if detection is None:
+                continue
+            confidence = detection.get("confidence") or 0.0
+            for row_id, fields in self.buckets(detection).items():
+                delta = deltas.setdefault(row_id, {"fields": fields, "count": 0, "confidence_sum": 0.0})
+                delta["count"] += sign
+                delta["confidence_sum"] += sign * confidence
+        # An update that keeps a row (say, the day) nets out to nothing there
+        return {row_id: delta for row_id, delta in deltas.items() if delta["count"] or delta["confidence_sum"]}
+
+    def apply(self, before=None, after=None):
+        """Move one detection's contribution from its ``before`` rows to its ``after`` rows."""
+        self.apply_many([(before, after)])
+
+    def apply_many(self, changes):
+        operations = []
+        for before, after in changes:
+            for row_id, delta in self._deltas(before, after).items():
+                operations.append(
+                    UpdateOne(
+                        {"_id": row_id},
+                        {
+                            "$inc": {"count": delta["count"], "confidence_sum": delta["confidence_sum"]},
+                            "$setOnInsert": delta["fields"],
+                        },
+                        upsert=True,
+                    )
+                )
+        if operations:
+            try:
+                self.rollups.bulk_write(operations, ordered=False)
+                self._count("applied", len(changes))
+            except Exception as e:
+                # Counts are off until the next rebuild; bring it forward
+                logger.error(f"❌ Updating analytics rollups failed: {e}")
+                self._count("write_failures")
+                self._wake.set()
+        self.invalidate()
+
+    def record_many(self, detections):
+        """Count newly inserted detections."""
+        self.apply_many([(None, detection) for detection in detections])
+
+    # Rebuilds
+    def backfill_geohashes(self):
+        """Give detections stored before geohashes were kept one, so the pipeline can bucket them."""
+        filled = 0
+        while True:
+            batch = list(
+                self.source.find({"geohash": {"$exists": False}}, {"latitude": 1, "longitude": 1}).limit(
+                    BACKFILL_BATCH_SIZE
+                )
+            )
+            if not batch:
+                return filled
+            self.source.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": doc["_id"]}, {"$set": {"geohash": detection_geohash(doc["latitude"], doc["longitude"])}}
+                    )
+                    for doc in batch
+                ],
+                ordered=False,
+            )
+            filled += len(batch)
+
+    def rebuild(self):
+        """Recount everything with one aggregation pipeline and swap the result in."""
+        started = time.perf_counter()
+        filled = self.backfill_geohashes()
+        if filled:
+            logger.info(f"📝 Added geohashes to {filled} older detections")
+        list(self.source.aggregate(rollup_pipeline(self.cell_precision, self.rollups.name)))
+        self.ensure_indexes()  # $out replaces the collection along with its indexes
+        self.rebuilt_at = to_iso(utc_now())
+        self._count("rebuilds")
+        self.invalidate()
+        logger.info(f"✅ Rebuilt analytics rollups in {time.perf_counter() - started:.2f}s")
+
+    def request_rebuild(self):
+        """Rebuild on the background thread as soon as possible."""
+        self._wake.set()
+
+    def start(self):
+        if self._running.is_set():
+            return
+        self._running.set()
+        threading.Thread(target=self._run, name="analytics-rollups", daemon=True).start()
+
+    def stop(self):
+        self._running.clear()
+        self._wake.set()
+
+    def _run(self):
+        first = True
+        while self._running.is_set():
+            if not first:
+                self._wake.wait(self.rebuild_interval or None)
+                self._wake.clear()
+                if not self._running.is_set():
+                    return
+            try:
+                # With periodic rebuilds off, only rebuild at startup when nothing was ever counted
+                if not first or self.rebuild_interval or self.rollups.estimated_document_count() == 0:
+                    self.rebuild()
+            except Exception as e:
+                logger.error(f"❌ Rebuilding analytics rollups failed: {e}")
+            first = False
+
+    # Reads
+    def invalidate(self):
+        """Drop every cached summary."""
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def _rows(self, dimension, since=None):
+        query = {"dimension": dimension, "count": {"$gt": 0}}
+        if since:
+            query["bucket"] = {"$gte": since}
+        return list(self.rollups.find(query).sort("bucket", ASCENDING))
+
+    def summary(self, days=30, hours=48):
+        """Counts per status and prediction overall, per day for ``days``, per hour for ``hours``, per cell and per location."""
+        key = (days, hours)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[1] > time.monotonic():
+                self.counters["cache_hits"] += 1
+                return entry[0]
+            self.counters["cache_misses"] += 1
+            generation = self._generation
+
+        now = utc_now()
+        summary = {
+            "totals": [format_row(row, with_bucket=False) for row in self._rows("total")],
+            "daily": [format_row(row) for row in self._rows("day", (now - timedelta(days=days)).strftime(DAY_FORMAT))],
+            "hourly": [
+                format_row(row) for row in self._rows("hour", (now - timedelta(hours=hours)).strftime(HOUR_FORMAT))
+            ],
+            "cells": [format_row(row) for row in self._rows("cell") if row["bucket"]],
+            "locations": [format_row(row) for row in self._rows("location") if row["bucket"]],
+            "cell_precision": self.cell_precision,
+            "rebuilt_at": self.rebuilt_at,
+            "generated_at": to_iso(now),
+        }
+        with self._lock:
+            # A write that landed while this was read makes it stale already
+            if generation == self._generation:
+                if len(self._cache) >= MAX_CACHE_ENTRIES:
+                    self._cache.clear()
+                self._cache[key] = (summary, time.monotonic() + self.cache_ttl)
+        return summary
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+            cached = len(self._cache)
+        return {"cell_precision": self.cell_precision, "rebuilt_at": self.rebuilt_at, "cached_summaries": cached, **counters}
@@ -0,0 +1,163 @@
+"""Signed session tokens with a verified-token cache, and bcrypt on a bounded thread pool.
+
+Access tokens are short-lived JWTs carrying the user's id and role, so
+endpoints check roles without a database round trip; refresh tokens are
+longer-lived and get a fresh pair from ``/api/token/refresh``. Bumping a
+user's ``session_version`` (on logout) invalidates their refresh tokens;
+access tokens already issued run out on their own.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import jwt
+
+logger = logging.getLogger(__name__)
+
+ACCESS = "access"
+REFRESH = "refresh"
+ALGORITHM = "HS256"
+
+
+class InvalidToken(ValueError):
+    """The token is malformed, expired, badly signed or of the wrong type."""
+
+
+class HasherBusy(RuntimeError):
+    """Too many password checks are already waiting for the bcrypt pool."""
+
+
+class TokenService:
+    """Issue and verify HS256 session tokens.
+
+    Verified access tokens are kept in an LRU of ``cache_size`` entries
+    until they expire, so repeat requests skip the signature check.
+    """
+
+    def __init__(self, secret, access_ttl=900, refresh_ttl=7 * 24 * 3600, cache_size=10000):
+        self.secret = secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # token -> claims
+        self._lock = threading.Lock()
+        self.counters = {"issued": 0, "refreshed": 0, "cache_hits": 0, "verified": 0, "rejected": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _encode(self, claims, token_type, ttl):
+        now = int(time.time())
+        payload = {**claims, "type": token_type, "iat": now, "exp": now + ttl, "jti": uuid.uuid4().hex}
+        return jwt.encode(payload, self.secret, algorithm=ALGORITHM)
+
+    def issue(self, user, refreshed=False):
+        """Access and refresh tokens for ``{"id", "email", "role", "session_version"}``."""
+        access_token = self._encode(
+            {"sub": user["id"], "email": user["email"], "role": user["role"]}, ACCESS, self.access_ttl
+        )
+        refresh_token = self._encode(
+            {"sub": user["id"], "ver": user.get("session_version", 0)}, REFRESH, self.refresh_ttl
+        )
+        self._count("refreshed" if refreshed else "issued")
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+            "expires_in": self.access_ttl,
+        }
+
+    def verify(self, token, token_type=ACCESS):
+        """Claims of a valid token of ``token_type``; raises InvalidToken otherwise."""
+        if not token:
+            raise InvalidToken("Missing token")
+        now = time.time()
+        with self._lock:
+            claims = self._cache.get(token)
+            if claims is not None:
+                if claims["exp"] > now:
+                    self._cache.move_to_end(token)
+                    self.counters["cache_hits"] += 1
+                    return claims
+                del self._cache[token]
+
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[ALGORITHM], options={"require": ["exp", "sub"]})
+        except jwt.ExpiredSignatureError:
+            self._count("rejected")
+            raise InvalidToken("Token expired")
+        except jwt.InvalidTokenError as e:
+            self._count("rejected")
+            raise InvalidToken(f"Invalid token: {e}")
+        if claims.get("type") != token_type:
+            self._count("rejected")
+            raise InvalidToken(f"Expected an {token_type} token")
+
+        self._count("verified")
+        if token_type == ACCESS:
+            # Refresh tokens are checked against the user's session version, so never cached
+            with self._lock:
+                self._cache[token] = claims
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return {"cached_tokens": len(self._cache), **self.counters}
+
+
+class PasswordHasher:
+    """bcrypt hashing and checks on ``max_workers`` threads.
+
+    At most ``max_pending`` calls may be running or queued; beyond that
+    ``HasherBusy`` is raised at once, so a burst of logins cannot pile up
+    threads or CPU behind the upload workers.
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, rounds=12, timeout=30.0):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        # Compared against when the email is unknown, so a miss takes as long as a wrong password
+        self._dummy_hash = bcrypt.hashpw(b"dummy-password", bcrypt.gensalt(rounds))
+        self._lock = threading.Lock()
+        self.counters = {"hashed": 0, "checked": 0, "rejected_busy": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self._count("rejected_busy")
+            raise HasherBusy("Too many logins in progress, please retry")
+        try:
+            return self._executor.submit(fn, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        hashed = self._run(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        self._count("hashed")
+        return hashed
+
+    def check(self, password, hashed):
+        """True when ``password`` matches; ``hashed=None`` (no such user) still costs one check."""
+        matched = self._run(bcrypt.checkpw, password.encode("utf-8"), hashed or self._dummy_hash)
+        self._count("checked")
+        return matched and hashed is not None
+
+    def needs_rehash(self, hashed):
+        # "$2b$12$..." carries the cost it was made with
+        return int(hashed.split(b"$")[2]) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            return {"rounds": self.rounds, **self.counters}
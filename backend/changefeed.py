@@ -0,0 +1,335 @@
+"""Ordered change log for a collection, ``since=<token>`` delta reads and batched broadcasts.
+
+On a replica set, changes come from a MongoDB change stream on the
+collection, resumed from the last stored resume token after a restart.
+Elsewhere (standalone servers, mongomock) the app records its own writes
+into the same log, standing in for tailing the oplog. Every entry gets a
+sequence number from an atomic counter, so tokens only ever increase, and
+one elected server process tails the log and broadcasts it for all.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+UPSERT = "upsert"
+DELETE = "delete"
+PRUNE_INTERVAL = 60.0  # seconds between retention sweeps
+GAP_SETTLE_SECONDS = 5.0  # after this, a missing sequence number is treated as never written
+LEASE_SECONDS = 10.0  # a broadcaster that stops renewing is replaced after this long
+OPERATION_TYPES = {"insert": UPSERT, "update": UPSERT, "replace": UPSERT, "delete": DELETE}
+
+
+class ChangeLogExpired(ValueError):
+    """The token predates the retained log; the client has to reload everything."""
+
+
+def parse_token(value):
+    """Decode a change token (a non-negative sequence number); empty means "from the start"."""
+    if value in (None, ""):
+        return 0
+    try:
+        seq = int(value)
+    except ValueError:
+        raise ValueError("Invalid since token")
+    if seq < 0:
+        raise ValueError("Invalid since token")
+    return seq
+
+
+def _as_utc(value):
+    # PyMongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def coalesce(entries):
+    """Collapse log entries to the last operation per document, ordered by that last change."""
+    latest = {}
+    for entry in entries:
+        latest.pop(entry["document_id"], None)
+        latest[entry["document_id"]] = entry["op"]
+    return latest
+
+
+class ChangeFeed:
+    """Change log for ``db[name]`` kept in ``db[name + "_changes"]``.
+
+    ``record``/``record_many`` are called after every write; they do
+    nothing while a change stream is capturing writes. A tailer thread
+    reads new entries every ``poll_interval`` seconds, coalesces them per
+    document and hands one payload to ``on_batch``, so a burst of updates
+    to one detection becomes a single broadcast. Only the process holding
+    the broadcaster lease does this; the others take over if it dies.
+    """
+
+    def __init__(
+        self,
+        db,
+        name,
+        serialize,
+        on_batch=None,
+        mode="auto",
+        poll_interval=0.25,
+        batch_limit=500,
+        retention_seconds=24 * 3600,
+    ):
+        self.name = name
+        self.source = db[name]
+        self.log = db[f"{name}_changes"]
+        self.claims = db[f"{name}_change_events"]  # change-stream event tokens already logged by some process
+        self.state = db.change_feed_state
+        self.serialize = serialize
+        self.on_batch = on_batch
+        self.mode = mode  # auto until start() opens the change stream or falls back to "oplog"
+        self.poll_interval = poll_interval
+        self.batch_limit = batch_limit
+        self.retention_seconds = retention_seconds
+        self.counters = {"recorded": 0, "streamed": 0, "broadcasts": 0, "broadcast_changes": 0}
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._threads = []
+        self._stream = None
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leader = False
+        self._started_at_token = "0"
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def ensure_indexes(self):
+        self.log.create_index("event_token", unique=True, sparse=True, name="event_token")
+        self.claims.create_index("at", expireAfterSeconds=int(self.retention_seconds), name="at_ttl")
+
+    # Writing
+    def _next_seq(self):
+        counter = self.state.find_one_and_update(
+            {"_id": f"{self.name}:seq"}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["seq"]
+
+    def _append(self, op, document_id, event_token=None):
+        entry = {"op": op, "document_id": document_id, "at": datetime.now(timezone.utc)}
+        if event_token is not None:
+            # Every process watches the stream; only the one that claims an event
+            # takes a sequence number, so losers leave no gaps for readers to wait out
+            try:
+                self.claims.insert_one({"_id": event_token, "at": entry["at"]})
+            except DuplicateKeyError:
+                return
+            entry["event_token"] = event_token
+        entry["_id"] = self._next_seq()
+        try:
+            self.log.insert_one(entry)
+        except DuplicateKeyError:
+            pass
+
+    def record(self, op, document_id):
+        """Log a write made by this app (a no-op while the change stream captures writes)."""
+        if self.mode == "changestream":
+            return
+        self._append(op, document_id)
+        self._count("recorded")
+
+    def record_many(self, op, document_ids):
+        for document_id in document_ids:
+            self.record(op, document_id)
+
+    # Reading
+    def head(self):
+        """Token of the newest change; reads taken after this include every change up to it."""
+        counter = self.state.find_one({"_id": f"{self.name}:seq"})
+        return str(counter["seq"] if counter else 0)
+
+    def changes_since(self, token, limit=None):
+        """Coalesced changes after ``token``: ``{"changes", "since", "token", "has_more"}``.
+
+        Raises ChangeLogExpired when entries after the token were already
+        pruned, or the token comes from another log.
+        """
+        since = parse_token(token)
+        limit = limit or self.batch_limit
+        entries = list(self.log.find({"_id": {"$gt": since}}).sort("_id", ASCENDING).limit(limit + 1))
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        # A writer that took sequence N may insert after the one that took N + 1;
+        # stop before a fresh gap so the reader does not skip N for good
+        now = datetime.now(timezone.utc)
+        expected = since + 1
+        for i, entry in enumerate(entries):
+            if entry["_id"] != expected and (now - _as_utc(entry["at"])).total_seconds() < GAP_SETTLE_SECONDS:
+                entries, has_more = entries[:i], True
+                break
+            expected = entry["_id"] + 1
+
+        if since:
+            state = self.state.find_one({"_id": f"{self.name}:seq"}) or {}
+            if since > state.get("seq", 0):
+                raise ChangeLogExpired("Token is ahead of the change log")
+            if since < state.get("pruned_through", 0):
+                raise ChangeLogExpired("Changes after this token are no longer retained")
+
+        latest = coalesce(entries)
+        upserted = [document_id for document_id, op in latest.items() if op == UPSERT]
+        documents = {doc["_id"]: doc for doc in self.source.find({"_id": {"$in": upserted}})} if upserted else {}
+
+        changes = []
+        for document_id, op in latest.items():
+            document = documents.get(document_id)
+            if op == UPSERT and document is not None:
+                changes.append({"op": UPSERT, "id": str(document_id), "detection": self.serialize(document)})
+            else:
+                # Deleted, or deleted again after the logged upsert
+                changes.append({"op": DELETE, "id": str(document_id)})
+        next_token = str(entries[-1]["_id"]) if entries else str(since)
+        return {"changes": changes, "since": str(since), "token": next_token, "has_more": has_more}
+
+    def prune(self):
+        """Drop entries older than the retention window, remembering the newest dropped sequence number."""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.retention_seconds)
+        newest_expired = self.log.find_one({"at": {"$lt": cutoff}}, sort=[("_id", DESCENDING)])
+        if not newest_expired:
+            return 0
+        # Record the boundary first, so a client never reads across a half-finished prune
+        self.state.update_one(
+            {"_id": f"{self.name}:seq"}, {"$max": {"pruned_through": newest_expired["_id"]}}, upsert=True
+        )
+        return self.log.delete_many({"_id": {"$lte": newest_expired["_id"]}}).deleted_count
+
+    # Background threads
+    def start(self):
+        """Open the change stream if the server supports it, then start tailing the log."""
+        if self._running.is_set():
+            return
+        self._running.set()
+        self._started_at_token = self.head()
+        if self.mode == "auto":
+            self._stream = self._open_stream()
+            self.mode = "changestream" if self._stream else "oplog"
+        if self._stream:
+            self._threads.append(threading.Thread(target=self._watch, name=f"{self.name}-changestream", daemon=True))
+        self._threads.append(threading.Thread(target=self._tail, name=f"{self.name}-changefeed", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"✅ Change feed for {self.name} started ({self.mode})")
+
+    def stop(self):
+        self._running.clear()
+        if self._stream:
+            self._stream.close()
+
+    def _open_stream(self):
+        state = self.state.find_one({"_id": f"{self.name}:resume"})
+        resume_after = state["token"] if state else None
+        try:
+            return self.source.watch(resume_after=resume_after)
+        except OperationFailure as e:
+            if resume_after and "resume" in str(e).lower():
+                logger.warning(f"⚠️ Change stream resume point for {self.name} is gone, starting from now: {e}")
+                return self.source.watch()
+            logger.info(f"📝 Change streams unavailable for {self.name}, recording writes in the app: {e}")
+        except Exception as e:
+            logger.info(f"📝 Change streams unavailable for {self.name}, recording writes in the app: {e}")
+        return None
+
+    def _watch(self):
+        saved_at = 0.0
+        while self._running.is_set():
+            try:
+                for event in self._stream:
+                    op = OPERATION_TYPES.get(event["operationType"])
+                    if op:
+                        self._append(op, event["documentKey"]["_id"], event_token=event["_id"]["_data"])
+                        self._count("streamed")
+                    # Persist the resume point at most once per poll interval
+                    if time.monotonic() - saved_at >= self.poll_interval:
+                        self.state.update_one(
+                            {"_id": f"{self.name}:resume"}, {"$set": {"token": event["_id"]}}, upsert=True
+                        )
+                        saved_at = time.monotonic()
+            except Exception as e:
+                if not self._running.is_set():
+                    return
+                logger.warning(f"⚠️ Change stream for {self.name} interrupted, resuming: {e}")
+                time.sleep(1.0)
+                self._stream = self._open_stream() or self._stream
+
+    def _hold_lease(self, token):
+        """Take or renew the broadcaster lease; returns ``(held, stored broadcast token)``."""
+        now = datetime.now(timezone.utc)
+        fields = {"owner": self.instance_id, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}
+        if token is not None:
+            fields["token"] = token
+        try:
+            lease = self.state.find_one_and_update(
+                {"_id": f"{self.name}:broadcaster", "$or": [{"owner": self.instance_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": fields},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return False, None  # Held by a live process: the filter missed and the upsert hit its _id
+        return True, lease.get("token")
+
+    def _tail(self):
+        token = None
+        renewed_at = pruned_at = 0.0
+        while self._running.is_set():
+            time.sleep(self.poll_interval)
+            # One process broadcasts for all of them (the Socket.IO message queue fans out)
+            if not self.leader or time.monotonic() - renewed_at >= LEASE_SECONDS / 3:
+                try:
+                    held, stored = self._hold_lease(token if self.leader else None)
+                except Exception as e:
+                    logger.error(f"❌ Renewing the {self.name} broadcaster lease failed: {e}")
+                    held = False
+                if not held:
+                    self.leader = False
+                    continue
+                if not self.leader:
+                    # Pick up where the previous broadcaster stopped
+                    self.leader = True
+                    token = stored or self._started_at_token
+                    logger.info(f"📤 Broadcasting {self.name} changes from token {token}")
+                renewed_at = time.monotonic()
+
+            if time.monotonic() - pruned_at >= PRUNE_INTERVAL:
+                pruned_at = time.monotonic()
+                try:
+                    self.prune()
+                except Exception as e:
+                    logger.error(f"❌ Pruning the {self.name} change log failed: {e}")
+            try:
+                batch = self.changes_since(token)
+            except ChangeLogExpired:
+                token = self.head()
+                continue
+            except Exception as e:
+                logger.error(f"❌ Reading the {self.name} change log failed: {e}")
+                continue
+            if not batch["changes"]:
+                token = batch["token"]
+                continue
+            try:
+                if self.on_batch:
+                    self.on_batch(batch)
+                self._count("broadcasts")
+                self._count("broadcast_changes", len(batch["changes"]))
+            except Exception as e:
+                logger.error(f"❌ Broadcasting {self.name} changes failed: {e}")
+            token = batch["token"]
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {"mode": self.mode, "token": self.head(), "leader": self.leader, **counters}
+
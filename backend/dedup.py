@@ -0,0 +1,69 @@
+import logging
+
+from PIL import Image
+
+from geo import radius_query
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_CANDIDATES = 50
+
+
+def perceptual_hash(image, hash_size=8):
+    """64-bit difference hash (dHash) as a 16-character hex string.
+
+    Re-encoded, resized or lightly recompressed copies of a photo hash to
+    values a few bits apart.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hex hashes."""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def find_exact(collection, sha256):
+    """Look up a cached prediction by content hash."""
+    return collection.find_one({"_id": sha256})
+
+
+def remember(collection, sha256, detection):
+    """Cache a detection's prediction under its content hash.
+
+    The stored file and first detection are kept (first writer wins); the
+    prediction follows the latest model version that scored the image.
+    """
+    collection.update_one(
+        {"_id": sha256},
+        {
+            "$set": {
+                "prediction": detection["prediction"],
+                "confidence": detection["confidence"],
+                "model_version": detection.get("model_version"),
+            },
+            "$setOnInsert": {
+                "image_url": detection["image_url"],
+                "detection_id": detection["_id"],
+            },
+        },
+        upsert=True,
+    )
+
+
+def find_near_duplicate(collection, lat, lon, phash, radius_meters, max_distance):
+    """Find an existing detection within ``radius_meters`` whose photo looks the same."""
+    query = radius_query(lat, lon, radius_meters)
+    query["phash"] = {"$exists": True}
+    candidates = collection.find(query).limit(NEAR_DUPLICATE_CANDIDATES)
+    for candidate in candidates:
+        if hamming_distance(candidate["phash"], phash) <= max_distance:
+            return candidate
+    return None
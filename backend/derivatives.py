@@ -0,0 +1,54 @@
+import io
+import logging
+import os
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels of each derivative
+DERIVATIVE_SIZES = {"thumb": 320, "medium": 1024}
+
+# Stored extension -> (Pillow format, save options)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def derivative_paths(store, sha256):
+    """Relative paths of every derivative of an upload, keyed by size then format.
+
+    Paths depend only on the content hash, so every detection of the same
+    image shares them.
+    """
+    return {
+        name: {ext: store.relative_path(sha256, ext, variant=name) for ext in DERIVATIVE_FORMATS}
+        for name in DERIVATIVE_SIZES
+    }
+
+
+def derivatives_exist(store, sha256):
+    """Whether every derivative of an upload has been rendered and stored."""
+    return all(
+        os.path.exists(store.path(sha256, ext, variant=name))
+        for name in DERIVATIVE_SIZES
+        for ext in DERIVATIVE_FORMATS
+    )
+
+
+def build_derivatives(store, sha256, data):
+    """Render and store the WebP and JPEG derivatives of an uploaded image."""
+    # Largest size first, so each smaller derivative resizes the previous one
+    sizes = sorted(DERIVATIVE_SIZES.items(), key=lambda item: item[1], reverse=True)
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", (sizes[0][1], sizes[0][1]))
+    img = img.convert("RGB")
+
+    for name, edge in sizes:
+        img.thumbnail((edge, edge), Image.LANCZOS)  # no-op when already smaller
+        for ext, (fmt, options) in DERIVATIVE_FORMATS.items():
+            out = io.BytesIO()
+            img.save(out, format=fmt, **options)
+            store.save(sha256, ext, out.getvalue(), variant=name)
+    logger.info(f"🖼️ Built derivatives for {sha256[:12]}")
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import zlib
+
+EXPORT_BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024  # Flush to the client roughly every 64KB
+
+CSV_FIELDS = [
+    "id",
+    "prediction",
+    "confidence",
+    "latitude",
+    "longitude",
+    "location_name",
+    "image_url",
+    "timestamp",
+    "status",
+    "source",
+]
+
+
+def _chunked(lines):
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def iter_ndjson(records):
+    """Yield byte chunks with one JSON document per line."""
+    return _chunked(json.dumps(r, default=str) + "\n" for r in records)
+
+
+def iter_csv(records, fields=CSV_FIELDS):
+    """Yield byte chunks of CSV rows, starting with a header row."""
+
+    def lines():
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        yield out.getvalue()
+
+    return _chunked(lines())
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of byte chunks into a single gzip stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
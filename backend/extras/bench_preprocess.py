@@ -0,0 +1,83 @@
+"""Benchmark the legacy full-resolution preprocessing against the draft-mode fast path.
+
+Usage (from backend/): python extras/bench_preprocess.py [image_dir] [--repeat N]
+Phone-sized JPEGs are synthesised when no directory is given, since the
+dataset images are already small.
+"""
+import argparse
+import glob
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import BatchBuffer, decode_image, image_to_array  # noqa: E402
+
+
+def legacy_preprocess(data):
+    """The original server path: full decode, RGB convert, resize, float64 divide."""
+    img = Image.open(io.BytesIO(data)).convert("RGB").resize((224, 224))
+    return np.expand_dims(np.array(img) / 255.0, axis=0)
+
+
+def fast_preprocess(data, buffer):
+    return buffer.fill([image_to_array(decode_image(data))])
+
+
+def synthetic_jpegs(count=8, size=(4032, 3024)):
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        # Smooth gradients plus noise compress like a real photo rather than pure noise
+        base = np.linspace(0, 255, size[0], dtype=np.float32)[np.newaxis, :, np.newaxis]
+        pixels = np.clip(base + rng.normal(0, 20, (size[1], size[0], 3)), 0, 255).astype(np.uint8)
+        out = io.BytesIO()
+        Image.fromarray(pixels).save(out, format="JPEG", quality=90)
+        images.append(out.getvalue())
+    return images
+
+
+def bench(name, fn, images, repeat):
+    fn(images[0])  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in images:
+            fn(data)
+    elapsed = time.perf_counter() - start
+    per_image = elapsed / (repeat * len(images)) * 1000
+    print(f"{name:<8} {per_image:8.2f} ms/image  {1000 / per_image:8.1f} images/s")
+    return per_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("image_dir", nargs="?")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.image_dir:
+        paths = sorted(glob.glob(os.path.join(args.image_dir, "**", "*.jp*g"), recursive=True))[:64]
+        images = [open(p, "rb").read() for p in paths]
+    else:
+        images = synthetic_jpegs()
+    if not images:
+        sys.exit("No images found")
+
+    first = Image.open(io.BytesIO(images[0]))
+    print(f"{len(images)} images, first is {first.size[0]}x{first.size[1]}")
+
+    buffer = BatchBuffer(1)
+    legacy = bench("legacy", legacy_preprocess, images, args.repeat)
+    fast = bench("fast", lambda d: fast_preprocess(d, buffer), images, args.repeat)
+    print(f"speedup  {legacy / fast:8.2f}x")
+
+    diff = np.abs(legacy_preprocess(images[0]) - fast_preprocess(images[0], buffer)).mean()
+    print(f"mean abs pixel difference: {diff:.4f} (input bytes {legacy_preprocess(images[0]).nbytes} -> {buffer.buffer[:1].nbytes})")
+
+
+if __name__ == "__main__":
+    main()
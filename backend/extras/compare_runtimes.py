@@ -0,0 +1,85 @@
+"""Accuracy-parity and latency/throughput comparison of the inference runtimes.
+
+Usage (from backend/): python extras/compare_runtimes.py [--runtimes keras,tf_function,tflite]
+Every runtime scores the same extras/dataset/val images. The report shows
+accuracy, agreement with the Keras baseline, the largest probability
+difference, single-image latency and batched throughput.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from preprocessing import decode_image, image_to_array  # noqa: E402
+from runtimes import load_runtime  # noqa: E402
+
+CLASS_NAMES = ["clean", "garbage"]  # flow_from_directory order used in training
+
+
+def load_validation_set(data_dir, limit=None):
+    images, labels = [], []
+    for label, name in enumerate(CLASS_NAMES):
+        for path in sorted(glob.glob(os.path.join(data_dir, name, "*.jp*g")))[:limit]:
+            with open(path, "rb") as f:
+                images.append(image_to_array(decode_image(f.read()))[0])
+            labels.append(label)
+    return np.stack(images).astype(np.float32) / 255.0, np.array(labels)
+
+
+def predict_all(runtime, images, batch_size):
+    return np.concatenate(
+        [runtime.predict(images[i : i + batch_size]) for i in range(0, len(images), batch_size)]
+    )
+
+
+def measure_latency(runtime, images, runs):
+    runtime.predict(images[:1])  # trace / allocate before timing
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        runtime.predict(images[i % len(images)][np.newaxis])
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runtimes", default="keras,tf_function,tflite")
+    parser.add_argument("--data-dir", default=os.path.join(BACKEND_DIR, "extras", "dataset", "val"))
+    parser.add_argument("--model-path", default=os.path.join(BACKEND_DIR, "model_deep.keras"))
+    parser.add_argument("--tflite-path", default=os.path.join(BACKEND_DIR, "model_deep_int8.tflite"))
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--latency-runs", type=int, default=50)
+    parser.add_argument("--limit", type=int, help="max images per class")
+    args = parser.parse_args()
+
+    images, labels = load_validation_set(args.data_dir, args.limit)
+    print(f"{len(images)} validation images\n")
+    print(f"{'runtime':<12} {'accuracy':>9} {'agree':>7} {'max|dp|':>8} {'p50 ms':>8} {'p99 ms':>8} {'img/s':>8}")
+
+    baseline = None
+    for name in args.runtimes.split(","):
+        runtime = load_runtime(name, model_path=args.model_path, tflite_path=args.tflite_path)
+        predict_all(runtime, images[: args.batch_size], args.batch_size)  # warm up
+
+        start = time.perf_counter()
+        probs = predict_all(runtime, images, args.batch_size)
+        throughput = len(images) / (time.perf_counter() - start)
+        p50, p99 = measure_latency(runtime, images, args.latency_runs)
+
+        classes = probs.argmax(axis=1)
+        if baseline is None:
+            baseline = probs
+        agreement = (classes == baseline.argmax(axis=1)).mean()
+        max_diff = np.abs(probs - baseline).max()
+        accuracy = (classes == labels).mean()
+        print(f"{name:<12} {accuracy:9.2%} {agreement:7.2%} {max_diff:8.4f} {p50:8.2f} {p99:8.2f} {throughput:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Convert model_deep.keras into post-training-quantized TFLite models.
+
+Usage (from backend/): python extras/convert_tflite.py [--mode int8|float16|all]
+INT8 quantization is calibrated on images from extras/dataset/val. Model
+inputs and outputs stay float32, so TFLiteRuntime can serve either file.
+"""
+import argparse
+import glob
+import os
+import random
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from preprocessing import decode_image, image_to_array  # noqa: E402
+
+DEFAULT_CALIBRATION_DIR = os.path.join(BACKEND_DIR, "extras", "dataset", "val")
+
+
+def calibration_images(data_dir, count):
+    """Yield preprocessed float32 images drawn evenly from every class folder."""
+    paths = sorted(glob.glob(os.path.join(data_dir, "*", "*.jp*g")))
+    random.Random(0).shuffle(paths)
+    for path in paths[:count]:
+        with open(path, "rb") as f:
+            yield image_to_array(decode_image(f.read())).astype(np.float32) / 255.0
+
+
+def convert(model, mode, data_dir, calibration_count):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    else:
+        converter.representative_dataset = lambda: ([img] for img in calibration_images(data_dir, calibration_count))
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=os.path.join(BACKEND_DIR, "model_deep.keras"))
+    parser.add_argument("--mode", choices=["int8", "float16", "all"], default="all")
+    parser.add_argument("--calibration-dir", default=DEFAULT_CALIBRATION_DIR)
+    parser.add_argument("--calibration-count", type=int, default=200)
+    parser.add_argument("--output-dir", default=BACKEND_DIR)
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model)
+    modes = ["int8", "float16"] if args.mode == "all" else [args.mode]
+    for mode in modes:
+        tflite_model = convert(model, mode, args.calibration_dir, args.calibration_count)
+        path = os.path.join(args.output_dir, f"model_deep_{mode}.tflite")
+        with open(path, "wb") as f:
+            f.write(tflite_model)
+        print(f"Saved {path} ({len(tflite_model) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
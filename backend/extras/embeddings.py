@@ -0,0 +1,86 @@
+"""Memory-mapped store of backbone embeddings keyed by image SHA-256.
+
+Used by ``modeldepp.py --mode features``: the frozen MobileNetV2 runs once
+per image, and later runs only embed images whose hash is not stored yet.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class EmbeddingStore:
+    """Rows of a float16 ``embeddings.npy`` memmap, indexed by ``index.json``.
+
+    The array is grown by doubling, and the index is rewritten atomically
+    after the rows it points at are flushed, so an interrupted run never
+    leaves the index pointing at unwritten rows.
+    """
+
+    def __init__(self, directory, dim=1280, initial_capacity=1024):
+        self.directory = directory
+        self.dim = dim
+        os.makedirs(directory, exist_ok=True)
+        self.array_path = os.path.join(directory, "embeddings.npy")
+        self.index_path = os.path.join(directory, "index.json")
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.index = json.load(f)
+        if os.path.exists(self.array_path):
+            self.array = np.load(self.array_path, mmap_mode="r+")
+            if self.array.shape[1] != dim:
+                raise ValueError(f"Store holds {self.array.shape[1]}-d embeddings, expected {dim}")
+        else:
+            self.array = np.lib.format.open_memmap(
+                self.array_path, mode="w+", dtype=np.float16, shape=(initial_capacity, dim)
+            )
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, sha256):
+        return sha256 in self.index
+
+    def _grow(self, needed):
+        capacity = len(self.array)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        tmp_path = self.array_path + ".tmp"
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=(capacity, self.dim))
+        grown[: len(self.index)] = self.array[: len(self.index)]
+        grown.flush()
+        del grown
+        self.array = None
+        os.replace(tmp_path, self.array_path)
+        self.array = np.load(self.array_path, mmap_mode="r+")
+
+    def add(self, hashes, vectors):
+        """Append embeddings for hashes not stored yet."""
+        new = [(sha, vector) for sha, vector in zip(hashes, vectors) if sha not in self.index]
+        if not new:
+            return
+        start = len(self.index)
+        self._grow(start + len(new))
+        self.array[start : start + len(new)] = np.stack([vector for _, vector in new])
+        self.array.flush()
+        for offset, (sha, _) in enumerate(new):
+            self.index[sha] = start + offset
+
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def get(self, hashes):
+        """Stacked float32 embeddings for ``hashes``, in order."""
+        return np.asarray(self.array[[self.index[sha] for sha in hashes]], dtype=np.float32)
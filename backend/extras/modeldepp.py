@@ -1,127 +1,182 @@
+"""Train the MobileNetV2 garbage classifier served as model_deep.keras.
+
+Usage (from backend/): python extras/modeldepp.py [--data-dir extras/dataset] [--output model_deep.keras]
+Images are decoded and resized once by a parallel tf.data pipeline and
+cached, so later epochs only run augmentation and the model. Augmentation
+runs on whole batches with Keras preprocessing layers and is kept out of
+the saved model, which still takes 224x224 RGB images scaled to [0, 1].
+
+``--mode features`` trains the head on cached backbone embeddings instead:
+the frozen MobileNetV2 runs once per image, its pooled features are kept
+in a memory-mapped store keyed by image hash (see embeddings.py), and
+later runs only embed images that are new. Retraining the head after
+adding labeled images to the dataset then takes seconds. Fine-tuning the
+backbone is off in this mode unless ``--fine-tune-epochs`` asks for it.
+"""
+import argparse
 import os
+import time
+
 import tensorflow as tf
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from tensorflow.keras import layers
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.models import Model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
-import matplotlib.pyplot as plt
-
-# Dataset paths (Use absolute paths to avoid errors)
-base_dir = r"E:\YashAgarwal\Projects\Garbage-DetectionCopy\backend\extras\dataset"
-train_dir = os.path.join(base_dir, "train")
-val_dir = os.path.join(base_dir, "val")
-
-# Check if dataset directories exist
-if not os.path.exists(train_dir) or not os.path.exists(val_dir):
-    raise FileNotFoundError(f"Dataset folders not found! Ensure '{train_dir}' and '{val_dir}' exist.")
-
-# Image parameters
-img_size = (224, 224)
-batch_size = 32
-
-# Data Augmentation for training data
-train_datagen = ImageDataGenerator(
-    rescale=1.0 / 255.0,
-    rotation_range=20,
-    width_shift_range=0.2,
-    height_shift_range=0.2,
-    horizontal_flip=True,
-    zoom_range=0.2,
-    shear_range=0.2,
-    brightness_range=[0.8, 1.2]
-)
-
-# Data preprocessing for validation data (no augmentation)
-val_datagen = ImageDataGenerator(rescale=1.0 / 255.0)
-
-# Load training and validation data
-train_generator = train_datagen.flow_from_directory(
-    train_dir,
-    target_size=img_size,
-    batch_size=batch_size,
-    class_mode="categorical"
-)
-
-val_generator = val_datagen.flow_from_directory(
-    val_dir,
-    target_size=img_size,
-    batch_size=batch_size,
-    class_mode="categorical"
-)
-
-# Load MobileNetV2 without the top layers
-base_model = MobileNetV2(weights="imagenet", include_top=False, input_shape=(224, 224, 3))
-
-# Freeze the base model layers
-base_model.trainable = False
-
-# Add custom layers on top of the base model
-x = base_model.output
-x = GlobalAveragePooling2D()(x)
-x = Dense(128, activation="relu")(x)
-output_layer = Dense(2, activation="softmax")(x)  # Explicitly define output layer
-
-# Define the model
-model = Model(inputs=base_model.input, outputs=output_layer)  # Use 'output_layer'
-
-# Compile the model
-model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
-
-# Train the model
-try:
-    history = model.fit(
-        train_generator,
-        validation_data=val_generator,
-        epochs=10
+
+from embeddings import EmbeddingStore, file_sha256
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLASS_NAMES = ["clean", "garbage"]  # flow_from_directory order; the server maps index 1 to "Garbage"
+IMG_SIZE = (224, 224)
+AUTOTUNE = tf.data.AUTOTUNE
+EMBED_CHUNK_SIZE = 1024  # images embedded between store flushes
+
+
+def list_images(data_dir):
+    """Return ``(paths, labels)`` for every image in the class subfolders of ``data_dir``."""
+    paths, labels = [], []
+    for label, name in enumerate(CLASS_NAMES):
+        class_dir = os.path.join(data_dir, name)
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith((".jpg", ".jpeg", ".png")):
+                paths.append(os.path.join(class_dir, filename))
+                labels.append(label)
+    if not paths:
+        raise FileNotFoundError(f"No images found under '{data_dir}'")
+    return paths, labels
+
+
+def load_image(path):
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    return tf.image.resize(image, IMG_SIZE, antialias=True) / 255.0
+
+
+def decode(path, label):
+    return load_image(path), tf.one_hot(label, len(CLASS_NAMES))
+
+
+def build_augmentation():
+    """Random transforms applied to whole batches (the old ImageDataGenerator settings, minus shear)."""
+    return tf.keras.Sequential(
+        [
+            layers.RandomFlip("horizontal"),
+            layers.RandomRotation(20 / 360),
+            layers.RandomTranslation(0.2, 0.2),
+            layers.RandomZoom(0.2),
+            layers.RandomBrightness(0.2, value_range=(0.0, 1.0)),
+        ],
+        name="augmentation",
     )
-except Exception as e:
-    print(f"Error during training: {e}")
-
-# Fine-tuning: Unfreeze some layers and recompile
-base_model.trainable = True
-for layer in base_model.layers[:100]:  # Freeze the first 100 layers
-    layer.trainable = False
-
-# Recompile the model with a lower learning rate
-model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=1e-5),
-              loss="categorical_crossentropy",
-              metrics=["accuracy"])
-
-# Fine-tune the model
-try:
-    history_fine = model.fit(
-        train_generator,
-        validation_data=val_generator,
-        epochs=5
+
+
+def make_dataset(data_dir, batch_size, cache, augmentation=None, seed=0):
+    """Parallel decode -> cache -> (shuffle, batch, augment) -> prefetch."""
+    paths, labels = list_images(data_dir)
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(decode, num_parallel_calls=AUTOTUNE)
+    # Decoded, resized images are cached in memory, or on disk when a file prefix is given
+    ds = ds.cache(cache)
+    if augmentation is not None:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size, num_parallel_calls=AUTOTUNE)
+    if augmentation is not None:
+        ds = ds.map(lambda x, y: (augmentation(x, training=True), y), num_parallel_calls=AUTOTUNE)
+    return ds.prefetch(AUTOTUNE), len(paths)
+
+
+def configure_mixed_precision(mode):
+    """Pick a Keras precision policy; ``auto`` uses float16 only when a GPU is present."""
+    if mode == "auto":
+        mode = "float16" if tf.config.list_physical_devices("GPU") else "off"
+    if mode != "off":
+        tf.keras.mixed_precision.set_global_policy(f"mixed_{mode}")
+    print(f"Mixed precision: {mode}")
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Prints wall time and training throughput for every epoch."""
+
+    def __init__(self, num_images):
+        super().__init__()
+        self.num_images = num_images
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._start
+        self.times.append(elapsed)
+        print(f"Epoch {epoch + 1}: {elapsed:.1f}s ({self.num_images / elapsed:.1f} images/s)")
+
+
+def build_head(features):
+    x = layers.Dense(128, activation="relu", name="head_dense")(features)
+    # Keep the softmax in float32 so mixed precision cannot change the served probabilities
+    return layers.Dense(len(CLASS_NAMES), activation="softmax", dtype="float32", name="head_output")(x)
+
+
+def build_model():
+    base_model = MobileNetV2(weights="imagenet", include_top=False, input_shape=IMG_SIZE + (3,))
+    base_model.trainable = False
+
+    x = layers.GlobalAveragePooling2D()(base_model.output)
+    return Model(inputs=base_model.input, outputs=build_head(x)), base_model
+
+
+def embed_dataset(store, backbone, data_dir, batch_size):
+    """Return cached ``(features, one-hot labels)`` for a split, embedding only unseen images."""
+    paths, labels = list_images(data_dir)
+    hashes = [file_sha256(path) for path in paths]
+    missing = [i for i, sha in enumerate(hashes) if sha not in store]
+    if missing:
+        start = time.perf_counter()
+        for offset in range(0, len(missing), EMBED_CHUNK_SIZE):
+            chunk = missing[offset : offset + EMBED_CHUNK_SIZE]
+            ds = tf.data.Dataset.from_tensor_slices([paths[i] for i in chunk])
+            ds = ds.map(load_image, num_parallel_calls=AUTOTUNE).batch(batch_size).prefetch(AUTOTUNE)
+            store.add([hashes[i] for i in chunk], backbone.predict(ds, verbose=0))
+        elapsed = time.perf_counter() - start
+        print(f"Embedded {len(missing)} new images from {data_dir} in {elapsed:.1f}s")
+    print(f"{len(paths) - len(missing)} of {len(paths)} embeddings reused from the cache")
+    return store.get(hashes), tf.one_hot(labels, len(CLASS_NAMES)).numpy()
+
+
+def train_head_on_features(args, train_dir, val_dir, timer):
+    """Fit the Dense head on cached pooled features, then graft it onto a full model."""
+    backbone = MobileNetV2(weights="imagenet", include_top=False, pooling="avg", input_shape=IMG_SIZE + (3,))
+    store = EmbeddingStore(args.embedding_dir, dim=backbone.output_shape[-1])
+    train_x, train_y = embed_dataset(store, backbone, train_dir, args.batch_size)
+    val_x, val_y = embed_dataset(store, backbone, val_dir, args.batch_size)
+
+    features = layers.Input(shape=(train_x.shape[1],))
+    head = Model(inputs=features, outputs=build_head(features))
+    head.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
+    history = head.fit(
+        train_x, train_y, batch_size=args.batch_size, validation_data=(val_x, val_y), epochs=args.epochs, callbacks=[timer]
     )
-except Exception as e:
-    print(f"Error during fine-tuning: {e}")
-
-# Save the model
-try:
-    model.save(r"E:\YashAgarwal\Projects\Garbage-DetectionCopy\backend\model_deep.keras")
-    print("Model saved successfully.")
-except Exception as e:
-    print(f"Error saving model: {e}")
-
-# Function to plot accuracy and loss graphs
-def plot_training_history(history, fine_tune_history):
-    """
-    Plots training & validation accuracy and loss.
-    Args:
-        history: History object from initial training.
-        fine_tune_history: History object from fine-tuning.
-    """
-    acc = history.history["accuracy"] + fine_tune_history.history["accuracy"]
-    val_acc = history.history["val_accuracy"] + fine_tune_history.history["val_accuracy"]
-    loss = history.history["loss"] + fine_tune_history.history["loss"]
-    val_loss = history.history["val_loss"] + fine_tune_history.history["val_loss"]
 
+    # pooling="avg" is the same GlobalAveragePooling2D the full model uses, so the head drops straight in
+    model, base_model = build_model()
+    for name in ("head_dense", "head_output"):
+        model.get_layer(name).set_weights(head.get_layer(name).get_weights())
+    return model, base_model, history
+
+
+def plot_training_history(history, fine_tune_history, path):
+    """Save training & validation accuracy and loss curves to ``path``."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fine = fine_tune_history.history if fine_tune_history else {}
+    acc = history.history["accuracy"] + fine.get("accuracy", [])
+    val_acc = history.history["val_accuracy"] + fine.get("val_accuracy", [])
+    loss = history.history["loss"] + fine.get("loss", [])
+    val_loss = history.history["val_loss"] + fine.get("val_loss", [])
     epochs_range = range(len(acc))
 
     plt.figure(figsize=(12, 5))
-
-    # Accuracy plot
     plt.subplot(1, 2, 1)
     plt.plot(epochs_range, acc, label="Training Accuracy")
     plt.plot(epochs_range, val_acc, label="Validation Accuracy")
@@ -130,7 +185,6 @@ def plot_training_history(history, fine_tune_history):
     plt.ylabel("Accuracy")
     plt.title("Training and Validation Accuracy")
 
-    # Loss plot
     plt.subplot(1, 2, 2)
     plt.plot(epochs_range, loss, label="Training Loss")
     plt.plot(epochs_range, val_loss, label="Validation Loss")
@@ -138,8 +192,82 @@ def plot_training_history(history, fine_tune_history):
     plt.xlabel("Epochs")
     plt.ylabel("Loss")
     plt.title("Training and Validation Loss")
+    plt.savefig(path)
+    print(f"Saved training curves to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--mode", choices=["full", "features"], default="full", help="features: train the head on cached embeddings"
+    )
+    parser.add_argument("--embedding-dir", default=os.path.join(BACKEND_DIR, "extras", "embedding_cache"))
+    parser.add_argument("--data-dir", default=os.path.join(BACKEND_DIR, "extras", "dataset"))
+    parser.add_argument("--output", default=os.path.join(BACKEND_DIR, "model_deep.keras"))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument(
+        "--fine-tune-epochs", type=int, help="full-model epochs after the head; default 5, or 0 with --mode features"
+    )
+    parser.add_argument("--fine-tune-from", type=int, default=100, help="first base-model layer to unfreeze")
+    parser.add_argument("--cache", default="", help="file prefix for an on-disk cache; memory when empty")
+    parser.add_argument("--mixed-precision", choices=["auto", "off", "float16", "bfloat16"], default="auto")
+    parser.add_argument("--plot", help="save accuracy/loss curves to this image file")
+    args = parser.parse_args()
+    if args.fine_tune_epochs is None:
+        args.fine_tune_epochs = 0 if args.mode == "features" else 5
+
+    train_dir = os.path.join(args.data_dir, "train")
+    val_dir = os.path.join(args.data_dir, "val")
+    if not os.path.exists(train_dir) or not os.path.exists(val_dir):
+        raise FileNotFoundError(f"Dataset folders not found! Ensure '{train_dir}' and '{val_dir}' exist.")
+
+    # Built before the precision policy is set, so augmentation stays float32 inside tf.data
+    augmentation = build_augmentation()
+    configure_mixed_precision(args.mixed_precision)
+    if args.mode == "full" or args.fine_tune_epochs > 0:
+        train_cache = f"{args.cache}_train" if args.cache else ""
+        val_cache = f"{args.cache}_val" if args.cache else ""
+        train_ds, num_train = make_dataset(train_dir, args.batch_size, train_cache, augmentation=augmentation)
+        val_ds, num_val = make_dataset(val_dir, args.batch_size, val_cache)
+    else:
+        # Only the embeddings are read; no image pipeline is needed
+        num_train, num_val = len(list_images(train_dir)[0]), len(list_images(val_dir)[0])
+    print(f"{num_train} training images, {num_val} validation images")
+
+    timer = EpochTimer(num_train)
+    start = time.perf_counter()
+    if args.mode == "features":
+        model, base_model, history = train_head_on_features(args, train_dir, val_dir, timer)
+    else:
+        model, base_model = build_model()
+        model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"])
+        history = model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=[timer])
+
+    # Fine-tuning: unfreeze the top of the base model and recompile with a lower learning rate
+    history_fine = None
+    if args.fine_tune_epochs > 0:
+        base_model.trainable = True
+        for layer in base_model.layers[: args.fine_tune_from]:
+            layer.trainable = False
+        model.compile(
+            optimizer=tf.keras.optimizers.Adam(learning_rate=1e-5),
+            loss="categorical_crossentropy",
+            metrics=["accuracy"],
+        )
+        history_fine = model.fit(train_ds, validation_data=val_ds, epochs=args.fine_tune_epochs, callbacks=[timer])
+
+    total = time.perf_counter() - start
+    first, rest = timer.times[0], timer.times[1:]
+    print(f"\nTrained in {total:.1f}s; first epoch {first:.1f}s", end="")
+    print(f", later epochs {sum(rest) / len(rest):.1f}s on average" if rest else "")
+
+    model.save(args.output)
+    print(f"Model saved to {args.output}")
+
+    if args.plot:
+        plot_training_history(history, history_fine, args.plot)
 
-    plt.show()
 
-# Plot the training graphs
-plot_training_history(history, history_fine)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Score image directories offline with the server's model and preprocessing.
+
+Usage (from backend/): python extras/score_images.py [paths ...] [--output scores.csv|scores.parquet] [--mongo]
+Images are decoded on a thread or process pool and prefetched a few
+batches ahead of the model. Finished paths are appended to a checkpoint
+file, so an interrupted run picks up where it stopped when started again
+with the same arguments. Defaults to re-scoring uploads/.
+"""
+import argparse
+import csv
+import hashlib
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from derivatives import DERIVATIVE_SIZES  # noqa: E402
+from preprocessing import BatchBuffer, decode_image, image_to_array  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+FIELDS = ["path", "sha256", "prediction", "confidence", "garbage_probability", "runtime", "scored_at", "error"]
+
+
+def find_images(roots):
+    """Every original image under ``roots`` in a stable order; derivatives are skipped."""
+    suffixes = tuple(f"_{name}" for name in DERIVATIVE_SIZES)
+    paths = []
+    for root in roots:
+        if os.path.isfile(root):
+            paths.append(root)
+            continue
+        for directory, _, files in os.walk(root):
+            for name in files:
+                stem, ext = os.path.splitext(name)
+                if ext.lower() in IMAGE_EXTENSIONS and not stem.endswith(suffixes):
+                    paths.append(os.path.join(directory, name))
+    return sorted(paths)
+
+
+def load_image(path):
+    """Read, hash and decode one image to a ``(H, W, 3)`` uint8 array (runs in the decode pool)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), image_to_array(decode_image(data))[0]
+
+
+def prefetch(paths, pool, batch_size, depth):
+    """Yield ``(paths, futures)`` per batch while up to ``depth`` more batches decode in the background."""
+    batches = queue.Queue(maxsize=depth)
+
+    def produce():
+        for start in range(0, len(paths), batch_size):
+            chunk = paths[start : start + batch_size]
+            batches.put((chunk, [pool.submit(load_image, path) for path in chunk]))
+        batches.put(None)
+
+    threading.Thread(target=produce, name="prefetch", daemon=True).start()
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        yield batch
+
+
+class Checkpoint:
+    """Append-only list of finished paths; flushed after every batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, paths):
+        self._file.writelines(f"{path}\n" for path in paths)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class CSVSink:
+    def __init__(self, path):
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if not exists:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetSink:
+    """Writes one row group per batch. A resumed run writes a new ``.partN`` file next to the first."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow: pip install pyarrow")
+        stem, ext = os.path.splitext(path)
+        part = 1
+        while os.path.exists(path):
+            path = f"{stem}.part{part}{ext}"
+            part += 1
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                ("path", pa.string()),
+                ("sha256", pa.string()),
+                ("prediction", pa.string()),
+                ("confidence", pa.float32()),
+                ("garbage_probability", pa.float32()),
+                ("runtime", pa.string()),
+                ("scored_at", pa.string()),
+                ("error", pa.string()),
+            ]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class MongoSink:
+    """Upserts scores into a collection keyed by path; optionally rewrites matching detections.
+
+    Rewritten detections get ``model_version`` too. Their ``image_hashes``
+    entry follows, the analytics rollups move with them, and each change
+    is logged to the change feed so running servers broadcast it.
+    """
+
+    def __init__(self, collection_name, update_detections, model_version=None):
+        from dotenv import load_dotenv
+        from pymongo import MongoClient, UpdateOne
+
+        load_dotenv(os.path.join(BACKEND_DIR, ".env"))
+        self._UpdateOne = UpdateOne
+        self.db = MongoClient(os.getenv("MONGO_URI"))["garbage_detection"]
+        self.collection = self.db[collection_name]
+        self.update_detections = update_detections
+        self.model_version = model_version
+        if update_detections:
+            from analytics import AnalyticsRollups
+            from changefeed import ChangeFeed
+
+            self.analytics = AnalyticsRollups(
+                self.db.detections,
+                self.db.detection_rollups,
+                cell_precision=int(os.getenv("ANALYTICS_CELL_PRECISION", "5")),
+            )
+            self.change_feed = ChangeFeed(self.db, "detections", None, mode=os.getenv("CHANGE_FEED_MODE", "auto"))
+
+    def write(self, rows):
+        scored = [row for row in rows if not row["error"]]
+        if not scored:
+            return
+        self.collection.bulk_write(
+            [self._UpdateOne({"_id": row["path"]}, {"$set": row}, upsert=True) for row in scored], ordered=False
+        )
+        if self.update_detections:
+            self._rewrite_detections(
+                {
+                    row["sha256"]: {
+                        "prediction": row["prediction"],
+                        "confidence": row["confidence"],
+                        "model_version": self.model_version,
+                    }
+                    for row in scored
+                }
+            )
+
+    def _rewrite_detections(self, updates):
+        """Apply ``{sha256: fields}`` to every detection and cached score of those images."""
+        from changefeed import UPSERT
+
+        changes = [
+            (before, {**before, **updates[before["sha256"]]})
+            for before in self.db.detections.find({"sha256": {"$in": list(updates)}})
+        ]
+        if changes:
+            self.db.detections.bulk_write(
+                [self._UpdateOne({"_id": before["_id"]}, {"$set": updates[before["sha256"]]}) for before, _ in changes],
+                ordered=False,
+            )
+            self.analytics.apply_many(changes)
+            self.change_feed.record_many(UPSERT, [before["_id"] for before, _ in changes])
+        # Only images the server has already cached; a new entry needs a detection to point at
+        self.db.image_hashes.bulk_write(
+            [self._UpdateOne({"_id": sha256}, {"$set": fields}) for sha256, fields in updates.items()], ordered=False
+        )
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", default=[os.path.join(BACKEND_DIR, "uploads")])
+    parser.add_argument("--runtime", default=os.getenv("INFERENCE_RUNTIME", "keras"))
+    parser.add_argument("--model-path", default=os.path.join(BACKEND_DIR, "model_deep.keras"))
+    parser.add_argument("--tflite-path", default=os.path.join(BACKEND_DIR, "model_deep_int8.tflite"))
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--decode-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--prefetch", type=int, default=4, help="batches decoded ahead of the model")
+    parser.add_argument("--output", help="results file, .csv or .parquet")
+    parser.add_argument("--mongo", action="store_true", help="upsert results into MongoDB")
+    parser.add_argument("--mongo-collection", default="image_scores")
+    parser.add_argument("--update-detections", action="store_true", help="also overwrite predictions on detections")
+    parser.add_argument("--model-version", help="registry version recorded on updated detections")
+    parser.add_argument("--checkpoint", help="defaults to <output>.checkpoint or score_images.checkpoint")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--report-every", type=int, default=10, help="batches between progress lines")
+    args = parser.parse_args()
+
+    if not args.output and not args.mongo:
+        parser.error("choose --output and/or --mongo")
+    if args.update_detections and not args.model_version:
+        parser.error("--update-detections needs --model-version")
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.output or 'score_images'}.checkpoint")
+    paths = [path for path in find_images(args.paths) if path not in checkpoint.done][: args.limit]
+    print(f"{len(paths)} images to score ({len(checkpoint.done)} already done)")
+    if not paths:
+        return
+
+    sinks = []
+    if args.output:
+        sinks.append(ParquetSink(args.output) if args.output.endswith(".parquet") else CSVSink(args.output))
+    if args.mongo:
+        sinks.append(MongoSink(args.mongo_collection, args.update_detections, args.model_version))
+
+    # Start the decode pool before TensorFlow is imported; processes are spawned, never forked
+    if args.decode_mode == "process":
+        pool = ProcessPoolExecutor(args.decode_workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(args.decode_workers, thread_name_prefix="decode")
+
+    from runtimes import load_runtime
+
+    runtime = load_runtime(args.runtime, model_path=args.model_path, tflite_path=args.tflite_path)
+    batch_buffer = BatchBuffer(args.batch_size)
+
+    scored = failed = 0
+    wait_time = predict_time = 0.0
+    start = time.perf_counter()
+    try:
+        for batch_num, (chunk, futures) in enumerate(prefetch(paths, pool, args.batch_size, args.prefetch), 1):
+            scored_at = datetime.now(timezone.utc).isoformat()
+            rows, arrays = [], []
+            waited = time.perf_counter()
+            for path, future in zip(chunk, futures):
+                row = dict.fromkeys(FIELDS)
+                row.update(path=path, runtime=args.runtime, scored_at=scored_at)
+                try:
+                    row["sha256"], array = future.result()
+                    arrays.append(array[np.newaxis])
+                except Exception as e:
+                    row["error"] = str(e)
+                rows.append(row)
+            wait_time += time.perf_counter() - waited
+
+            if arrays:
+                predicted = time.perf_counter()
+                outputs = np.asarray(runtime.predict(batch_buffer.fill(arrays)))
+                predict_time += time.perf_counter() - predicted
+                for row, output in zip((r for r in rows if not r["error"]), outputs):
+                    class_idx = int(np.argmax(output))
+                    row["prediction"] = "Garbage" if class_idx == 1 else "Clean"
+                    row["confidence"] = float(output[class_idx])
+                    row["garbage_probability"] = float(output[1])
+
+            for sink in sinks:
+                sink.write(rows)
+            checkpoint.record(chunk)
+            scored += len(arrays)
+            failed += len(rows) - len(arrays)
+
+            if batch_num % args.report_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"{scored + failed}/{len(paths)} images  {(scored + failed) / elapsed:8.1f} images/s")
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume from the checkpoint")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        for sink in sinks:
+            sink.close()
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\nscored {scored}, failed {failed} in {elapsed:.1f}s")
+    print(f"throughput       {(scored + failed) / elapsed:8.1f} images/s")
+    print(f"waiting on decode {wait_time:7.1f}s   model {predict_time:7.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Load-test the room-scoped Socket.IO fan-out with thousands of simulated dashboards.
+
+Usage (from backend/): python extras/socket_load_test.py [--url http://localhost:5000] [--clients 2000] [--uploads-per-second 5]
+Clients connect at --connect-rate and each watches --cells-per-client
+region cells around --lat/--lon; --admins of them connect with the access
+token of an admin user (--admin-token) and receive everything. Uploads with fresh
+random images land in the same area, and every detections_changed
+message is timed from the server's emitted_at to arrival. Messages with
+detections outside a client's cells are counted as misrouted.
+Needs python-socketio[asyncio_client] and aiohttp; raise the open-file
+limit (ulimit -n) for more than ~1000 clients.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+from geocache import geohash_encode  # noqa: E402
+
+try:
+    import aiohttp
+    import socketio
+except ImportError:
+    sys.exit("The load test needs python-socketio[asyncio_client] and aiohttp: pip install 'python-socketio[asyncio_client]'")
+
+
+class Stats:
+    def __init__(self):
+        self.connect_seconds = []
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.messages = 0
+        self.changes = 0
+        self.misrouted = 0
+        self.latencies = []
+        self.uploads = {}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def random_point(args):
+    return (
+        args.lat + random.uniform(-args.spread, args.spread),
+        args.lon + random.uniform(-args.spread, args.spread),
+    )
+
+
+def random_image():
+    # Fresh pixels every time, so the server's duplicate detection never short-circuits an upload
+    pixels = np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+async def run_client(args, cells, admin, stats, stop):
+    sio = socketio.AsyncClient(reconnection=False)
+
+    @sio.on("detections_changed")
+    async def on_changes(batch):
+        stats.latencies.append(time.time() - batch["emitted_at"])
+        stats.messages += 1
+        stats.changes += len(batch["changes"])
+        if admin:
+            return
+        for change in batch["changes"]:
+            if change["op"] == "upsert":
+                detection = change["detection"]
+                if geohash_encode(detection["latitude"], detection["longitude"], args.precision) not in cells:
+                    stats.misrouted += 1
+
+    @sio.on("disconnect")
+    async def on_disconnect():
+        if not stop.is_set():
+            stats.disconnects += 1
+
+    auth = {"regions": sorted(cells)}
+    if admin:
+        auth["token"] = args.admin_token
+    start = time.perf_counter()
+    try:
+        await sio.connect(args.url, auth=auth, transports=["websocket"], wait_timeout=args.timeout)
+    except Exception:
+        stats.connect_failures += 1
+        return
+    stats.connect_seconds.append(time.perf_counter() - start)
+    await stop.wait()
+    await sio.disconnect()
+
+
+async def upload_loop(args, stats, stop):
+    async with aiohttp.ClientSession() as session:
+        while not stop.is_set():
+            lat, lon = random_point(args)
+            form = aiohttp.FormData()
+            form.add_field("image", random_image(), filename="load.jpg", content_type="image/jpeg")
+            form.add_field("latitude", str(lat))
+            form.add_field("longitude", str(lon))
+            try:
+                async with session.post(f"{args.url}/upload", data=form) as response:
+                    stats.uploads[response.status] = stats.uploads.get(response.status, 0) + 1
+            except aiohttp.ClientError as e:
+                stats.uploads[type(e).__name__] = stats.uploads.get(type(e).__name__, 0) + 1
+            await asyncio.sleep(1 / args.uploads_per_second)
+
+
+async def run(args):
+    stats = Stats()
+    stop = asyncio.Event()
+    clients = []
+    start = time.perf_counter()
+    for i in range(args.clients):
+        admin = i < args.admins
+        cells = {geohash_encode(*random_point(args), args.precision) for _ in range(args.cells_per_client)}
+        clients.append(asyncio.create_task(run_client(args, cells, admin, stats, stop)))
+        await asyncio.sleep(1 / args.connect_rate)
+    ramp = time.perf_counter() - start
+    await asyncio.sleep(min(args.timeout, 5))
+    print(f"{len(stats.connect_seconds)} of {args.clients} clients connected in {ramp:.1f}s")
+
+    uploader = asyncio.create_task(upload_loop(args, stats, stop)) if args.uploads_per_second > 0 else None
+    await asyncio.sleep(args.duration)
+    stop.set()
+    if uploader:
+        await uploader
+    await asyncio.gather(*clients, return_exceptions=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--admins", type=int, default=10, help="clients connecting with --admin-token")
+    parser.add_argument("--admin-token", help="access token of a user with the admin role (from /api/login)")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="new connections per second")
+    parser.add_argument("--cells-per-client", type=int, default=1)
+    parser.add_argument("--precision", type=int, default=int(os.getenv("SOCKETIO_REGION_PRECISION", "5")))
+    parser.add_argument("--lat", type=float, default=12.97)
+    parser.add_argument("--lon", type=float, default=77.59)
+    parser.add_argument("--spread", type=float, default=0.15, help="degrees around --lat/--lon")
+    parser.add_argument("--uploads-per-second", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of uploads after the ramp")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+    if args.admins and not args.admin_token:
+        args.admins = 0
+
+    stats = asyncio.run(run(args))
+    connected = len(stats.connect_seconds)
+    print(f"Connect: {connected} ok, {stats.connect_failures} failed, {stats.disconnects} dropped early")
+    print(f"Connect latency: p50 {percentile(stats.connect_seconds, 50):.1f}ms, p99 {percentile(stats.connect_seconds, 99):.1f}ms")
+    print(f"Uploads: {stats.uploads}")
+    print(f"Messages: {stats.messages} carrying {stats.changes} changes, {stats.misrouted} misrouted")
+    print(
+        f"Fan-out latency: p50 {percentile(stats.latencies, 50):.1f}ms, "
+        f"p95 {percentile(stats.latencies, 95):.1f}ms, p99 {percentile(stats.latencies, 99):.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import secrets
 
-# Generate a 32-byte (256-bit) secret key
+# Generate a 32-byte (256-bit) secret key for signing session tokens; put it in .env as JWT_SECRET_KEY
 jwt_secret_key = secrets.token_urlsafe(32)
-print(jwt_secret_key)
\ No newline at end of file
+print(f"JWT_SECRET_KEY={jwt_secret_key}")
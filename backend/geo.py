@@ -0,0 +1,157 @@
+import logging
+import math
+import os
+
+from pymongo import GEOSPHERE, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6378100.0
+MAX_RADIUS_METERS = 50000.0
+MAX_CLUSTERS = 500
+
+# Approximate pixel size of one cluster cell on a 256px web-mercator tile
+CLUSTER_CELL_PIXELS = 60
+
+
+def geojson_point(lat, lon):
+    """Build a GeoJSON point (GeoJSON orders coordinates as lon, lat)."""
+    return {"type": "Point", "coordinates": [lon, lat]}
+
+
+def valid_coordinates(lat, lon):
+    """Check that a coordinate pair is storable in a 2dsphere index."""
+    return -90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0
+
+
+def haversine_meters(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two coordinates in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(a))
+
+
+def ensure_geo_index(collection):
+    """Create the 2dsphere index on the detection ``location`` field."""
+    collection.create_index([("location", GEOSPHERE)], name="location_2dsphere")
+
+
+def bbox_query(min_lon, min_lat, max_lon, max_lat):
+    """Filter selecting points inside a viewport bounding box."""
+    ring = [
+        [min_lon, min_lat],
+        [max_lon, min_lat],
+        [max_lon, max_lat],
+        [min_lon, max_lat],
+        [min_lon, min_lat],
+    ]
+    return {"location": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}
+
+
+def radius_query(lat, lon, meters):
+    """Filter selecting points within ``meters`` of a coordinate, nearest first."""
+    return {
+        "location": {
+            "$nearSphere": {"$geometry": geojson_point(lat, lon), "$maxDistance": meters}
+        }
+    }
+
+
+def cluster_cell_size(zoom):
+    """Cluster cell edge in degrees for a web-map zoom level."""
+    zoom = max(0, min(int(zoom), 22))
+    return 360.0 / (256 * 2**zoom) * CLUSTER_CELL_PIXELS
+
+
+def cluster_pipeline(query, cell_size, max_clusters=MAX_CLUSTERS):
+    """Aggregation grouping detections into grid cells of ``cell_size`` degrees.
+
+    Returns at most ``max_clusters`` cells, largest first.
+    """
+    return [
+        {"$match": query},
+        {
+            "$group": {
+                "_id": {
+                    "x": {"$floor": {"$divide": ["$longitude", cell_size]}},
+                    "y": {"$floor": {"$divide": ["$latitude", cell_size]}},
+                },
+                "count": {"$sum": 1},
+                "latitude": {"$avg": "$latitude"},
+                "longitude": {"$avg": "$longitude"},
+                "pending": {"$sum": {"$cond": [{"$eq": ["$status", "pending"]}, 1, 0]}},
+                "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", "in_progress"]}, 1, 0]}},
+                "completed": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, 1, 0]}},
+                "detection_id": {"$first": "$_id"},
+            }
+        },
+        {"$sort": {"count": -1}},
+        {"$limit": max_clusters},
+    ]
+
+
+def format_cluster(cluster):
+    """Convert a cluster aggregation result into its API form.
+
+    Single-detection clusters keep the detection id so the map can render
+    them as regular markers.
+    """
+    result = {
+        "latitude": cluster["latitude"],
+        "longitude": cluster["longitude"],
+        "count": cluster["count"],
+        "status_counts": {
+            "pending": cluster["pending"],
+            "in_progress": cluster["in_progress"],
+            "completed": cluster["completed"],
+        },
+    }
+    if cluster["count"] == 1:
+        result["id"] = str(cluster["detection_id"])
+    return result
+
+
+def backfill_locations(collection, batch_size=1000):
+    """Add a GeoJSON ``location`` to detections that only have latitude/longitude.
+
+    Returns the number of documents updated.
+    """
+    cursor = collection.find(
+        {
+            "location": {"$exists": False},
+            "latitude": {"$type": "number"},
+            "longitude": {"$type": "number"},
+        },
+        {"latitude": 1, "longitude": 1},
+    ).batch_size(batch_size)
+
+    updated, skipped, ops = 0, 0, []
+    for doc in cursor:
+        lat, lon = doc["latitude"], doc["longitude"]
+        if not valid_coordinates(lat, lon) or math.isnan(lat) or math.isnan(lon):
+            skipped += 1
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"location": geojson_point(lat, lon)}}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+
+    if updated or skipped:
+        logger.info(f"✅ Backfilled location on {updated} detections ({skipped} skipped)")
+    return updated
+
+
+if __name__ == "__main__":
+    # The server runs this on startup; python geo.py runs it by hand
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    detections = MongoClient(os.getenv("MONGO_URI"))["garbage_detection"]["detections"]
+    backfill_locations(detections)
+    ensure_geo_index(detections)
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from repository import utc_now
+
+logger = logging.getLogger(__name__)
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Marks a cached upstream failure (a location lookup may legitimately be None)
+_NEGATIVE = object()
+
+
+def geohash_encode(lat, lon, precision=7):
+    """Encode a coordinate as a geohash string (precision 7 is a ~150m cell)."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch = ch << 1
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_GEOHASH_ALPHABET[ch])
+            bit, ch = 0, 0
+    return "".join(chars)
+
+
+class _InFlight:
+    __slots__ = ("event", "result")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ReverseGeocodeCache:
+    """Two-tier reverse-geocoding cache keyed by geohash cell.
+
+    Lookups go to an in-process LRU first, then the optional Mongo
+    ``collection``, and only then to ``lookup_fn(lat, lon)``. A ``None``
+    result from ``lookup_fn`` is treated as a failure and cached for
+    ``negative_ttl`` seconds in-process only. Concurrent misses on the same
+    cell wait for a single upstream call.
+    """
+
+    def __init__(
+        self,
+        lookup_fn,
+        precision=7,
+        max_entries=10000,
+        ttl=7 * 24 * 3600,
+        negative_ttl=60,
+        collection=None,
+    ):
+        self.lookup_fn = lookup_fn
+        self.precision = precision
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.collection = collection
+        self._entries = OrderedDict()  # cell -> (value, expires_at)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "persistent_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_calls": 0,
+            "upstream_failures": 0,
+            "evictions": 0,
+        }
+
+    def ensure_indexes(self):
+        if self.collection is not None:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    def _count(self, key):
+        # Caller holds self._lock
+        self.counters[key] += 1
+
+    def _get_local(self, cell):
+        entry = self._entries.get(cell)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[cell]
+            return None
+        self._entries.move_to_end(cell)
+        return entry
+
+    def _set_local(self, cell, value, ttl):
+        self._entries[cell] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._count("evictions")
+
+    def _get_persistent(self, cell):
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.find_one({"_id": cell})
+        except Exception as e:
+            logger.error(f"❌ Geocode cache read failed: {e}")
+            return None
+        # The TTL monitor only runs once a minute, so check expiry here too
+        if not doc or doc["expires_at"] <= utc_now():
+            return None
+        return doc["location_name"]
+
+    def _set_persistent(self, cell, value):
+        if self.collection is None:
+            return
+        try:
+            self.collection.replace_one(
+                {"_id": cell},
+                {
+                    "_id": cell,
+                    "location_name": value,
+                    "expires_at": utc_now() + timedelta(seconds=self.ttl),
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.error(f"❌ Geocode cache write failed: {e}")
+
+    def get(self, lat, lon, allow_negative=True):
+        """Return the location name for a coordinate, or None if the lookup failed.
+
+        With ``allow_negative=False`` a cached failure is ignored and the
+        upstream asked again, e.g. when retrying a lookup that failed.
+        """
+        cell = geohash_encode(lat, lon, self.precision)
+
+        with self._lock:
+            entry = self._get_local(cell)
+            if entry is not None:
+                value = entry[0]
+                if value is not _NEGATIVE:
+                    self._count("hits")
+                    return value
+                if allow_negative:
+                    self._count("negative_hits")
+                    return None
+                del self._entries[cell]
+
+            inflight = self._inflight.get(cell)
+            if inflight is not None:
+                self._count("coalesced")
+                leader = False
+            else:
+                inflight = self._inflight[cell] = _InFlight()
+                leader = True
+
+        if not leader:
+            inflight.event.wait()
+            return inflight.result
+
+        try:
+            value = self._get_persistent(cell)
+            if value is not None:
+                with self._lock:
+                    self._count("persistent_hits")
+                    self._set_local(cell, value, self.ttl)
+            else:
+                with self._lock:
+                    self._count("misses")
+                    self._count("upstream_calls")
+                try:
+                    value = self.lookup_fn(lat, lon)
+                except Exception as e:
+                    logger.error(f"❌ Location lookup failed: {e}")
+                    value = None
+                with self._lock:
+                    if value is None:
+                        self._count("upstream_failures")
+                        self._set_local(cell, _NEGATIVE, self.negative_ttl)
+                    else:
+                        self._set_local(cell, value, self.ttl)
+                if value is not None:
+                    self._set_persistent(cell, value)
+            inflight.result = value
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(cell, None)
+            inflight.event.set()
+
+    def invalidate(self, lat=None, lon=None):
+        """Drop one cell, or the whole in-process tier when no coordinate is given."""
+        with self._lock:
+            if lat is None or lon is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(geohash_encode(lat, lon, self.precision), None)
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["persistent_hits"] + counters["misses"]
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "precision": self.precision,
+            "hit_ratio": ((lookups - counters["misses"]) / lookups) if lookups else 0.0,
+            **counters,
+        }
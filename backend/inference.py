@@ -0,0 +1,189 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets (the last bucket catches everything above)
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class Overloaded(RuntimeError):
+    """Inference capacity is exhausted; the request should be retried later."""
+
+
+class EngineStopped(Overloaded):
+    """The engine was drained (e.g. its model was swapped out) and takes no new requests."""
+
+
+class _Request:
+    __slots__ = ("array", "future", "enqueued_at")
+
+    def __init__(self, array):
+        self.array = array
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchInferenceEngine:
+    """Collect concurrent prediction requests into batches and run one forward pass per batch.
+
+    ``predict_fn`` receives a stacked ``(N, ...)`` array and must return one row
+    of output per input row. Each caller gets back only its own row. When a
+    ``batch_buffer`` is given, inputs are written into it instead of being
+    concatenated into a fresh array for every batch. ``dispatch_threads``
+    greater than one keeps several batches in flight, for a ``predict_fn``
+    that fans out to a worker pool. ``drain`` stops new submissions and
+    lets everything already queued finish before the threads exit.
+    """
+
+    def __init__(
+        self,
+        predict_fn,
+        max_batch_size=16,
+        max_wait_ms=10.0,
+        max_queue_size=1024,
+        batch_buffer=None,
+        dispatch_threads=1,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if batch_buffer is not None and dispatch_threads > 1:
+            raise ValueError("A shared batch_buffer requires a single dispatch thread")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_buffer = batch_buffer
+        self.dispatch_threads = dispatch_threads
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._running = threading.Event()
+        self._accepting = True
+        self._accept_lock = threading.Lock()
+
+        self.batch_sizes = Histogram("inference_batch_size", "Requests per model batch", buckets=HISTOGRAM_BUCKETS)
+        self.queue_depths = Histogram("inference_queue_depth", "Queue depth on submit", buckets=HISTOGRAM_BUCKETS)
+        self.batches_run = 0
+        self.requests_served = 0
+        self.failed_batches = 0
+
+    def start(self):
+        """Start the background batching threads."""
+        if self._running.is_set():
+            return
+        self._running.set()
+        for i in range(self.dispatch_threads):
+            thread = threading.Thread(target=self._run, name=f"batch-inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(
+            f"✅ Inference engine started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f}, dispatch_threads={self.dispatch_threads})"
+        )
+
+    def drain(self, timeout=30.0):
+        """Refuse new requests, wait for queued and running batches to finish, then stop."""
+        with self._accept_lock:
+            self._accepting = False
+        deadline = time.perf_counter() + timeout
+        # unfinished_tasks counts requests that are queued or in a running batch
+        while self._queue.unfinished_tasks:
+            if time.perf_counter() > deadline:
+                logger.warning(f"⚠️ Inference engine drain timed out with {self._queue.qsize()} queued")
+                break
+            time.sleep(0.01)
+        self.stop()
+
+    def stop(self, timeout=5.0):
+        """Stop the batching threads after their current batches finish."""
+        self._running.clear()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, img_array):
+        """Queue a single-image ``(1, ...)`` array and return a Future for its output row."""
+        request = _Request(img_array)
+        with self._accept_lock:
+            if not self._accepting:
+                raise EngineStopped("Inference engine is draining")
+            try:
+                self._queue.put_nowait(request)
+            except queue.Full:
+                raise Overloaded("Inference queue is full")
+        self.queue_depths.observe(self._queue.qsize())
+        return request.future
+
+    def predict(self, img_array, timeout=30.0):
+        """Blocking helper: submit and wait for this request's output row."""
+        return self.submit(img_array).result(timeout=timeout)
+
+    def _collect_batch(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _run_batch(self, batch):
+        self.batch_sizes.observe(len(batch))
+        try:
+            arrays = [r.array for r in batch]
+            if self.batch_buffer is not None:
+                inputs = self.batch_buffer.fill(arrays)
+            else:
+                inputs = np.concatenate(arrays, axis=0)
+            outputs = np.asarray(self.predict_fn(inputs))
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"❌ Batch inference failed: {e}")
+            for r in batch:
+                r.future.set_exception(e)
+            return
+
+        for i, r in enumerate(batch):
+            r.future.set_result(outputs[i])
+        self.batches_run += 1
+        self.requests_served += len(batch)
+
+    def stats(self):
+        """Return queue depth and batch-size histograms."""
+        return {
+            "running": any(thread.is_alive() for thread in self._threads),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "batches_run": self.batches_run,
+            "requests_served": self.requests_served,
+            "failed_batches": self.failed_batches,
+            "batch_size_histogram": self.batch_sizes.snapshot(),
+            "queue_depth_histogram": self.queue_depths.snapshot(),
+        }
@@ -0,0 +1,51 @@
+"""Entry point of an inference worker process.
+
+Workers are spawned with this module as their main module, so a child
+imports only numpy, ``preprocessing`` and the runtime it loads, not the
+script that started the pool (for ``python server.py``, the whole app).
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def worker_main(
+    worker_id, runtime_name, runtime_kwargs, layout, in_name, out_name, tasks, results, threads, warmup_batch_sizes
+):
+    """Worker process: load a runtime, warm it up and score batches handed over in shared memory."""
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    from preprocessing import BatchBuffer
+    from runtimes import load_runtime
+
+    slots, max_batch, height, width, channels, num_outputs = layout
+    # Spawned workers share the parent's resource tracker; the parent owns and unlinks the segments
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    inputs = np.ndarray((slots, max_batch, height, width, channels), dtype=np.uint8, buffer=in_shm.buf)
+    outputs = np.ndarray((slots, max_batch, num_outputs), dtype=np.float32, buffer=out_shm.buf)
+
+    runtime = load_runtime(runtime_name, **runtime_kwargs)
+    batch_buffer = BatchBuffer(max_batch, size=(width, height), channels=channels)
+    blank = np.zeros((1, height, width, channels), dtype=np.uint8)
+    for n in warmup_batch_sizes:
+        runtime.predict(batch_buffer.fill([blank] * n))
+    results.put(("ready", worker_id, None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        slot, n, task_id = task
+        try:
+            batch = batch_buffer.fill([inputs[slot, i : i + 1] for i in range(n)])
+            outputs[slot, :n] = runtime.predict(batch)
+            results.put(("done", worker_id, task_id, None))
+        except Exception as e:
+            results.put(("done", worker_id, task_id, repr(e)))
+
+    in_shm.close()
+    out_shm.close()
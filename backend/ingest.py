@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import logging
+import posixpath
+import tarfile
+import zipfile
+
+from uploads import MAX_UPLOAD_BYTES, UploadTooLarge, read_upload
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ITEMS = 500
+ZIP_MAGIC = b"PK\x03\x04"
+
+
+class ManifestError(ValueError):
+    """The batch manifest could not be parsed."""
+
+
+class BatchItem:
+    """One image of a batch upload, or the reason it could not be read."""
+
+    __slots__ = ("index", "filename", "data", "error")
+
+    def __init__(self, index, filename, data=None, error=None):
+        self.index = index
+        self.filename = filename
+        self.data = data
+        self.error = error
+
+
+def _coordinates(entry):
+    if isinstance(entry, (list, tuple)) and len(entry) == 2:
+        return float(entry[0]), float(entry[1])
+    return float(entry["latitude"]), float(entry["longitude"])
+
+
+def parse_manifest(text):
+    """Parse a per-image coordinate manifest into ``{filename: (lat, lon)}``.
+
+    Accepts JSON, either a list of ``{"filename", "latitude", "longitude"}``
+    objects or an object mapping filenames to ``{"latitude", "longitude"}``
+    or ``[lat, lon]``, or CSV with a ``filename,latitude,longitude`` header.
+    """
+    text = text.strip()
+    if not text:
+        raise ManifestError("Manifest is empty")
+    try:
+        if text[0] in "[{":
+            data = json.loads(text)
+            if isinstance(data, dict):
+                return {name: _coordinates(entry) for name, entry in data.items()}
+            return {entry["filename"]: _coordinates(entry) for entry in data}
+        return {row["filename"]: _coordinates(row) for row in csv.DictReader(io.StringIO(text))}
+    except (KeyError, TypeError, ValueError) as e:
+        raise ManifestError(f"Invalid manifest: {e}") from e
+
+
+def lookup_coordinates(manifest, filename):
+    """Find an image's coordinates by its full archive path, then by its base name."""
+    if filename in manifest:
+        return manifest[filename]
+    return manifest.get(posixpath.basename(filename))
+
+
+def _skip(name):
+    base = posixpath.basename(name)
+    return not base or base.startswith(".") or name.startswith("__MACOSX/")
+
+
+def iter_files(files, max_bytes=MAX_UPLOAD_BYTES, max_items=MAX_BATCH_ITEMS):
+    """Yield a BatchItem for each uploaded multipart file."""
+    for index, file in enumerate(files):
+        if index >= max_items:
+            yield BatchItem(index, file.filename, error=f"Batch limit of {max_items} images exceeded")
+            continue
+        try:
+            buffer, _ = read_upload(file.stream, max_bytes)
+        except UploadTooLarge as e:
+            yield BatchItem(index, file.filename, error=str(e))
+            continue
+        yield BatchItem(index, file.filename, buffer.getvalue())
+
+
+def _iter_zip(stream, max_bytes, max_items):
+    with zipfile.ZipFile(stream) as archive:
+        members = [info for info in archive.infolist() if not info.is_dir() and not _skip(info.filename)]
+        for index, info in enumerate(members):
+            if index >= max_items:
+                yield BatchItem(index, info.filename, error=f"Batch limit of {max_items} images exceeded")
+                continue
+            if info.file_size > max_bytes:
+                yield BatchItem(index, info.filename, error="File size exceeds the maximum limit")
+                continue
+            with archive.open(info) as member:
+                # Never trust the header size alone
+                data = member.read(max_bytes + 1)
+            if len(data) > max_bytes:
+                yield BatchItem(index, info.filename, error="File size exceeds the maximum limit")
+                continue
+            yield BatchItem(index, info.filename, data)
+
+
+def _iter_tar(stream, max_bytes, max_items):
+    # Stream mode reads members in order without seeking back through the archive
+    with tarfile.open(fileobj=stream, mode="r|*") as archive:
+        index = 0
+        for member in archive:
+            if not member.isfile() or _skip(member.name):
+                continue
+            if index >= max_items:
+                yield BatchItem(index, member.name, error=f"Batch limit of {max_items} images exceeded")
+            elif member.size > max_bytes:
+                yield BatchItem(index, member.name, error="File size exceeds the maximum limit")
+            else:
+                yield BatchItem(index, member.name, archive.extractfile(member).read())
+            index += 1
+
+
+def iter_archive(stream, max_bytes=MAX_UPLOAD_BYTES, max_items=MAX_BATCH_ITEMS):
+    """Yield a BatchItem per image in a zip or (optionally compressed) tar archive.
+
+    Members are read one at a time, so only the current image is held in
+    memory. Directories, dotfiles and ``__MACOSX`` entries are skipped.
+    Raises ValueError if the archive is unreadable.
+    """
+    header = stream.read(4)
+    stream.seek(0)
+    try:
+        if header == ZIP_MAGIC:
+            yield from _iter_zip(stream, max_bytes, max_items)
+        else:
+            yield from _iter_tar(stream, max_bytes, max_items)
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ValueError(f"Unreadable archive: {e}") from e
+
+
+def chunked(items, size):
+    """Group an iterable into lists of at most ``size`` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,154 @@
+import logging
+import queue
+import random
+import threading
+
+from repository import utc_now
+
+logger = logging.getLogger(__name__)
+
+_current = threading.local()
+
+
+def current_attempt():
+    """Attempt number (1 for the first run) of the job running on this thread, or None outside a job."""
+    return getattr(_current, "attempt", None)
+
+
+class Job:
+    """A unit of background work with its retry bookkeeping."""
+
+    __slots__ = ("name", "fn", "args", "kwargs", "on_failure", "attempts", "created_at")
+
+    def __init__(self, name, fn, args=(), kwargs=None, on_failure=None):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.on_failure = on_failure
+        self.attempts = 0
+        self.created_at = utc_now()
+
+
+class JobPipeline:
+    """Bounded job queue drained by a pool of worker threads.
+
+    Failed jobs are retried with exponential backoff and jitter. Once
+    ``max_retries`` is exhausted, or a retry finds the queue full, the job
+    is handed to ``dead_letter`` (a callable taking the job and the final
+    error).
+    """
+
+    def __init__(
+        self,
+        num_workers=4,
+        max_queue_size=1000,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=30.0,
+        dead_letter=None,
+    ):
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dead_letter = dead_letter
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._workers = []
+        self._running = threading.Event()
+        self._lock = threading.Lock()
+        self.counters = {"enqueued": 0, "succeeded": 0, "retried": 0, "dead_lettered": 0, "rejected": 0}
+
+    def start(self):
+        """Spawn the worker threads."""
+        if self._running.is_set():
+            return
+        self._running.set()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"✅ Job pipeline started with {self.num_workers} workers")
+
+    def stop(self, timeout=5.0):
+        """Stop accepting work and wait for the workers to exit."""
+        self._running.clear()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def _count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def enqueue(self, name, fn, *args, on_failure=None, **kwargs):
+        """Queue ``fn(*args, **kwargs)``. Returns False if the queue is full.
+
+        ``on_failure(job, error)`` runs once the job has been dead-lettered.
+        """
+        return self._put(Job(name, fn, args, kwargs, on_failure))
+
+    def _put(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._count("rejected")
+            logger.error(f"❌ Job queue full, rejected job: {job.name}")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _requeue(self, job, error):
+        # A retry that no longer fits in the queue is dead-lettered rather than lost
+        if not self._put(job):
+            self._count("dead_lettered")
+            self._dead_letter(job, error)
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * (0.5 + random.random() / 2)
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                job = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            job.attempts += 1
+            _current.attempt = job.attempts
+            try:
+                job.fn(*job.args, **job.kwargs)
+                self._count("succeeded")
+            except Exception as e:
+                if job.attempts <= self.max_retries:
+                    delay = self._backoff(job.attempts)
+                    logger.warning(
+                        f"⚠️ Job {job.name} failed (attempt {job.attempts}), retrying in {delay:.2f}s: {e}"
+                    )
+                    self._count("retried")
+                    timer = threading.Timer(delay, self._requeue, args=(job, e))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    logger.error(f"❌ Job {job.name} failed after {job.attempts} attempts: {e}")
+                    self._count("dead_lettered")
+                    self._dead_letter(job, e)
+            finally:
+                _current.attempt = None
+                self._queue.task_done()
+
+    def _dead_letter(self, job, error):
+        for handler in (self.dead_letter, job.on_failure):
+            if not handler:
+                continue
+            try:
+                handler(job, error)
+            except Exception as e:
+                logger.error(f"❌ Failure handler failed for job {job.name}: {e}")
+
+    def stats(self):
+        """Return queue depth and job counters."""
+        with self._lock:
+            counters = dict(self.counters)
+        return {"queue_depth": self._queue.qsize(), "workers": len(self._workers), **counters}
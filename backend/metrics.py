@@ -0,0 +1,219 @@
+"""Prometheus text-format metrics and a stage-timing decorator that can be switched off at runtime."""
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached-upload fast path up to a slow Nominatim or SMTP call
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """A named family of samples keyed by label values.
+
+    ``collect`` computes the samples at scrape time instead: it returns a
+    number, or ``{label values tuple: number}`` for labelled metrics. That
+    is how existing ``stats()`` dicts are exported without double counting.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), collect=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        if self.collect is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            collected = self.collect()
+        except Exception as e:
+            logger.warning(f"⚠️ Collecting metric {self.name} failed: {e}")
+            return {}
+        if isinstance(collected, dict):
+            return {tuple(str(v) for v in key): value for key, value in collected.items()}
+        return {(): collected}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative buckets plus ``_sum``/``_count``, per label set.
+
+    Latency buckets by default; pass ``buckets`` for other observations
+    (e.g. batch sizes). ``snapshot`` gives one series as a JSON-friendly dict.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            else:
+                series["counts"][-1] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self, **labels):
+        """Per-bucket (non-cumulative) counts, count and mean of one series."""
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key) or {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            counts, total, count = list(series["counts"]), series["sum"], series["count"]
+        names = [f"<={_format_value(bound)}" for bound in self.buckets] + [f">{_format_value(self.buckets[-1])}"]
+        return {"buckets": dict(zip(names, counts)), "count": count, "mean": (total / count) if count else 0.0}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {key: (list(s["counts"]), s["sum"], s["count"]) for key, s in self._values.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Metrics:
+    """Registry behind ``/metrics``, plus per-stage latency tracing.
+
+    ``trace(stage)`` wraps a function and ``stage(name)`` a block; both
+    record into one ``<namespace>_stage_seconds`` histogram. Setting
+    ``tracing = False`` reduces them to a flag check, so they can stay on
+    hot helpers in production.
+    """
+
+    def __init__(self, namespace, tracing=True):
+        self.namespace = namespace
+        self.tracing = tracing
+        self._metrics = []
+        self.stage_seconds = self.histogram("stage_seconds", "Time spent in each processing stage", ["stage"])
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=(), collect=None):
+        return self._add(Counter(f"{self.namespace}_{name}", documentation, labelnames, collect))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None):
+        return self._add(Gauge(f"{self.namespace}_{name}", documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(f"{self.namespace}_{name}", documentation, labelnames, buckets))
+
+    def trace(self, stage):
+        """Decorator timing every call of the wrapped function as ``stage``."""
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.tracing:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+            return wrapper
+
+        return decorator
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of code as stage ``name``."""
+        if not self.tracing:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - start, stage=name)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
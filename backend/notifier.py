@@ -0,0 +1,365 @@
+import email.utils
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from geocache import geohash_encode
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPConnectionPool:
+    """Keeps up to ``size`` authenticated SMTP sessions open between sends.
+
+    Sessions idle for longer than ``check_after`` seconds are probed with
+    NOOP before reuse, and any session that errors is discarded, so the
+    next send reconnects transparently.
+    """
+
+    def __init__(self, host, port, username=None, password=None, size=2, use_tls=True, timeout=10, check_after=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = size
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        self.connects += 1
+        return conn
+
+    def _acquire(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.check_after:
+                return conn
+            try:
+                if conn.noop()[0] == 250:
+                    return conn
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connected session, blocking while all ``size`` are in use."""
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._acquire()
+            yield conn
+        except Exception:
+            if conn is not None:
+                self._discard(conn)
+            raise
+        else:
+            self._idle.put((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def send(self, msg, from_addr, to_addrs):
+        """Send a message, reconnecting once if a pooled session was dropped by the server."""
+        try:
+            with self.connection() as conn:
+                conn.sendmail(from_addr, to_addrs, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            with self.connection() as conn:
+                conn.sendmail(from_addr, to_addrs, msg.as_string())
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except Exception:
+                self._discard(conn)
+
+
+class TokenBucket:
+    """Allows ``capacity`` sends per ``period`` seconds, refilled continuously."""
+
+    def __init__(self, capacity, period=3600.0):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _Digest:
+    __slots__ = ("recipient", "area", "detections", "omitted", "opened_at", "attempts", "not_before")
+
+    def __init__(self, recipient, area):
+        self.recipient = recipient
+        self.area = area
+        self.detections = []
+        self.omitted = 0  # older detections dropped to stay within the size limit
+        self.opened_at = time.monotonic()
+        self.attempts = 0
+        self.not_before = 0.0
+
+    def add(self, detections, limit):
+        """Append ``detections``, keeping the newest ``limit``; returns how many were dropped."""
+        self.detections.extend(detections)
+        overflow = len(self.detections) - limit
+        if overflow <= 0:
+            return 0
+        del self.detections[:overflow]
+        self.omitted += overflow
+        return overflow
+
+
+def format_detection(detection):
+    timestamp = detection["timestamp"]
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.strftime("%Y-%m-%d %H:%M:%S UTC")
+    return (
+        f"Confidence: {detection['confidence']:.2%}\n"
+        f"Coordinates: {detection['latitude']:.6f}, {detection['longitude']:.6f}\n"
+        f"Address: {detection.get('location_name') or 'Unknown location'}\n"
+        f"Timestamp: {timestamp}\n"
+    )
+
+
+def build_message(from_addr, recipient, detections, omitted=0):
+    """One alert for a single detection, or a digest listing several.
+
+    ``omitted`` older detections are counted but not listed.
+    """
+    total = len(detections) + omitted
+    if total == 1:
+        subject = "Garbage Detection Alert"
+        body = "🚨 Garbage Detected 🚨\n\n" + format_detection(detections[0])
+    else:
+        subject = f"Garbage Detection Digest: {total} detections"
+        body = f"🚨 {total} Garbage Detections 🚨\n\n" + "\n".join(format_detection(d) for d in detections)
+        if omitted:
+            body += f"\n...and {omitted} earlier detections not listed.\n"
+
+    msg = MIMEMultipart()
+    msg["From"] = from_addr
+    msg["To"] = recipient
+    msg["Subject"] = subject
+    msg["Date"] = email.utils.formatdate(localtime=True)
+    msg.attach(MIMEText(body, "plain", "utf-8"))
+    return msg
+
+
+class Notifier:
+    """Queues detection alerts and sends them through an SMTP connection pool.
+
+    With ``digest_window`` > 0, detections for the same recipient (and, if
+    ``digest_precision`` is set, the same geohash area) are collected for
+    that many seconds and sent as one email. Each recipient is limited to
+    ``rate_limit_per_hour`` emails; anything over the limit keeps
+    accumulating in the digest until a send is allowed; while a recipient
+    is over the limit, their digests for different areas are merged into
+    one, and a digest keeps only its newest ``max_digest_size`` detections
+    (the rest are counted as omitted). Failed sends are retried with
+    backoff up to ``max_attempts`` times.
+    """
+
+    def __init__(
+        self,
+        pool,
+        from_addr,
+        recipients,
+        digest_window=0.0,
+        digest_precision=None,
+        rate_limit_per_hour=60,
+        max_queue_size=1000,
+        max_digest_size=100,
+        max_attempts=3,
+        senders=1,
+    ):
+        self.pool = pool
+        self.from_addr = from_addr
+        self.recipients = recipients
+        self.digest_window = digest_window
+        self.digest_precision = digest_precision
+        self.rate_limit_per_hour = rate_limit_per_hour
+        self.max_digest_size = max_digest_size
+        self.max_attempts = max_attempts
+        self.senders = senders
+        self._incoming = queue.Queue(maxsize=max_queue_size)
+        self._outgoing = queue.Queue()
+        self._retry = queue.Queue()
+        self._pending = {}  # (recipient, area) -> _Digest
+        self._limits = {}
+        self._running = threading.Event()
+        self._lock = threading.Lock()
+        self.counters = {
+            "queued": 0,
+            "sent": 0,
+            "detections_sent": 0,
+            "failed": 0,
+            "rate_limited": 0,
+            "dropped": 0,
+            "omitted": 0,
+        }
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def start(self):
+        if self._running.is_set():
+            return
+        self._running.set()
+        threading.Thread(target=self._schedule, name="notifier-scheduler", daemon=True).start()
+        for i in range(self.senders):
+            threading.Thread(target=self._send_loop, name=f"notifier-sender-{i}", daemon=True).start()
+        mode = f"digest every {self.digest_window:.0f}s" if self.digest_window else "immediate"
+        logger.info(f"✅ Notifier started ({mode}, {len(self.recipients)} recipients)")
+
+    def stop(self):
+        self._running.clear()
+        self.pool.close()
+
+    def notify(self, detection):
+        """Queue an alert for a detection; returns False if the queue is full."""
+        try:
+            self._incoming.put_nowait(detection)
+        except queue.Full:
+            self._count("dropped")
+            logger.error("❌ Notification queue full, alert dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def _area(self, detection):
+        if not self.digest_precision:
+            return None
+        return geohash_encode(detection["latitude"], detection["longitude"], self.digest_precision)
+
+    def _schedule(self):
+        # Only this thread touches self._pending
+        while self._running.is_set():
+            try:
+                detection = self._incoming.get(timeout=0.5)
+            except queue.Empty:
+                detection = None
+            if detection is not None:
+                area = self._area(detection)
+                for recipient in self.recipients:
+                    key = (recipient, area)
+                    if key not in self._pending:
+                        self._pending[key] = _Digest(recipient, area)
+                    self._count("omitted", self._pending[key].add([detection], self.max_digest_size))
+            self._requeue_failed()
+            self._flush_due()
+
+    def _requeue_failed(self):
+        while True:
+            try:
+                digest = self._retry.get_nowait()
+            except queue.Empty:
+                return
+            key = (digest.recipient, digest.area)
+            existing = self._pending.get(key)
+            if existing:
+                # The failed digest holds the older detections
+                digest.omitted += existing.omitted
+                self._count("omitted", digest.add(existing.detections, self.max_digest_size))
+            self._pending[key] = digest
+
+    def _flush_due(self):
+        now = time.monotonic()
+        for key, digest in list(self._pending.items()):
+            if self._pending.get(key) is not digest:
+                continue  # Merged into a rate-limited digest earlier in this pass
+            if now - digest.opened_at < self.digest_window or now < digest.not_before:
+                continue
+            limiter = self._limits.setdefault(digest.recipient, TokenBucket(self.rate_limit_per_hour))
+            if not limiter.take():
+                self._count("rate_limited")
+                self._merge_recipient(key, digest)
+                digest.not_before = now + 60  # keep accumulating, look again in a minute
+                continue
+            del self._pending[key]
+            self._outgoing.put(digest)
+
+    def _merge_recipient(self, key, digest):
+        """Fold the recipient's other pending digests into ``digest``, kept under the recipient's catch-all key."""
+        del self._pending[key]
+        for other_key, other in list(self._pending.items()):
+            if other.recipient != digest.recipient:
+                continue
+            del self._pending[other_key]
+            digest.omitted += other.omitted
+            self._count("omitted", digest.add(other.detections, self.max_digest_size))
+        digest.area = None
+        self._pending[(digest.recipient, None)] = digest
+
+    def _send_loop(self):
+        while self._running.is_set():
+            try:
+                digest = self._outgoing.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            msg = build_message(self.from_addr, digest.recipient, digest.detections, digest.omitted)
+            try:
+                self.pool.send(msg, self.from_addr, [digest.recipient])
+            except Exception as e:
+                digest.attempts += 1
+                if digest.attempts >= self.max_attempts:
+                    self._count("failed")
+                    logger.error(f"❌ Email to {digest.recipient} failed after {digest.attempts} attempts: {e}")
+                    continue
+                logger.warning(f"⚠️ Email to {digest.recipient} failed, retrying: {e}")
+                digest.not_before = time.monotonic() + 2**digest.attempts
+                self._retry.put(digest)
+                continue
+
+            self._count("sent")
+            self._count("detections_sent", len(digest.detections))
+            logger.info(f"✅ Email sent successfully ({len(digest.detections)} detections)")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            "queue_depth": self._incoming.qsize(),
+            "pending_digests": len(self._pending),
+            "pending_detections": sum(len(digest.detections) for digest in list(self._pending.values())),
+            "smtp_connects": self.pool.connects,
+            **counters,
+        }
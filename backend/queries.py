@@ -0,0 +1,163 @@
+import base64
+import json
+import logging
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from geo import bbox_query, ensure_geo_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+VALID_STATUSES = ["pending", "in_progress", "completed"]
+VALID_PREDICTIONS = ["Garbage", "Clean"]
+
+# Newest first; _id breaks ties between detections with the same timestamp
+DETECTION_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+
+def ensure_detection_indexes(collection):
+    """Create the compound indexes backing the detection list filters."""
+    collection.create_index(DETECTION_SORT, name="timestamp_id")
+    collection.create_index(
+        [("status", ASCENDING)] + DETECTION_SORT, name="status_timestamp_id"
+    )
+    collection.create_index(
+        [("prediction", ASCENDING)] + DETECTION_SORT, name="prediction_timestamp_id"
+    )
+    ensure_geo_index(collection)
+
+
+def _parse_list(value, allowed, name):
+    items = [v.strip() for v in value.split(",") if v.strip()]
+    invalid = [v for v in items if v not in allowed]
+    if invalid:
+        raise ValueError(f"Invalid {name}: {', '.join(invalid)}")
+    return items
+
+
+def _parse_time(value, name):
+    """Parse an ISO 8601 bound into the naive UTC datetime timestamps are stored as; no offset means UTC."""
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected an ISO 8601 timestamp")
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_bbox(value):
+    """Parse ``minLon,minLat,maxLon,maxLat`` into a tuple of floats."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    except ValueError:
+        raise ValueError("Invalid bbox: expected minLon,minLat,maxLon,maxLat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("Invalid bbox: min values must not exceed max values")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def build_detection_filter(args):
+    """Translate list/export query parameters into a MongoDB filter.
+
+    Supported parameters: ``status`` and ``prediction`` (comma-separated),
+    ``since``/``until`` (ISO 8601, inclusive/exclusive) and ``bbox``.
+    Raises ValueError on malformed input.
+    """
+    query = {}
+
+    if args.get("status"):
+        query["status"] = {"$in": _parse_list(args["status"], VALID_STATUSES, "status")}
+    if args.get("prediction"):
+        query["prediction"] = {
+            "$in": _parse_list(args["prediction"], VALID_PREDICTIONS, "prediction")
+        }
+
+    time_range = {}
+    if args.get("since"):
+        time_range["$gte"] = _parse_time(args["since"], "since")
+    if args.get("until"):
+        time_range["$lt"] = _parse_time(args["until"], "until")
+    if time_range:
+        query["timestamp"] = time_range
+
+    if args.get("bbox"):
+        query.update(bbox_query(*parse_bbox(args["bbox"])))
+
+    return query
+
+
+def build_projection(fields):
+    """Turn a comma-separated ``fields`` parameter into a Mongo projection.
+
+    The sort keys are always included so a cursor can be built from the
+    last document of a page.
+    """
+    if not fields:
+        return None
+    projection = {f.strip(): 1 for f in fields.split(",") if f.strip() and f.strip() != "id"}
+    projection["timestamp"] = 1
+    return projection
+
+
+def encode_cursor(detection):
+    """Build an opaque cursor pointing just past ``detection``."""
+    timestamp = detection.get("timestamp")
+    if isinstance(timestamp, datetime):
+        payload = {"t": timestamp.isoformat(), "dt": True}
+    else:
+        payload = {"t": timestamp}
+    payload["id"] = str(detection["_id"])
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into a filter selecting the documents after it."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        timestamp = datetime.fromisoformat(payload["t"])
+        if not payload.get("dt"):
+            # Cursors issued while timestamps were strings hold server-local time
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        last_id = ObjectId(payload["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    return {
+        "$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}},
+        ]
+    }
+
+
+def parse_limit(value):
+    """Clamp the ``limit`` parameter to ``1..MAX_PAGE_SIZE``."""
+    if value is None or value == "":
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("Invalid limit")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def fetch_detection_page(collection, args):
+    """Return one page of detections and the cursor for the next page."""
+    query = build_detection_filter(args)
+    if args.get("cursor"):
+        query = {"$and": [query, decode_cursor(args["cursor"])]} if query else decode_cursor(args["cursor"])
+    limit = parse_limit(args.get("limit"))
+    projection = build_projection(args.get("fields"))
+
+    # Fetch one extra document to know whether another page exists
+    docs = list(collection.find(query, projection).sort(DETECTION_SORT).limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
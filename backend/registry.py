@@ -0,0 +1,352 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from inference import EngineStopped, Overloaded
+
+logger = logging.getLogger(__name__)
+
+BASELINE_VERSION = "baseline"
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,63}$")
+ARTIFACT_RUNTIMES = {".keras": "keras", ".h5": "keras", ".tflite": "tflite"}
+
+
+class LoadedModel:
+    """An inference engine (and its worker pool, if any) serving one model version."""
+
+    def __init__(self, version, engine, pool=None):
+        self.version = version
+        self.engine = engine
+        self.pool = pool
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+
+    def retire(self, timeout=30.0):
+        """Let in-flight requests finish on this version, then release it."""
+        self.engine.drain(timeout)
+        if self.pool:
+            self.pool.stop()
+        logger.info(f"♻️ Retired model version {self.version}")
+
+
+class ShadowRun:
+    """One sampled request being scored by the shadow model in the background."""
+
+    def __init__(self, registry, version, future, primary_latency_ms):
+        self.registry = registry
+        self.version = version
+        self.future = future
+        self.primary_latency_ms = primary_latency_ms
+        self.submitted_at = time.perf_counter()
+        self.finished_at = None
+        self._record = None
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        self.finished_at = time.perf_counter()
+
+    def record(self, prediction, confidence, timeout=5.0):
+        """Compare with the primary prediction; returns the dict stored on the detection, or None."""
+        if self._record is not None:
+            return self._record
+        try:
+            output = self.future.result(timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ Shadow model {self.version} failed: {e}")
+            self.registry._observe(self.version, failed=True)
+            return None
+
+        shadow_prediction, shadow_confidence = self.registry.classify(output)
+        latency_ms = ((self.finished_at or time.perf_counter()) - self.submitted_at) * 1000
+        self._record = {
+            "version": self.version,
+            "prediction": shadow_prediction,
+            "confidence": shadow_confidence,
+            "agrees": shadow_prediction == prediction,
+            "confidence_delta": shadow_confidence - confidence,
+            "latency_ms": round(latency_ms, 2),
+            "latency_delta_ms": round(latency_ms - self.primary_latency_ms, 2),
+        }
+        self.registry._observe(self.version, record=self._record, primary_latency_ms=self.primary_latency_ms)
+        return self._record
+
+
+class ModelRegistry:
+    """Versioned model artifacts, the version serving traffic, and an optional shadow.
+
+    Each version lives in ``<root>/<version>/`` next to a ``manifest.json``;
+    ``active.json`` names the version loaded at startup. ``build(manifest,
+    shadow)`` turns a manifest into a started LoadedModel. ``activate``
+    loads and warms the new version before swapping a single reference,
+    so requests never wait on a load, and the old engine drains in the
+    background so requests already queued on it finish there.
+    """
+
+    def __init__(self, root, build=None, classify=None, baseline=None):
+        self.root = root
+        self.build = build
+        self.classify = classify
+        self.baseline = baseline
+        self.shadow_sample_rate = 0.0
+        self.loading = None
+        self.last_error = None
+        self._active = None
+        self._shadow = None
+        self._swap_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._shadow_stats = {}
+        os.makedirs(root, exist_ok=True)
+
+    # Artifacts
+    def _manifest_path(self, version):
+        return os.path.join(self.root, version, "manifest.json")
+
+    def manifest(self, version):
+        if version == BASELINE_VERSION and self.baseline:
+            return self.baseline
+        path = self._manifest_path(version)
+        if not VERSION_PATTERN.match(version) or not os.path.exists(path):
+            raise KeyError(f"Unknown model version '{version}'")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def versions(self):
+        """Manifests of every registered version.
+
+        In-progress ``.staging-*`` directories and unreadable manifests are skipped.
+        """
+        manifests = [self.baseline] if self.baseline else []
+        for name in sorted(os.listdir(self.root)):
+            if not VERSION_PATTERN.match(name) or not os.path.exists(self._manifest_path(name)):
+                continue
+            try:
+                manifests.append(self.manifest(name))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Skipping model version {name}: unreadable manifest ({e})")
+        return manifests
+
+    def register(self, artifact_path, version=None, runtime=None, notes=""):
+        """Copy a model file (or SavedModel directory) into the registry as a new immutable version."""
+        version = version or datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        if not VERSION_PATTERN.match(version) or version == BASELINE_VERSION:
+            raise ValueError(f"Invalid version name '{version}'")
+        if os.path.exists(os.path.join(self.root, version)):
+            raise ValueError(f"Version '{version}' already exists")
+        artifact = os.path.basename(os.path.normpath(artifact_path))
+        runtime = runtime or ARTIFACT_RUNTIMES.get(os.path.splitext(artifact)[1], "keras")
+
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            if os.path.isdir(artifact_path):
+                shutil.copytree(artifact_path, os.path.join(staging, artifact))
+            else:
+                shutil.copy2(artifact_path, os.path.join(staging, artifact))
+            manifest = {
+                "version": version,
+                "runtime": runtime,
+                "artifact": artifact,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "notes": notes,
+            }
+            with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(staging, os.path.join(self.root, version))
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        logger.info(f"✅ Registered model version {version} ({runtime})")
+        return manifest
+
+    def runtime_kwargs(self, manifest):
+        """Keyword arguments for ``load_runtime`` pointing at a version's artifact."""
+        if "runtime_kwargs" in manifest:
+            return manifest["runtime_kwargs"]
+        path = os.path.join(self.root, manifest["version"], manifest["artifact"])
+        return {"tflite_path": path} if manifest["runtime"] == "tflite" else {"model_path": path}
+
+    def startup_version(self):
+        """The version recorded by the last activation, or the baseline."""
+        try:
+            with open(os.path.join(self.root, "active.json"), encoding="utf-8") as f:
+                return json.load(f)["version"]
+        except (OSError, ValueError, KeyError):
+            return BASELINE_VERSION
+
+    def _persist_active(self, version):
+        path = os.path.join(self.root, "active.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": version, "activated_at": datetime.now(timezone.utc).isoformat()}, f)
+        os.replace(path + ".tmp", path)
+
+    # Serving
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def active_version(self):
+        active = self._active
+        return active.version if active else None
+
+    def activate(self, version, persist=True):
+        """Load and warm up ``version``, then route every new request to it."""
+        manifest = self.manifest(version)
+        with self._swap_lock:
+            self.loading = version
+            try:
+                loaded = self.build(manifest, shadow=False)
+            except Exception as e:
+                self.last_error = f"{version}: {e}"
+                raise
+            finally:
+                self.loading = None
+            previous, self._active = self._active, loaded
+        if persist:
+            self._persist_active(version)
+        logger.info(f"✅ Model version {version} is now active")
+        if previous:
+            threading.Thread(target=previous.retire, name="model-retire", daemon=True).start()
+        return loaded
+
+    def set_shadow(self, version, sample_rate):
+        """Score ``sample_rate`` of requests with ``version`` as well; ``None`` turns shadowing off."""
+        manifest = self.manifest(version) if version else None
+        with self._swap_lock:
+            loaded = None
+            if manifest:
+                self.loading = version
+                try:
+                    loaded = self.build(manifest, shadow=True)
+                except Exception as e:
+                    self.last_error = f"{version}: {e}"
+                    raise
+                finally:
+                    self.loading = None
+            previous, self._shadow = self._shadow, loaded
+            self.shadow_sample_rate = sample_rate if loaded else 0.0
+        if previous:
+            threading.Thread(target=previous.retire, name="model-retire", daemon=True).start()
+        if loaded:
+            logger.info(f"✅ Shadowing {sample_rate:.0%} of traffic with model version {version}")
+
+    def in_background(self, fn, *args):
+        """Run a load (``activate``/``set_shadow``) off the request thread; False if one is already running."""
+        if self.loading or self._swap_lock.locked():
+            return False
+
+        def run():
+            try:
+                fn(*args)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ Model load failed: {e}")
+
+        threading.Thread(target=run, name="model-load", daemon=True).start()
+        return True
+
+    def submit(self, img_array):
+        """Queue an image on the active model; returns ``(future, version)``.
+
+        Retries once when a swap drained the engine between reading the
+        active model and submitting to it.
+        """
+        for attempt in range(2):
+            active = self._active
+            if active is None:
+                raise EngineStopped("No model is active")
+            try:
+                return active.engine.submit(img_array), active.version
+            except EngineStopped:
+                if attempt:
+                    raise
+
+    def predict(self, img_array, timeout=30.0):
+        future, version = self.submit(img_array)
+        return future.result(timeout=timeout), version
+
+    def shadow(self, img_array, primary_latency_ms):
+        """Sample a request for shadow scoring; returns a ShadowRun or None. Never blocks."""
+        shadow = self._shadow
+        if shadow is None or random.random() >= self.shadow_sample_rate:
+            return None
+        try:
+            return ShadowRun(self, shadow.version, shadow.engine.submit(img_array), primary_latency_ms)
+        except Overloaded:
+            self._observe(shadow.version, skipped=True)
+            return None
+
+    def _observe(self, version, record=None, primary_latency_ms=0.0, failed=False, skipped=False):
+        with self._stats_lock:
+            stats = self._shadow_stats.setdefault(
+                version,
+                {"compared": 0, "agreed": 0, "failed": 0, "skipped": 0, "latency_ms": 0.0, "primary_latency_ms": 0.0},
+            )
+            if failed:
+                stats["failed"] += 1
+            elif skipped:
+                stats["skipped"] += 1
+            else:
+                stats["compared"] += 1
+                stats["agreed"] += record["agrees"]
+                stats["latency_ms"] += record["latency_ms"]
+                stats["primary_latency_ms"] += primary_latency_ms
+
+    def stats(self):
+        with self._stats_lock:
+            shadow_stats = {}
+            for version, stats in self._shadow_stats.items():
+                compared = stats["compared"] or 1
+                shadow_stats[version] = {
+                    "compared": stats["compared"],
+                    "failed": stats["failed"],
+                    "skipped": stats["skipped"],
+                    "agreement": stats["agreed"] / compared,
+                    "mean_latency_ms": stats["latency_ms"] / compared,
+                    "mean_latency_delta_ms": (stats["latency_ms"] - stats["primary_latency_ms"]) / compared,
+                }
+        active, shadow = self._active, self._shadow
+        return {
+            "versions": self.versions(),
+            "active": {"version": active.version, "loaded_at": active.loaded_at} if active else None,
+            "shadow": {"version": shadow.version, "sample_rate": self.shadow_sample_rate} if shadow else None,
+            "loading": self.loading,
+            "last_error": self.last_error,
+            "shadow_comparisons": shadow_stats,
+        }
+
+
+if __name__ == "__main__":
+    # Manage artifacts from the command line; use the /api/models endpoints to swap a running server
+    parser = argparse.ArgumentParser(description="Manage versioned model artifacts")
+    parser.add_argument("--root", default=os.getenv("MODEL_REGISTRY_DIR", "models"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    register = commands.add_parser("register", help="copy a model into the registry")
+    register.add_argument("artifact")
+    register.add_argument("--version")
+    register.add_argument("--runtime", choices=["keras", "tf_function", "tflite"])
+    register.add_argument("--notes", default="")
+    commands.add_parser("list", help="show registered versions")
+    activate = commands.add_parser("activate", help="set the version loaded on the next start")
+    activate.add_argument("version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    registry = ModelRegistry(args.root)
+    if args.command == "register":
+        print(json.dumps(registry.register(args.artifact, args.version, args.runtime, args.notes), indent=2))
+    elif args.command == "list":
+        current = registry.startup_version()
+        for manifest in registry.versions():
+            marker = "*" if manifest["version"] == current else " "
+            print(f"{marker} {manifest['version']:<24} {manifest['runtime']:<12} {manifest['created_at']}")
+    else:
+        registry.manifest(args.version)
+        registry._persist_active(args.version)
+        print(f"{args.version} will be loaded on the next start")
@@ -0,0 +1,256 @@
+"""The app's single MongoDB client and the user/detection reads and writes made through it.
+
+Timestamps are stored as native BSON datetimes in UTC (naive, as PyMongo
+returns them) so range filters and sorts compare dates rather than
+strings; ``to_iso`` turns them into ISO 8601 for JSON.
+"""
+import logging
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, MongoClient, ReturnDocument, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from queries import ensure_detection_indexes
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+# Fields written as ISO strings before timestamps were stored as dates
+LEGACY_TIME_FIELDS = {"detections": ("timestamp", "last_reported_at"), "users": ("created_at",)}
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def to_iso(value):
+    """ISO 8601 with an explicit UTC offset for stored datetimes; anything else passes through."""
+    if isinstance(value, datetime):
+        return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+    return value
+
+
+def parse_legacy_time(value):
+    # Old documents hold datetime.now().isoformat(): server-local time without an offset
+    parsed = datetime.fromisoformat(value)
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_write_concern(value, journal=False):
+    """``"majority"``, or a number of acknowledging members."""
+    w = int(value) if value.isdigit() else value
+    return WriteConcern(w=w, j=journal or None)
+
+
+def create_client(
+    uri,
+    max_pool_size=50,
+    min_pool_size=5,
+    max_idle_time_ms=60000,
+    wait_queue_timeout_ms=2000,
+    server_selection_timeout_ms=5000,
+):
+    """One pooled client for the whole process.
+
+    A request waiting longer than ``wait_queue_timeout_ms`` for a pooled
+    connection fails instead of piling up behind a slow database.
+    """
+    return MongoClient(
+        uri,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min_pool_size,
+        maxIdleTimeMS=max_idle_time_ms,
+        waitQueueTimeoutMS=wait_queue_timeout_ms,
+        serverSelectionTimeoutMS=server_selection_timeout_ms,
+        retryWrites=True,
+        appname="garbage-detection",
+    )
+
+
+class Repository:
+    """Users and detections in ``database``, written with ``write_concern``.
+
+    ``db`` is exposed for components that manage their own collections
+    (change feed, caches, rollups).
+    """
+
+    def __init__(self, client, database, write_concern=None):
+        self.client = client
+        self.db = client.get_database(database, write_concern=write_concern)
+        self.users = self.db.users
+        self.detections = self.db.detections
+
+    def collection(self, name, write_concern=None):
+        """A collection with its own write concern, e.g. ``w=1`` for data that is rebuilt anyway."""
+        return self.db.get_collection(name, write_concern=write_concern)
+
+    # Startup
+    def ensure_indexes(self):
+        self.users.create_index([("email", ASCENDING)], unique=True, name="email_unique")
+        ensure_detection_indexes(self.detections)
+
+    def migrate_timestamps(self):
+        """Convert ISO-string timestamps left by older versions into BSON datetimes; returns the count.
+
+        A string that does not parse is moved to ``<field>_unparsed``,
+        leaving the document without the field rather than with a bad date.
+        """
+        converted = 0
+        for name, fields in LEGACY_TIME_FIELDS.items():
+            collection = self.db[name]
+            for field in fields:
+                while True:
+                    batch = list(
+                        collection.find({field: {"$type": "string"}}, {field: 1}).limit(MIGRATION_BATCH_SIZE)
+                    )
+                    if not batch:
+                        break
+                    operations = []
+                    for doc in batch:
+                        try:
+                            update = {"$set": {field: parse_legacy_time(doc[field])}}
+                        except ValueError:
+                            update = {"$set": {f"{field}_unparsed": doc[field]}, "$unset": {field: ""}}
+                        operations.append(UpdateOne({"_id": doc["_id"]}, update))
+                    collection.bulk_write(operations, ordered=False)
+                    converted += len(operations)
+        if converted:
+            logger.info(f"📝 Converted {converted} string timestamps to dates")
+        return converted
+
+    # Users
+    def find_user_by_email(self, email, projection=None):
+        return self.users.find_one({"email": email}, projection)
+
+    def find_user(self, user_id, projection=None):
+        if not ObjectId.is_valid(user_id):
+            return None
+        return self.users.find_one({"_id": ObjectId(user_id)}, projection)
+
+    def create_user(self, email, hashed_password, role="user"):
+        """Insert a user; returns its id, or None when the email is taken."""
+        try:
+            result = self.users.insert_one(
+                {"email": email, "password": hashed_password, "created_at": utc_now(), "role": role}
+            )
+        except DuplicateKeyError:
+            return None
+        return str(result.inserted_id)
+
+    def set_password(self, user_id, hashed_password):
+        self.users.update_one({"_id": user_id}, {"$set": {"password": hashed_password}})
+
+    def end_sessions(self, user_id):
+        self.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"session_version": 1}})
+
+    # Detections
+    def find_detection(self, detection_id):
+        if not ObjectId.is_valid(detection_id):
+            return None
+        return self.detections.find_one({"_id": ObjectId(detection_id)})
+
+    def insert_detection(self, detection):
+        """Insert one detection; False when it was already stored by an earlier attempt."""
+        try:
+            self.detections.insert_one(detection)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def insert_detections(self, detections):
+        """Insert many detections in one round trip; returns ``{position: error}`` for rejected ones."""
+        if not detections:
+            return {}
+        try:
+            self.detections.insert_many(detections, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+        return {}
+
+    def set_location_name(self, detection_id, location_name):
+        self.detections.update_one({"_id": detection_id}, {"$set": {"location_name": location_name}})
+
+    def set_derivatives(self, sha256, thumbnail_url, derivatives):
+        """Record rendered derivatives on every detection of an image that lacks them; returns their ids."""
+        ids = [doc["_id"] for doc in self.detections.find({"sha256": sha256, "derivatives": None}, {"_id": 1})]
+        if ids:
+            self.detections.update_many(
+                {"_id": {"$in": ids}}, {"$set": {"thumbnail_url": thumbnail_url, "derivatives": derivatives}}
+            )
+        return ids
+
+    def count_report(self, detection_id):
+        """Count a near-duplicate report against an existing detection."""
+        self.detections.update_one(
+            {"_id": detection_id}, {"$inc": {"report_count": 1}, "$set": {"last_reported_at": utc_now()}}
+        )
+
+    def update_status(self, detection_id, status):
+        """Set the status in one round trip; returns the detection as it was before, or None."""
+        return self.detections.find_one_and_update(
+            {"_id": ObjectId(detection_id)}, {"$set": {"status": status}}, return_document=ReturnDocument.BEFORE
+        )
+
+    def update_statuses(self, detection_ids, status):
+        """Set one status on many detections; returns the ones found, as they were before.
+
+        The before-images come from one read and the writes go out in one
+        ``bulk_write``, each conditioned on the status that was read. A
+        detection whose status changed in between is retried on its own
+        with ``update_status``, so the returned documents are exactly the
+        states that were replaced.
+        """
+        ids = [ObjectId(detection_id) for detection_id in dict.fromkeys(detection_ids)]
+        before = {detection["_id"]: detection for detection in self.detections.find({"_id": {"$in": ids}})}
+        changing = [detection_id for detection_id, detection in before.items() if detection.get("status") != status]
+        if changing:
+            result = self.detections.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": detection_id, "status": before[detection_id].get("status")}, {"$set": {"status": status}}
+                    )
+                    for detection_id in changing
+                ],
+                ordered=False,
+            )
+            if result.matched_count < len(changing):
+                # Re-read the written ids: missing ones were deleted, others off the new status lost a race
+                current = {
+                    detection["_id"]: detection.get("status")
+                    for detection in self.detections.find({"_id": {"$in": changing}}, {"status": 1})
+                }
+                for detection_id in changing:
+                    if detection_id not in current:
+                        del before[detection_id]
+                    elif current[detection_id] != status:
+                        retried = self.update_status(detection_id, status)
+                        if retried is None:
+                            del before[detection_id]
+                        else:
+                            before[detection_id] = retried
+        return [before[detection_id] for detection_id in ids if detection_id in before]
+
+    def delete_detection(self, detection_id):
+        """Delete a detection; returns the deleted document, or None."""
+        return self.detections.find_one_and_delete({"_id": ObjectId(detection_id)})
+
+
+if __name__ == "__main__":
+    # One-off maintenance, e.g. converting a large collection before deploying instead of after startup
+    import argparse
+    import os
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Database maintenance")
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI"))
+    parser.add_argument("--database", default="garbage_detection")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate-timestamps", help="convert ISO-string timestamps to dates")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    repository = Repository(create_client(args.uri), args.database)
+    print(f"Converted {repository.migrate_timestamps()} timestamps")
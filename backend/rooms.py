@@ -0,0 +1,65 @@
+"""Socket.IO rooms: who receives which detection changes.
+
+Clients join ``role:<role>`` on connect and ``region:<geohash>`` for
+each cell they watch (a municipal ward maps to one or more cells).
+"""
+from geocache import geohash_encode
+
+ADMIN_ROLE = "admin"
+MAX_REGIONS = 64
+GEOHASH_CHARS = set("0123456789bcdefghjkmnpqrstuvwxyz")
+
+
+def role_room(role):
+    return f"role:{role}"
+
+
+def region_room(cell):
+    return f"region:{cell}"
+
+
+def parse_regions(value, precision):
+    """Validate a list (or comma-separated string) of geohash cells of exactly ``precision`` characters."""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        raise ValueError("regions must be a list of geohash cells")
+    cells = sorted({str(cell).strip().lower() for cell in value if str(cell).strip()})
+    if len(cells) > MAX_REGIONS:
+        raise ValueError(f"At most {MAX_REGIONS} regions per client")
+    invalid = [cell for cell in cells if len(cell) != precision or not set(cell) <= GEOHASH_CHARS]
+    if invalid:
+        raise ValueError(f"Invalid regions (expected {precision}-character geohashes): {', '.join(invalid)}")
+    return cells
+
+
+def detection_cell(detection, precision):
+    return geohash_encode(detection["latitude"], detection["longitude"], precision)
+
+
+def route_changes(changes, precision):
+    """Split a change-feed batch into ``{rooms: changes}``, ``rooms`` being a tuple of room names.
+
+    Upserts go to the room of the detection's cell together with the
+    admin role room, in one emit so a client in both gets each change
+    once. Deletes carry no location, so they go to everyone (rooms None);
+    they only hold an id.
+    """
+    routed = {}
+    for change in changes:
+        if change["op"] == "delete":
+            routed.setdefault(None, []).append(change)
+            continue
+        rooms = (region_room(detection_cell(change["detection"], precision)), role_room(ADMIN_ROLE))
+        routed.setdefault(rooms, []).append(change)
+    return routed
+
+
+def filter_changes(changes, cells, precision):
+    """Keep deletes and the upserts located in ``cells``."""
+    cells = set(cells)
+    return [
+        change
+        for change in changes
+        if change["op"] == "delete" or detection_cell(change["detection"], precision) in cells
+    ]
@@ -0,0 +1,103 @@
+import logging
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from preprocessing import IMG_SIZE
+
+logger = logging.getLogger(__name__)
+
+try:
+    # The standalone interpreter is much lighter than full TensorFlow when available
+    from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter
+except ImportError:
+    TFLiteInterpreter = tf.lite.Interpreter
+
+
+class KerasRuntime:
+    """The trained Keras model run through ``model.predict``."""
+
+    name = "keras"
+
+    def __init__(self, model_path="model_deep.keras", **kwargs):
+        self.model = tf.keras.models.load_model(model_path)
+
+    def predict(self, batch):
+        return self.model.predict(batch, verbose=0)
+
+
+class TFFunctionRuntime:
+    """The Keras model compiled into a single ``tf.function`` graph.
+
+    Skips ``model.predict``'s per-call data adapter and callback setup; the
+    batch dimension is left dynamic so every batch size shares one trace.
+    """
+
+    name = "tf_function"
+
+    def __init__(self, model_path="model_deep.keras", **kwargs):
+        self.model = tf.keras.models.load_model(model_path)
+        spec = tf.TensorSpec([None, IMG_SIZE[1], IMG_SIZE[0], 3], tf.float32)
+        self._fn = tf.function(lambda x: self.model(x, training=False), input_signature=[spec])
+
+    def predict(self, batch):
+        return self._fn(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+class TFLiteRuntime:
+    """A post-training-quantized TFLite model (see ``extras/convert_tflite.py``).
+
+    Integer-quantized inputs and outputs are (de)quantized here, so callers
+    always pass float32 images in [0, 1] and get float probabilities back.
+    Batches are run one image at a time, which is how the interpreter is
+    fastest on CPU.
+    """
+
+    name = "tflite"
+
+    def __init__(self, tflite_path="model_deep_int8.tflite", num_threads=None, **kwargs):
+        self.interpreter = TFLiteInterpreter(
+            model_path=tflite_path, num_threads=num_threads or os.cpu_count()
+        )
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+
+    def _quantize(self, image):
+        dtype = self._input["dtype"]
+        if dtype == np.float32:
+            return image.astype(np.float32, copy=False)
+        scale, zero_point = self._input["quantization"]
+        info = np.iinfo(dtype)
+        return np.clip(np.round(image / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output):
+        if self._output["dtype"] == np.float32:
+            return output
+        scale, zero_point = self._output["quantization"]
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch):
+        outputs = []
+        for image in batch:
+            self.interpreter.set_tensor(self._input["index"], self._quantize(image[np.newaxis]))
+            self.interpreter.invoke()
+            outputs.append(self._dequantize(self.interpreter.get_tensor(self._output["index"]))[0])
+        return np.stack(outputs)
+
+
+RUNTIMES = {
+    KerasRuntime.name: KerasRuntime,
+    TFFunctionRuntime.name: TFFunctionRuntime,
+    TFLiteRuntime.name: TFLiteRuntime,
+}
+
+
+def load_runtime(name, **kwargs):
+    """Instantiate the inference runtime selected by ``name``."""
+    if name not in RUNTIMES:
+        raise ValueError(f"Unknown inference runtime '{name}'. Choose from: {', '.join(RUNTIMES)}")
+    runtime = RUNTIMES[name](**kwargs)
+    logger.info(f"✅ Loaded {name} inference runtime")
+    return runtime
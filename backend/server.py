@@ -1,25 +1,75 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
+import io
+import functools
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room, rooms
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
-from PIL import Image
 import numpy as np
-import tensorflow as tf
 import requests
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import email.utils
-from datetime import datetime
 import logging
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import WriteConcern
 from bson.objectid import ObjectId
-import bcrypt
+from inference import BatchInferenceEngine, Overloaded
+from registry import BASELINE_VERSION, LoadedModel, ModelRegistry
+from workerpool import InferenceWorkerPool
+from jobs import JobPipeline, current_attempt
+from geocache import ReverseGeocodeCache
+from startup import Startup, parse_batch_sizes, warm_up
+from metrics import Metrics
+from auth import ACCESS, REFRESH, HasherBusy, InvalidToken, PasswordHasher, TokenService
+from analytics import AnalyticsRollups, detection_geohash
+from changefeed import DELETE, UPSERT, ChangeFeed, ChangeLogExpired
+from rooms import ADMIN_ROLE, filter_changes, parse_regions, region_room, role_room, route_changes
+from notifier import Notifier, SMTPConnectionPool
+from repository import Repository, create_client, parse_write_concern, to_iso, utc_now
+from queries import (
+    MAX_PAGE_SIZE,
+    VALID_STATUSES,
+    build_detection_filter,
+    build_projection,
+    fetch_detection_page,
+    parse_limit,
+)
+from geo import (
+    MAX_RADIUS_METERS,
+    backfill_locations,
+    cluster_cell_size,
+    cluster_pipeline,
+    format_cluster,
+    geojson_point,
+    haversine_meters,
+    radius_query,
+    valid_coordinates,
+)
+from preprocessing import IMG_SIZE, BatchBuffer, decode_image, image_to_array
+from derivatives import build_derivatives, derivative_paths, derivatives_exist
+from dedup import find_exact, find_near_duplicate, hamming_distance, perceptual_hash, remember
+from uploads import (
+    MAX_UPLOAD_BYTES,
+    ContentAddressedStore,
+    InMemoryUploadRequest,
+    UploadTooLarge,
+    content_etag,
+    read_upload,
+    sniff_image_type,
+)
+from ingest import (
+    ManifestError,
+    chunked,
+    iter_archive,
+    iter_files,
+    lookup_coordinates,
+    parse_manifest,
+)
+from export import CSV_FIELDS, EXPORT_BATCH_SIZE, gzip_chunks, iter_csv, iter_ndjson
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -29,17 +79,80 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 FROM_EMAIL = os.getenv("FROM_EMAIL")
 EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
-TO_EMAIL = os.getenv("TO_EMAIL")
+TO_EMAIL = os.getenv("TO_EMAIL")  # comma-separated for several recipients
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+NOTIFY_DIGEST_WINDOW = float(os.getenv("NOTIFY_DIGEST_WINDOW", "0"))  # seconds; 0 sends immediately
+NOTIFY_DIGEST_PRECISION = int(os.getenv("NOTIFY_DIGEST_PRECISION", "0"))  # geohash length; 0 = one digest
+NOTIFY_RATE_LIMIT_PER_HOUR = int(os.getenv("NOTIFY_RATE_LIMIT_PER_HOUR", "60"))
+NOTIFY_MAX_DIGEST_SIZE = int(os.getenv("NOTIFY_MAX_DIGEST_SIZE", "100"))  # detections listed per email
 SECRET_KEY = os.getenv("SECRET_KEY", "default-secret-key-for-development-only")
+JWT_SECRET = os.getenv("JWT_SECRET_KEY", SECRET_KEY)  # generate one with `python generatejwt.py`
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", "900"))  # seconds
+REFRESH_TOKEN_TTL = int(os.getenv("REFRESH_TOKEN_TTL", str(7 * 24 * 3600)))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))  # verified access tokens kept in memory
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "32"))  # logins beyond this get a 503
 UPLOAD_FOLDER = "uploads"  # Directory to save uploaded images
+UPLOAD_URL = "http://localhost:5000/uploads/"
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # Content-addressed files never change
 MONGO_URI = os.getenv("MONGO_URI")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))  # fail fast when the pool is exhausted
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "majority")  # or a number of acknowledging members
+MONGO_JOURNAL = os.getenv("MONGO_JOURNAL", "false").lower() == "true"
 DATABASE_NAME = "garbage_detection"
+INFERENCE_RUNTIME = os.getenv("INFERENCE_RUNTIME", "keras")  # keras, tf_function or tflite
+MODEL_PATH = os.getenv("MODEL_PATH", "model_deep.keras")
+TFLITE_MODEL_PATH = os.getenv("TFLITE_MODEL_PATH", "model_deep_int8.tflite")
+INFERENCE_WORKERS = os.getenv("INFERENCE_WORKERS", "0")  # 0 = in-process, "auto" = one per CPU core
+INFERENCE_WORKERS = os.cpu_count() if INFERENCE_WORKERS == "auto" else int(INFERENCE_WORKERS)
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "16"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+INFERENCE_WARMUP_BATCH_SIZES = parse_batch_sizes(
+    os.getenv("INFERENCE_WARMUP_BATCH_SIZES", "all"), INFERENCE_MAX_BATCH_SIZE
+)  # "all", "none" or e.g. "1,4,16"
+INFERENCE_STARTUP_TIMEOUT = float(os.getenv("INFERENCE_STARTUP_TIMEOUT", "300"))
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", "models")
+SHADOW_MODEL_VERSION = os.getenv("SHADOW_MODEL_VERSION", "")  # empty = no shadow scoring
+SHADOW_SAMPLE_RATE = float(os.getenv("SHADOW_SAMPLE_RATE", "0.1"))
+METRICS_TRACING = os.getenv("METRICS_TRACING", "true").lower() == "true"  # per-stage latency histograms
+CHANGE_FEED_MODE = os.getenv("CHANGE_FEED_MODE", "auto")  # auto (change streams when available) or oplog
+CHANGE_FEED_INTERVAL_MS = float(os.getenv("CHANGE_FEED_INTERVAL_MS", "250"))  # broadcast batching window
+CHANGE_FEED_RETENTION_HOURS = float(os.getenv("CHANGE_FEED_RETENTION_HOURS", "24"))
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")  # e.g. redis://localhost:6379/0 for several workers
+SOCKETIO_CORS_ORIGINS = os.getenv("SOCKETIO_CORS_ORIGINS", "http://localhost:5173")  # comma-separated
+SOCKETIO_REGION_PRECISION = int(os.getenv("SOCKETIO_REGION_PRECISION", "5"))  # geohash length of region rooms
+ANALYTICS_CELL_PRECISION = int(os.getenv("ANALYTICS_CELL_PRECISION", "5"))  # geohash length of map cells, at most 7
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "10"))  # seconds before other processes' writes show up
+ANALYTICS_REBUILD_INTERVAL = float(os.getenv("ANALYTICS_REBUILD_INTERVAL", "3600"))  # seconds; 0 = startup only
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_MAX_RETRIES = int(os.getenv("JOB_MAX_RETRIES", "3"))
+GEOCODE_PRECISION = int(os.getenv("GEOCODE_PRECISION", "7"))
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "10000"))
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", str(7 * 24 * 3600)))
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL", "60"))
+GEOCODE_CACHE_PERSIST = os.getenv("GEOCODE_CACHE_PERSIST", "true").lower() == "true"
+DEDUP_RADIUS_METERS = float(os.getenv("DEDUP_RADIUS_METERS", "50"))
+DEDUP_PHASH_MAX_DISTANCE = int(os.getenv("DEDUP_PHASH_MAX_DISTANCE", "6"))
+DEDUP_MERGE_NEAR_DUPLICATES = os.getenv("DEDUP_MERGE_NEAR_DUPLICATES", "false").lower() == "true"
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", str(512 * 1024 * 1024)))
+BATCH_DECODE_THREADS = int(os.getenv("BATCH_DECODE_THREADS", "4"))
 
 # Validate required environment variables
 if not all([FROM_EMAIL, EMAIL_PASSWORD, TO_EMAIL]):
     logger.error("❌ Missing email configuration in .env file")
     exit(1)
 
+if JWT_SECRET == "default-secret-key-for-development-only":
+    logger.warning("⚠️ JWT_SECRET_KEY is not set; session tokens are signed with the development key")
+
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -47,33 +160,109 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Uploads are parsed straight into memory; Werkzeug rejects oversized bodies while streaming
+app.request_class = InMemoryUploadRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024  # room for the form fields
+InMemoryUploadRequest.max_content_length_overrides["/upload/batch"] = BATCH_MAX_BYTES
+
+# Uploaded images, stored under their content hash
+image_store = ContentAddressedStore(UPLOAD_FOLDER)
 
 # Security middleware
 CORS(app, origins=["http://localhost:5173"])  # Update with your frontend URL
-Talisman(app, content_security_policy=None)  # Disable CSP for simplicity
+talisman = Talisman(app, content_security_policy=None)  # Disable CSP for simplicity
 
 # Rate limiting
 limiter = Limiter(
     app=app, key_func=get_remote_address, default_limits=["5000 per day", "1000 per hour"]
 )
 
-# WebSockets
-socketio = SocketIO(app, cors_allowed_origins="*")
+# WebSockets; with a message queue (needs the redis package) every worker can emit to every client
+socketio = SocketIO(
+    app,
+    cors_allowed_origins=[origin.strip() for origin in SOCKETIO_CORS_ORIGINS.split(",")],
+    message_queue=SOCKETIO_MESSAGE_QUEUE or None,
+)
+
+# MongoDB: one pooled client; users and detections go through the repository
+client = create_client(
+    MONGO_URI,
+    max_pool_size=MONGO_MAX_POOL_SIZE,
+    min_pool_size=MONGO_MIN_POOL_SIZE,
+    wait_queue_timeout_ms=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
+repository = Repository(client, DATABASE_NAME, parse_write_concern(MONGO_WRITE_CONCERN, MONGO_JOURNAL))
+db = repository.db
+
+# Prometheus metrics served at /metrics; stage timings can be switched off at runtime
+metrics = Metrics("garbage_detection", tracing=METRICS_TRACING)
+http_requests = metrics.counter(
+    "http_requests_total", "HTTP responses by route, method and status", ["route", "method", "status"]
+)
+http_latency = metrics.histogram("http_request_duration_seconds", "HTTP request latency by route", ["route"])
+predictions = metrics.counter(
+    "predictions_total", "Detections created, by predicted class", ["prediction", "model_version", "source"]
+)
+websocket_clients = metrics.gauge("websocket_clients", "Connected Socket.IO clients")
+websocket_clients.set(0)
+
+
+def collect_queue_depths():
+    depths = {("jobs",): job_pipeline.stats()["queue_depth"], ("notifications",): notifier.stats()["queue_depth"]}
+    active = model_registry.active
+    if active:
+        depths[("inference",)] = active.engine.stats()["queue_depth"]
+    return depths
+
+
+def collect_counters(component, names):
+    """Export counters a component already keeps for its /stats endpoint."""
+    stats = component.stats()
+    return {(name,): stats[name] for name in names}
+
+
+metrics.gauge("queue_depth", "Items waiting in each background queue", ["queue"], collect=collect_queue_depths)
+metrics.counter(
+    "jobs_total",
+    "Background job events by outcome",
+    ["outcome"],
+    collect=lambda: collect_counters(job_pipeline, ["enqueued", "succeeded", "retried", "dead_lettered", "rejected"]),
+)
+metrics.counter(
+    "emails_total",
+    "Alert email events by outcome",
+    ["outcome"],
+    collect=lambda: collect_counters(notifier, ["queued", "sent", "failed", "rate_limited", "dropped"]),
+)
+metrics.counter(
+    "geocode_lookups_total",
+    "Reverse-geocode lookups by result",
+    ["result"],
+    collect=lambda: collect_counters(
+        geocode_cache, ["hits", "negative_hits", "persistent_hits", "coalesced", "misses", "upstream_failures"]
+    ),
+)
+metrics.gauge(
+    "inference_ready_workers",
+    "Inference worker processes that finished warming up",
+    collect=lambda: model_registry.active.pool.ready_workers if model_registry.active and model_registry.active.pool else 0,
+)
 
-# MongoDB Client
-client = MongoClient(MONGO_URI)
-db = client[DATABASE_NAME]
+# The model configured through INFERENCE_RUNTIME/MODEL_PATH, served until a registry version is activated
+BASELINE_MANIFEST = {
+    "version": BASELINE_VERSION,
+    "runtime": INFERENCE_RUNTIME,
+    "artifact": TFLITE_MODEL_PATH if INFERENCE_RUNTIME == "tflite" else MODEL_PATH,
+    "runtime_kwargs": {"model_path": MODEL_PATH, "tflite_path": TFLITE_MODEL_PATH},
+    "created_at": None,
+    "notes": "Configured by environment",
+}
 
-# Load TensorFlow Model
-try:
-    model = tf.keras.models.load_model("model_deep.keras")
-    logger.info("✅ Model loaded successfully")
-except Exception as e:
-    logger.error(f"❌ Model loading failed: {e}")
-    model = None
+startup = Startup()
 
 
 # Helper Functions
+@metrics.trace("geocode_upstream")
 def get_location_name(lat, lon):
     """Get human-readable address using OpenStreetMap."""
     try:
@@ -103,81 +292,514 @@ def get_location_name(lat, lon):
         return None
 
 
-def send_email(subject, body):
-    """Send email notifications when garbage is detected."""
-    try:
-        msg = MIMEMultipart()
-        msg["From"] = FROM_EMAIL
-        msg["To"] = TO_EMAIL
-        msg["Subject"] = subject
-        msg["Date"] = email.utils.formatdate(localtime=True)
-        msg.attach(MIMEText(body, "plain", "utf-8"))
-
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(FROM_EMAIL, EMAIL_PASSWORD)
-            server.sendmail(FROM_EMAIL, TO_EMAIL, msg.as_string())
-
-        logger.info("✅ Email sent successfully")
-    except Exception as e:
-        logger.error(f"❌ Email sending failed: {e}")
+# Reverse-geocoding cache keyed by geohash cell, so nearby reports share one lookup
+geocode_cache = ReverseGeocodeCache(
+    get_location_name,
+    precision=GEOCODE_PRECISION,
+    max_entries=GEOCODE_CACHE_SIZE,
+    ttl=GEOCODE_CACHE_TTL,
+    negative_ttl=GEOCODE_NEGATIVE_TTL,
+    collection=db.geocode_cache if GEOCODE_CACHE_PERSIST else None,
+)
+
+
+# Pooled SMTP sessions and a send queue, so alerts never block an upload
+smtp_pool = SMTPConnectionPool(
+    SMTP_HOST,
+    SMTP_PORT,
+    username=FROM_EMAIL,
+    password=EMAIL_PASSWORD,
+    size=SMTP_POOL_SIZE,
+    use_tls=SMTP_USE_TLS,
+)
+smtp_pool.send = metrics.trace("smtp_send")(smtp_pool.send)
+notifier = Notifier(
+    smtp_pool,
+    FROM_EMAIL,
+    [addr.strip() for addr in TO_EMAIL.split(",") if addr.strip()],
+    digest_window=NOTIFY_DIGEST_WINDOW,
+    digest_precision=NOTIFY_DIGEST_PRECISION or None,
+    rate_limit_per_hour=NOTIFY_RATE_LIMIT_PER_HOUR,
+    max_digest_size=NOTIFY_MAX_DIGEST_SIZE,
+    senders=SMTP_POOL_SIZE,
+)
+
 
+@metrics.trace("decode")
+def preprocess_image(source):
+    """Decode an upload at model size for TensorFlow prediction.
 
-def preprocess_image(image):
-    """Prepare image for TensorFlow model prediction."""
+    Returns the resized RGB image and its ``(1, 224, 224, 3)`` uint8 array;
+    scaling to [0, 1] happens when the inference engine fills its batch buffer.
+    """
     try:
-        img = image.convert("RGB")
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0
-        return np.expand_dims(img_array, axis=0)
+        img = decode_image(source)
+        return img, image_to_array(img)
     except Exception as e:
         logger.error(f"❌ Image preprocessing failed: {e}")
         raise
 
 
-def validate_file(file):
-    """Validate the uploaded file."""
-    allowed_types = ["image/jpeg", "image/png", "image/jpg"]
-    max_size = 5 * 1024 * 1024  # 5MB
-
-    if file.content_type not in allowed_types:
-        return False, "Invalid file type. Only JPEG, PNG, and JPG are allowed."
-    if file.content_length > max_size:
-        return False, "File size exceeds the maximum limit of 5MB."
-    return True, None
+def validate_file(buffer):
+    """Validate the uploaded file by its magic bytes; returns ((mime, ext), error)."""
+    kind = sniff_image_type(buffer)
+    if not kind:
+        return None, "Invalid file type. Only JPEG, PNG, and JPG are allowed."
+    return kind, None
 
 
 # User Management Functions
+# bcrypt runs on its own small pool; login bursts get a 503 instead of stalling uploads
+password_hasher = PasswordHasher(max_workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, rounds=BCRYPT_ROUNDS)
+auth_tokens = TokenService(
+    JWT_SECRET, access_ttl=ACCESS_TOKEN_TTL, refresh_ttl=REFRESH_TOKEN_TTL, cache_size=TOKEN_CACHE_SIZE
+)
+
+
 def create_user(email, password):
     """Create a new user in MongoDB."""
-    if db.users.find_one({"email": email}):
-        return None  # User already exists
+    if repository.find_user_by_email(email, {"_id": 1}):
+        return None  # User already exists; skip the bcrypt work
 
-    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-    result = db.users.insert_one(
-        {
-            "email": email,
-            "password": hashed,
-            "created_at": datetime.now().isoformat(),
-            "role": "user",
-        }
-    )
-    return str(result.inserted_id)
+    # The unique email index settles two registrations racing past the check
+    return repository.create_user(email, password_hasher.hash(password))
+
+
+def session_user(user):
+    """The fields of a user document that go into session tokens."""
+    return {
+        "id": str(user["_id"]),
+        "email": user["email"],
+        "role": user.get("role", "user"),
+        "session_version": user.get("session_version", 0),
+    }
 
 
 def authenticate_user(email, password):
     """Authenticate a user."""
-    user = db.users.find_one({"email": email})
-    if user and bcrypt.checkpw(password.encode("utf-8"), user["password"]):
-        return {
-            "id": str(user["_id"]),
-            "email": user["email"],
-            "role": user.get("role", "user"),
+    user = repository.find_user_by_email(email, {"email": 1, "password": 1, "role": 1, "session_version": 1})
+    if not password_hasher.check(password, user["password"] if user else None):
+        return None
+    if password_hasher.needs_rehash(user["password"]):
+        # Move the stored hash to the configured cost while the password is at hand
+        repository.set_password(user["_id"], password_hasher.hash(password))
+    return session_user(user)
+
+
+def bearer_token():
+    header = request.headers.get("Authorization", "")
+    return header[7:].strip() if header[:7].lower() == "bearer " else None
+
+
+def role_required(*roles):
+    """Require a valid access token, and one of ``roles`` if any are given; the claims go to ``g.user``."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                claims = auth_tokens.verify(bearer_token(), ACCESS)
+            except InvalidToken as e:
+                return jsonify({"error": str(e)}), 401, {"WWW-Authenticate": "Bearer"}
+            if roles and claims.get("role") not in roles:
+                return jsonify({"error": "Insufficient permissions"}), 403
+            g.user = claims
+            return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Background Jobs
+def store_dead_letter(job, error):
+    """Persist a job that exhausted its retries so it can be inspected or replayed."""
+    db.dead_letters.insert_one(
+        {
+            "job": job.name,
+            # Raw image bytes are not worth keeping in the dead-letter store
+            "args": [f"<{len(a)} bytes>" if isinstance(a, bytes) else a for a in job.args],
+            "error": str(error),
+            "attempts": job.attempts,
+            "created_at": job.created_at,
+            "failed_at": utc_now(),
         }
-    return None
+    )
+
+
+job_pipeline = JobPipeline(
+    num_workers=JOB_WORKERS,
+    max_queue_size=JOB_QUEUE_SIZE,
+    max_retries=JOB_MAX_RETRIES,
+    dead_letter=store_dead_letter,
+)
+
+
+def serialize_detection(detection):
+    """Convert a detection document into its JSON-serializable API form."""
+    detection = {key: to_iso(value) for key, value in detection.items()}
+    detection["id"] = str(detection.pop("_id"))
+    return detection
+
+
+def broadcast_changes(batch):
+    """Send each room only its share of a change-feed batch."""
+    emitted_at = time.time()  # lets clients (and the load test) measure fan-out latency
+    for targets, changes in route_changes(batch["changes"], SOCKETIO_REGION_PRECISION).items():
+        # A list of rooms is one emit: a client in several of them gets it once
+        to = list(targets) if targets else None
+        socketio.emit("detections_changed", {**batch, "changes": changes, "emitted_at": emitted_at}, to=to)
+
+
+# Ordered log of detection changes: dashboards catch up with since=<token> and get coalesced broadcasts
+change_feed = ChangeFeed(
+    db,
+    "detections",
+    serialize_detection,
+    on_batch=broadcast_changes,
+    mode=CHANGE_FEED_MODE,
+    poll_interval=CHANGE_FEED_INTERVAL_MS / 1000,
+    retention_seconds=CHANGE_FEED_RETENTION_HOURS * 3600,
+)
+
+
+# Dashboard counts kept up to date on every write instead of recomputed from the full list
+analytics = AnalyticsRollups(
+    repository.detections,
+    repository.collection("detection_rollups", WriteConcern(w=1)),  # rebuilt from the detections anyway
+    cell_precision=ANALYTICS_CELL_PRECISION,
+    cache_ttl=ANALYTICS_CACHE_TTL,
+    rebuild_interval=ANALYTICS_REBUILD_INTERVAL,
+)
+
+
+def store_image(sha256, ext, data):
+    """Persist an upload, render its thumbnail/medium derivatives and link them from its detections."""
+    with metrics.stage("disk_write"):
+        image_store.save(sha256, ext, data)
+    with metrics.stage("derivatives"):
+        build_derivatives(image_store, sha256, data)
+    derivatives = derivative_urls(sha256)
+    updated = repository.set_derivatives(sha256, derivatives["thumb"]["webp"], derivatives)
+    if updated:
+        change_feed.record_many(UPSERT, updated)
+
+
+def derivative_urls(sha256):
+    """Public URLs of an upload's derivatives, keyed by size then format."""
+    return {
+        name: {ext: UPLOAD_URL + path for ext, path in formats.items()}
+        for name, formats in derivative_paths(image_store, sha256).items()
+    }
+
+
+def classify(output):
+    """Turn a model output row into ``(label, confidence)``."""
+    class_idx = np.argmax(output)
+    class_label = "Garbage" if class_idx == 1 else "Clean"
+    return class_label, float(output[class_idx])
+
+
+def build_detection(
+    lat, lon, sha256, phash, image_url, class_label, confidence, model_version=None, source="user_upload"
+):
+    """Assemble a new detection document; the address is filled in by a follow-up job.
+
+    Until ``store_image`` has rendered the derivatives, ``thumbnail_url``
+    falls back to the original image and ``derivatives`` is None.
+    """
+    derivatives = derivative_urls(sha256) if derivatives_exist(image_store, sha256) else None
+    return {
+        "_id": ObjectId(),
+        "prediction": class_label,
+        "confidence": confidence,
+        "model_version": model_version,
+        "latitude": lat,
+        "longitude": lon,
+        "location": geojson_point(lat, lon),
+        "geohash": detection_geohash(lat, lon),
+        "location_name": None,
+        "image_url": image_url,
+        "thumbnail_url": derivatives["thumb"]["webp"] if derivatives else image_url,
+        "derivatives": derivatives,
+        "timestamp": utc_now(),
+        "status": "pending",
+        "source": source,
+        "sha256": sha256,
+        "phash": phash,
+    }
+
+
+def detection_response(detection, **extra):
+    """Build the /upload response body for a detection."""
+    return {
+        "prediction": detection["prediction"],
+        "confidence": detection["confidence"],
+        "latitude": detection["latitude"],
+        "longitude": detection["longitude"],
+        "location_name": detection.get("location_name"),
+        "timestamp": to_iso(detection["timestamp"]),
+        "id": str(detection["_id"]),
+        "image_url": detection["image_url"],
+        "thumbnail_url": detection.get("thumbnail_url"),
+        **extra,
+    }
+
+
+@metrics.trace("dedup_lookup")
+def find_duplicate_upload(sha256, lat, lon):
+    """Return the cached prediction for identical image bytes, if any.
+
+    The second value is the existing detection when it was reported at
+    the same place (a client retry or a re-upload), otherwise None.
+    """
+    cached = find_exact(db.image_hashes, sha256)
+    if cached and cached.get("model_version") != model_registry.active_version:
+        # Scored by another model version: keep the stored file, score the image again
+        cached["stale"] = True
+    if not cached:
+        return None, None
+    existing = repository.detections.find_one({"_id": cached["detection_id"]})
+    if existing and haversine_meters(lat, lon, existing["latitude"], existing["longitude"]) <= DEDUP_RADIUS_METERS:
+        return cached, existing
+    return cached, None
+
+
+def find_chunk_duplicate(entry, pending):
+    """An earlier, not yet inserted detection of the same chunk that ``entry`` repeats, and how ("exact" or "near")."""
+    for detection in pending:
+        distance = haversine_meters(entry["lat"], entry["lon"], detection["latitude"], detection["longitude"])
+        if distance > DEDUP_RADIUS_METERS:
+            continue
+        if detection["sha256"] == entry["sha256"]:
+            return detection, "exact"
+        if (
+            DEDUP_MERGE_NEAR_DUPLICATES
+            and hamming_distance(detection["phash"], entry["phash"]) <= DEDUP_PHASH_MAX_DISTANCE
+        ):
+            return detection, "near"
+    return None, None
+
+
+def merge_near_duplicate(existing):
+    """Count a near-duplicate report against an existing detection."""
+    repository.count_report(existing["_id"])
+    change_feed.record(UPSERT, existing["_id"])
+
+
+def persist_detection(detection_data, shadow=None):
+    """Insert the detection, then queue location enrichment and notification.
+
+    ``shadow`` is a sampled ShadowRun; its comparison with the served
+    prediction is stored on the detection.
+    """
+    if shadow:
+        with metrics.stage("shadow_wait"):
+            record = shadow.record(detection_data["prediction"], detection_data["confidence"])
+        if record:
+            detection_data["shadow"] = record
+    with metrics.stage("mongo_insert"):
+        inserted = repository.insert_detection(detection_data)
+    if inserted:
+        analytics.apply(after=detection_data)
+    # Otherwise already stored by an earlier attempt
+    logger.info(f"📝 Stored detection {detection_data['_id']}")
+    publish_detection(detection_data)
+
+
+def publish_detection(detection_data):
+    """Cache the prediction, log the change for live clients and queue enrichment for a stored detection."""
+    sha256 = detection_data.get("sha256")
+    if sha256:
+        remember(db.image_hashes, sha256, detection_data)
+        # Derivatives rendered after build_detection but before the insert were linked to no document
+        if detection_data.get("derivatives") is None and derivatives_exist(image_store, sha256):
+            derivatives = derivative_urls(sha256)
+            repository.set_derivatives(sha256, derivatives["thumb"]["webp"], derivatives)
+            detection_data.update(thumbnail_url=derivatives["thumb"]["webp"], derivatives=derivatives)
+
+    change_feed.record(UPSERT, detection_data["_id"])
+    job_pipeline.enqueue(
+        "enrich_detection",
+        enrich_detection,
+        detection_data["_id"],
+        on_failure=lambda job, error: queue_notification(detection_data),
+    )
+
+
+def enrich_detection(detection_id):
+    """Fill in the human-readable address and push the updated detection to clients."""
+    detection = repository.detections.find_one({"_id": detection_id})
+    if not detection:
+        return
+
+    with metrics.stage("geocode"):
+        # A retry asks the geocoder again instead of reading back the failure cached by the last attempt
+        location_name = geocode_cache.get(
+            detection["latitude"], detection["longitude"], allow_negative=(current_attempt() or 1) <= 1
+        )
+    if location_name is None:
+        raise RuntimeError("Location lookup failed")
+    logger.info(f"📍 Location: {location_name}")
+
+    repository.set_location_name(detection_id, location_name)
+    analytics.apply(detection, {**detection, "location_name": location_name})
+    detection["location_name"] = location_name
+    change_feed.record(UPSERT, detection_id)
+    queue_notification(detection)
+
+
+def queue_notification(detection):
+    """Queue the alert email for garbage detections, with or without an address."""
+    if detection["prediction"] == "Garbage":
+        notifier.notify(detection)
 
 
 # Routes
+# Startup
+def build_model(manifest, shadow=False):
+    """Load, warm up and start a micro-batching inference engine for one registry version.
+
+    A shadow model gets a single worker process (or its own engine thread
+    in-process) so it never takes capacity from the serving model.
+    """
+    version = manifest["version"]
+    runtime_kwargs = model_registry.runtime_kwargs(manifest)
+    if INFERENCE_WORKERS > 0:
+        # Each worker process loads and warms up its own model; TensorFlow stays out of this process
+        with startup.phase(f"{version}:worker_pool"):
+            pool = InferenceWorkerPool(
+                manifest["runtime"],
+                runtime_kwargs,
+                num_workers=1 if shadow else INFERENCE_WORKERS,
+                max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                warmup_batch_sizes=INFERENCE_WARMUP_BATCH_SIZES,
+            )
+            pool.start()
+            if not pool.wait_ready(INFERENCE_STARTUP_TIMEOUT):
+                pool.stop()
+                raise RuntimeError(f"Inference workers for {version} not ready after {INFERENCE_STARTUP_TIMEOUT:.0f}s")
+        engine = BatchInferenceEngine(
+            metrics.trace("model_predict")(pool.predict),
+            max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=INFERENCE_MAX_WAIT_MS,
+            dispatch_threads=pool.capacity,
+        )
+    else:
+        pool = None
+        with startup.phase("import_runtime"):
+            from runtimes import load_runtime
+
+        with startup.phase(f"{version}:load_model"):
+            model = load_runtime(manifest["runtime"], **runtime_kwargs)
+            logger.info(f"✅ Model {version} loaded successfully")
+
+        batch_buffer = BatchBuffer(INFERENCE_MAX_BATCH_SIZE)
+        blank = np.zeros((1, IMG_SIZE[1], IMG_SIZE[0], 3), dtype=np.uint8)
+        with startup.phase(f"{version}:warmup"):
+            timings = warm_up(model.predict, lambda n: batch_buffer.fill([blank] * n), INFERENCE_WARMUP_BATCH_SIZES)
+        if not shadow:
+            startup.warmup = timings
+        engine = BatchInferenceEngine(
+            metrics.trace("model_predict")(model.predict),
+            max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+            max_wait_ms=INFERENCE_MAX_WAIT_MS,
+            batch_buffer=batch_buffer,
+        )
+
+    engine.start()
+    return LoadedModel(version, engine, pool)
+
+
+# Versioned models: activating one swaps it in without dropping requests
+model_registry = ModelRegistry(MODEL_REGISTRY_DIR, build=build_model, classify=classify, baseline=BASELINE_MANIFEST)
+
+
+def run_migrations():
+    """Convert leftover string timestamps and backfill GeoJSON locations in the
+    background, then start the rollups that bucket them."""
+    started = time.perf_counter()
+    try:
+        repository.migrate_timestamps()
+        logger.info(f"⏱️ Timestamp migration took {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"❌ Failed to convert string timestamps: {e}")
+    try:
+        backfill_locations(repository.detections)
+    except Exception as e:
+        logger.error(f"❌ Failed to backfill detection locations: {e}")
+    analytics.start()
+
+
+def load_inference():
+    """Create indexes, then activate the current model version (runs on the startup thread)."""
+    with startup.phase("indexes"):
+        try:
+            repository.ensure_indexes()
+            change_feed.ensure_indexes()
+            analytics.ensure_indexes()
+            geocode_cache.ensure_indexes()
+        except Exception as e:
+            logger.error(f"❌ Failed to create detection indexes: {e}")
+
+    model_registry.activate(model_registry.startup_version(), persist=False)
+
+    if SHADOW_MODEL_VERSION:
+        # A broken shadow model must not keep the app from serving
+        try:
+            model_registry.set_shadow(SHADOW_MODEL_VERSION, SHADOW_SAMPLE_RATE)
+        except Exception as e:
+            logger.error(f"❌ Failed to load shadow model {SHADOW_MODEL_VERSION}: {e}")
+
+
+services_started = False
+
+
+def start_services():
+    """Start the background workers and begin loading the model; only the first call does anything."""
+    global services_started
+    if services_started:
+        return
+    services_started = True
+    with startup.phase("workers"):
+        job_pipeline.start()
+        notifier.start()
+        change_feed.start()
+    # Neither readiness nor the model waits for this: a large collection can take a while to convert
+    threading.Thread(target=run_migrations, name="migrations", daemon=True).start()
+    startup.run_in_background(load_inference)
+
+
+@app.before_request
+def ensure_services_started():
+    # WSGI servers import the app without running __main__
+    start_services()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern, not path, so detection ids do not explode the series count
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    http_requests.inc(route=route, method=request.method, status=response.status_code)
+    if "request_started" in g:
+        http_latency.observe(time.perf_counter() - g.request_started, route=route)
+    return response
+
+
+def model_unavailable():
+    """Error response while the model is still loading or failed to load, otherwise None."""
+    if startup.ready:
+        return None
+    if startup.state == "failed":
+        return jsonify({"error": "Model not loaded"}), 500
+    return jsonify({"error": "Model is still loading, please retry"}), 503, {"Retry-After": "5"}
+
+
 @app.route("/api/register", methods=["POST"])
 def register():
     """User registration."""
@@ -188,7 +810,10 @@ def register():
     if not email or not password:
         return jsonify({"error": "Email and password required"}), 400
 
-    user_id = create_user(email, password)
+    try:
+        user_id = create_user(email, password)
+    except HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
     if user_id:
         return jsonify({"message": "User registered successfully"}), 201
     return jsonify({"error": "User already exists"}), 409
@@ -201,7 +826,13 @@ def login():
     email = data.get("email")
     password = data.get("password")
 
-    user = authenticate_user(email, password)
+    if not email or not password:
+        return jsonify({"error": "Email and password required"}), 400
+
+    try:
+        user = authenticate_user(email, password)
+    except HasherBusy as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
     if user:
         return (
             jsonify(
@@ -210,7 +841,8 @@ def login():
                         "id": user["id"],
                         "email": user["email"],
                         "role": user["role"],
-                    }
+                    },
+                    **auth_tokens.issue(user),
                 }
             ),
             200,
@@ -218,6 +850,30 @@ def login():
     return jsonify({"error": "Invalid credentials"}), 401
 
 
+@app.route("/api/token/refresh", methods=["POST"])
+def refresh_token():
+    """Exchange a refresh token for a new token pair, picking up role changes."""
+    token = (request.get_json(silent=True) or {}).get("refresh_token")
+    try:
+        claims = auth_tokens.verify(token, REFRESH)
+    except InvalidToken as e:
+        return jsonify({"error": str(e)}), 401
+    user = repository.find_user(claims["sub"], {"email": 1, "role": 1, "session_version": 1})
+    if not user or user.get("session_version", 0) != claims.get("ver", 0):
+        return jsonify({"error": "Session ended, please log in again"}), 401
+    user = session_user(user)
+    body = {"user": {key: user[key] for key in ("id", "email", "role")}, **auth_tokens.issue(user, refreshed=True)}
+    return jsonify(body), 200
+
+
+@app.route("/api/logout", methods=["POST"])
+@role_required()
+def logout():
+    """End every session of the user: their refresh tokens stop working, access tokens run out."""
+    repository.end_sessions(g.user["sub"])
+    return jsonify({"message": "Logged out"}), 200
+
+
 @app.route("/upload", methods=["POST"])
 @limiter.limit("1000 per minute")
 def upload_image():
@@ -227,9 +883,16 @@ def upload_image():
 
     image_file = request.files["image"]
 
-    # Validate file type and size
-    is_valid, error_message = validate_file(image_file)
-    if not is_valid:
+    # Read the upload once, hashing it and enforcing the size limit as it streams in
+    try:
+        with metrics.stage("read_upload"):
+            buffer, sha256 = read_upload(image_file.stream)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+
+    # Validate file type from its content
+    kind, error_message = validate_file(buffer)
+    if not kind:
         return jsonify({"error": error_message}), 400
 
     try:
@@ -240,114 +903,690 @@ def upload_image():
         if lat is None or lon is None:
             logger.error("❌ Latitude and longitude are required")
             return jsonify({"error": "Latitude and longitude are required"}), 400
+        if not valid_coordinates(lat, lon):
+            return jsonify({"error": "Latitude or longitude out of range"}), 400
+
+        # Identical bytes reuse the cached prediction
+        cached, existing = find_duplicate_upload(sha256, lat, lon)
+        if existing:
+            logger.info(f"♻️ Duplicate upload of detection {existing['_id']}")
+            return jsonify(detection_response(existing, duplicate="exact"))
+
+        img, img_array = preprocess_image(buffer)
+        with metrics.stage("phash"):
+            phash = perceptual_hash(img)
+
+        if not cached and DEDUP_MERGE_NEAR_DUPLICATES:
+            with metrics.stage("near_duplicate"):
+                similar = find_near_duplicate(
+                    repository.detections, lat, lon, phash, DEDUP_RADIUS_METERS, DEDUP_PHASH_MAX_DISTANCE
+                )
+            if similar:
+                merge_near_duplicate(similar)
+                logger.info(f"♻️ Merged near-duplicate into detection {similar['_id']}")
+                return jsonify(detection_response(similar, duplicate="near"))
+
+        shadow = None
+        if cached and not cached.get("stale"):
+            # Same photo reported somewhere else: skip both the disk write and TensorFlow
+            image_url = cached["image_url"]
+            class_label = cached["prediction"]
+            confidence = cached["confidence"]
+            model_version = cached["model_version"]
+        else:
+            if cached:
+                image_url = cached["image_url"]
+            else:
+                # Persist the file in the background under its content hash; getvalue()
+                # hands over the request buffer's own bytes rather than a copy
+                ext = kind[1]
+                if not job_pipeline.enqueue("store_image", store_image, sha256, ext, buffer.getvalue()):
+                    return jsonify({"error": "Server busy, please retry"}), 503
+
+                # Generate the permanent image URL
+                image_url = UPLOAD_URL + image_store.relative_path(sha256, ext)
+
+            unavailable = model_unavailable()
+            if unavailable:
+                return unavailable
+
+            # Make prediction (batched with other concurrent uploads); includes the wait for a batch slot
+            started = time.perf_counter()
+            with metrics.stage("predict"):
+                output, model_version = model_registry.predict(img_array)
+            class_label, confidence = classify(output)
+            shadow = model_registry.shadow(img_array, (time.perf_counter() - started) * 1000)
+
+        # Store data in MongoDB in the background; the address and the
+        # email notification are filled in by follow-up jobs
+        detection_data = build_detection(lat, lon, sha256, phash, image_url, class_label, confidence, model_version)
+        if not job_pipeline.enqueue("persist_detection", persist_detection, detection_data, shadow=shadow):
+            return jsonify({"error": "Server busy, please retry"}), 503
+        predictions.inc(prediction=class_label, model_version=model_version, source="user_upload")
+
+        return jsonify(detection_response(detection_data))
+
+    except Overloaded as e:
+        logger.warning(f"⚠️ Inference overloaded: {e}")
+        return jsonify({"error": "Server busy, please retry"}), 503
+    except Exception as e:
+        logger.error(f"❌ Processing error: {e}")
+        return jsonify({"error": "Image processing failed"}), 500
 
-        # Get human-readable address
-        location_name = get_location_name(lat, lon)
-        logger.info(f"📍 Location: {location_name}")
-
-        # Save the uploaded file
-        filename = secure_filename(image_file.filename)
-        filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-        image_file.save(filepath)
-        logger.info(f"📤 Saved file: {filepath}")
-
-        # Generate the permanent image URL
-        image_url = f"http://localhost:5000/uploads/{filename}"
-
-        # Open and preprocess the image
-        img = Image.open(filepath)
-        img_array = preprocess_image(img)
-
-        if not model:
-            return jsonify({"error": "Model not loaded"}), 500
-
-        # Make prediction
-        prediction = model.predict(img_array)
-        class_idx = np.argmax(prediction)
-        class_label = "Garbage" if class_idx == 1 else "Clean"
-        confidence = float(prediction[0][class_idx])
-
-        # Store data in MongoDB
-        detection_data = {
-            "prediction": class_label,
-            "confidence": confidence,
-            "latitude": lat,
-            "longitude": lon,
-            "location_name": location_name,
-            "image_url": image_url,
-            "timestamp": datetime.now().isoformat(),
-            "status": "pending",
-            "source": "user_upload",
-        }
-        result = db.detections.insert_one(detection_data)
-        detection_data["_id"] = str(result.inserted_id)
-
-        # Convert to JSON-serializable format
-        response_data = {
-            "prediction": detection_data["prediction"],
-            "confidence": detection_data["confidence"],
-            "latitude": detection_data["latitude"],
-            "longitude": detection_data["longitude"],
-            "location_name": detection_data["location_name"],
-            "timestamp": detection_data["timestamp"],
-            "id": detection_data["_id"],
-            "image_url": image_url,
-        }
 
-        if class_label == "Garbage":
-            email_body = (
-                "🚨 Garbage Detected 🚨\n\n"
-                f"Confidence: {confidence:.2%}\n"
-                f"Coordinates: {lat:.6f}, {lon:.6f}\n"
-                f"Address: {location_name or 'Unknown location'}\n"
-                f"Timestamp: {detection_data['timestamp']}\n"
+def batch_result(item, status, **extra):
+    """Per-item entry of a /upload/batch response."""
+    return {"index": item.index, "filename": item.filename, "status": status, **extra}
+
+
+@metrics.trace("ingest_chunk")
+def ingest_chunk(chunk, manifest, seen, decode_pool):
+    """Validate, dedup, decode and score one model-sized chunk of a batch upload.
+
+    ``seen`` maps content hashes already scored earlier in the batch to
+    their prediction, so repeated frames skip TensorFlow. Frames repeating
+    one earlier in the chunk at the same place are counted as reports of
+    it, like duplicates of stored detections. Returns the per-item results
+    keyed by index and ``(item, detection)`` pairs to insert.
+    """
+    results = {}
+    entries = []
+    for item in chunk:
+        if item.error:
+            results[item.index] = batch_result(item, "error", error=item.error)
+            continue
+        coords = lookup_coordinates(manifest, item.filename)
+        if coords is None:
+            results[item.index] = batch_result(item, "error", error="No coordinates in manifest")
+            continue
+        lat, lon = coords
+        if not valid_coordinates(lat, lon):
+            results[item.index] = batch_result(item, "error", error="Latitude or longitude out of range")
+            continue
+        kind = sniff_image_type(io.BytesIO(item.data))
+        if not kind:
+            results[item.index] = batch_result(
+                item, "error", error="Invalid file type. Only JPEG, PNG, and JPG are allowed."
             )
-            send_email("Garbage Detection Alert", email_body)
-            socketio.emit("new_detection", response_data)  # Emit WebSocket event
-
-        return jsonify(response_data)
+            continue
+
+        sha256 = hashlib.sha256(item.data).hexdigest()
+        cached, existing = find_duplicate_upload(sha256, lat, lon)
+        if existing:
+            results[item.index] = batch_result(item, "duplicate", **detection_response(existing, duplicate="exact"))
+            continue
+        entries.append(
+            {
+                "item": item,
+                "lat": lat,
+                "lon": lon,
+                "ext": kind[1],
+                "sha256": sha256,
+                "cached": cached,
+                "decoded": decode_pool.submit(preprocess_image, item.data),
+            }
+        )
 
+    # Decoding runs in the pool while the loop above is still hashing and
+    # looking up later items; submit each new image to the inference engine
+    # as soon as it is decoded so the chunk fills one model batch
+    scoring = {}
+    for entry in entries:
+        item = entry["item"]
+        try:
+            img, img_array = entry["decoded"].result()
+        except Exception as e:
+            results[item.index] = batch_result(item, "error", error=f"Image processing failed: {e}")
+            entry["skip"] = True
+            continue
+        entry["phash"] = perceptual_hash(img)
+
+        if not entry["cached"] and DEDUP_MERGE_NEAR_DUPLICATES:
+            similar = find_near_duplicate(
+                repository.detections, entry["lat"], entry["lon"], entry["phash"], DEDUP_RADIUS_METERS, DEDUP_PHASH_MAX_DISTANCE
+            )
+            if similar:
+                merge_near_duplicate(similar)
+                results[item.index] = batch_result(item, "duplicate", **detection_response(similar, duplicate="near"))
+                entry["skip"] = True
+                continue
+
+        sha256 = entry["sha256"]
+        cached = entry["cached"]
+        if (cached and not cached.get("stale")) or sha256 in seen or sha256 in scoring:
+            continue
+        if not cached and not job_pipeline.enqueue("store_image", store_image, sha256, entry["ext"], item.data):
+            results[item.index] = batch_result(item, "error", error="Server busy, please retry")
+            entry["skip"] = True
+            continue
+        try:
+            scoring[sha256] = model_registry.submit(img_array)
+        except Overloaded:
+            results[item.index] = batch_result(item, "error", error="Server busy, please retry")
+            entry["skip"] = True
+
+    detections = []
+    for entry in entries:
+        item = entry["item"]
+        if entry.get("skip"):
+            continue
+        # Earlier frames of the chunk are not stored yet, so the lookups above cannot see them
+        original, duplicate = find_chunk_duplicate(entry, [detection for _, detection in detections])
+        if original:
+            original["report_count"] = original.get("report_count", 0) + 1
+            original["last_reported_at"] = utc_now()
+            results[item.index] = batch_result(item, "duplicate", **detection_response(original, duplicate=duplicate))
+            continue
+        sha256 = entry["sha256"]
+        cached = entry["cached"]
+        if cached and not cached.get("stale"):
+            image_url, class_label, confidence = cached["image_url"], cached["prediction"], cached["confidence"]
+            model_version = cached["model_version"]
+        elif sha256 in seen:
+            image_url, class_label, confidence, model_version = seen[sha256]
+        else:
+            try:
+                if sha256 not in scoring:
+                    raise RuntimeError("Scoring was skipped for this image")
+                future, model_version = scoring[sha256]
+                class_label, confidence = classify(future.result(timeout=30.0))
+            except Exception as e:
+                results[item.index] = batch_result(item, "error", error=f"Prediction failed: {e}")
+                continue
+            image_url = cached["image_url"] if cached else UPLOAD_URL + image_store.relative_path(sha256, entry["ext"])
+            seen[sha256] = (image_url, class_label, confidence, model_version)
+
+        detection = build_detection(
+            entry["lat"],
+            entry["lon"],
+            sha256,
+            entry["phash"],
+            image_url,
+            class_label,
+            confidence,
+            model_version,
+            source="batch_upload",
+        )
+        detections.append((item, detection))
+        predictions.inc(prediction=class_label, model_version=model_version, source="batch_upload")
+    return results, detections
+
+
+def insert_detections(detections):
+    """Write a chunk of detections with one ``insert_many``; returns ``{position: error}`` for rejected rows."""
+    with metrics.stage("mongo_insert_many"):
+        failed = repository.insert_detections(detections)
+    analytics.record_many([detection for position, detection in enumerate(detections) if position not in failed])
+    return failed
+
+
+@app.route("/upload/batch", methods=["POST"])
+@limiter.limit("60 per minute")
+def upload_batch():
+    """Ingest many geotagged images at once, as multipart files or a zip/tar archive.
+
+    Coordinates come from a ``manifest`` field or file (JSON or CSV keyed
+    by filename). Images are decoded and scored in model-sized chunks,
+    each chunk is written with a single ``insert_many``, and every image
+    gets its own result, so one bad frame never fails the whole batch.
+    """
+    manifest_source = request.files.get("manifest")
+    manifest_text = manifest_source.read().decode("utf-8-sig") if manifest_source else request.form.get("manifest", "")
+    try:
+        manifest = parse_manifest(manifest_text)
+    except ManifestError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if "archive" in request.files:
+        items = iter_archive(request.files["archive"].stream, MAX_UPLOAD_BYTES, BATCH_MAX_ITEMS)
+    elif "images" in request.files:
+        items = iter_files(request.files.getlist("images"), MAX_UPLOAD_BYTES, BATCH_MAX_ITEMS)
+    else:
+        return jsonify({"error": "Provide an 'archive' file or one or more 'images'"}), 400
+
+    unavailable = model_unavailable()
+    if unavailable:
+        return unavailable
+
+    results = {}
+    seen = {}
+    try:
+        with ThreadPoolExecutor(BATCH_DECODE_THREADS, thread_name_prefix="batch-decode") as decode_pool:
+            for chunk in chunked(items, INFERENCE_MAX_BATCH_SIZE):
+                chunk_results, detections = ingest_chunk(chunk, manifest, seen, decode_pool)
+                results.update(chunk_results)
+                failed = insert_detections([detection for _, detection in detections])
+                for position, (item, detection) in enumerate(detections):
+                    if position in failed:
+                        results[item.index] = batch_result(item, "error", error=failed[position])
+                        continue
+                    publish_detection(detection)
+                    results[item.index] = batch_result(item, "created", **detection_response(detection))
+    except ValueError as e:
+        # An unreadable archive: report it, along with anything stored before it broke
+        logger.error(f"❌ Batch upload stopped early: {e}")
+        if not results:
+            return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"❌ Processing error: {e}")
-        return jsonify({"error": "Image processing failed"}), 500
+        logger.error(f"❌ Batch processing error: {e}")
+        return jsonify({"error": "Batch processing failed"}), 500
+
+    if not results:
+        return jsonify({"error": "No images found in the upload"}), 400
+
+    items = [results[index] for index in sorted(results)]
+    summary = {"received": len(items)}
+    for status in ("created", "duplicate", "error"):
+        summary[status] = sum(1 for item in items if item["status"] == status)
+    logger.info(
+        f"📤 Batch upload: {summary['created']} created, {summary['duplicate']} duplicates, {summary['error']} failed"
+    )
+
+    # 207 Multi-Status when only some images made it in
+    if not summary["error"]:
+        status_code = 200
+    elif summary["error"] < summary["received"]:
+        status_code = 207
+    else:
+        status_code = 422
+    return jsonify({"items": items, "summary": summary}), status_code
 
 
 @app.route("/api/detections", methods=["GET"])
+@role_required()
 def get_detections():
-    """Fetch all detections."""
+    """Fetch one page of detections, newest first.
+
+    Query parameters: ``limit``, ``cursor`` (from the previous page's
+    ``next_cursor``), ``fields`` (comma-separated projection) and the
+    ``status``, ``prediction``, ``since``, ``until`` and ``bbox`` filters.
+    ``changes_token`` is where /api/detections/changes picks up afterwards.
+    """
     try:
-        detections = list(db.detections.find({}))
-        for detection in detections:
-            detection["id"] = str(detection["_id"])
-            del detection["_id"]  # Convert ObjectId to string
-        return jsonify(detections), 200
+        # Read the token first: every change up to it is reflected in the page
+        changes_token = change_feed.head()
+        detections, next_cursor = fetch_detection_page(repository.detections, request.args)
+        items = [serialize_detection(detection) for detection in detections]
+        return jsonify({"items": items, "next_cursor": next_cursor, "changes_token": changes_token}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"❌ Failed to fetch detections: {e}")
         return jsonify({"error": "Failed to fetch detections"}), 500
 
 
+@app.route("/api/detections/changes", methods=["GET"])
+@role_required()
+def get_detection_changes():
+    """Detections created, updated or deleted after ``since``, one entry per detection.
+
+    Returns ``changes``, the ``token`` to pass as ``since`` next time and
+    ``has_more``. ``region`` (comma-separated geohash cells) keeps only
+    changes in those cells, like the Socket.IO region rooms. 410 means the
+    token is too old and the client should reload the list from /api/detections.
+    """
+    try:
+        limit = parse_limit(request.args.get("limit") or str(MAX_PAGE_SIZE))
+        batch = change_feed.changes_since(request.args.get("since"), limit)
+        if request.args.get("region"):
+            cells = parse_regions(request.args["region"], SOCKETIO_REGION_PRECISION)
+            batch["changes"] = filter_changes(batch["changes"], cells, SOCKETIO_REGION_PRECISION)
+        return jsonify(batch), 200
+    except ChangeLogExpired as e:
+        return jsonify({"error": str(e), "token": change_feed.head()}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch detection changes: {e}")
+        return jsonify({"error": "Failed to fetch detection changes"}), 500
+
+
+@app.route("/api/detections/export", methods=["GET"])
+@role_required()
+def export_detections():
+    """Stream detections matching the list filters as NDJSON or CSV.
+
+    ``format`` is ``ndjson`` (default) or ``csv``; ``gzip=1`` compresses the
+    stream on the fly. Rows are read from a batched cursor, so memory use
+    stays flat regardless of the collection size.
+    """
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        return jsonify({"error": "Invalid format. Use ndjson or csv."}), 400
+
+    try:
+        query = build_detection_filter(request.args)
+        projection = build_projection(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = repository.detections.find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    records = (serialize_detection(detection) for detection in cursor)
+
+    if export_format == "csv":
+        fields = CSV_FIELDS
+        if projection:
+            fields = ["id"] + [f for f in projection if f != "_id"]
+        chunks, mimetype = iter_csv(records, fields), "text/csv"
+    else:
+        chunks, mimetype = iter_ndjson(records), "application/x-ndjson"
+
+    headers = {
+        "Content-Disposition": f"attachment; filename=detections.{export_format}"
+    }
+    if request.args.get("gzip") in ("1", "true"):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+
+@app.route("/api/detections/near", methods=["GET"])
+@role_required()
+def get_detections_near():
+    """Fetch detections within ``radius`` meters of ``lat``/``lon``, nearest first."""
+    lat = request.args.get("lat", type=float)
+    lon = request.args.get("lon", type=float)
+    radius = request.args.get("radius", default=500.0, type=float)
+    if lat is None or lon is None or not valid_coordinates(lat, lon):
+        return jsonify({"error": "Valid lat and lon are required"}), 400
+    if not 0 < radius <= MAX_RADIUS_METERS:
+        return jsonify({"error": f"radius must be between 0 and {MAX_RADIUS_METERS:.0f} meters"}), 400
+    if request.args.get("bbox"):
+        return jsonify({"error": "bbox cannot be combined with lat/lon/radius"}), 400
+
+    try:
+        query = build_detection_filter(request.args)
+        query.update(radius_query(lat, lon, radius))
+        limit = parse_limit(request.args.get("limit"))
+        detections = repository.detections.find(query, build_projection(request.args.get("fields"))).limit(limit)
+        return jsonify([serialize_detection(detection) for detection in detections]), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch nearby detections: {e}")
+        return jsonify({"error": "Failed to fetch detections"}), 500
+
+
+@app.route("/api/detections/clusters", methods=["GET"])
+@role_required()
+def get_detection_clusters():
+    """Aggregate detections into grid clusters for a map viewport.
+
+    ``bbox`` (required) is the viewport and ``zoom`` the web-map zoom level;
+    the other list filters narrow the detections that are clustered. At most
+    ``MAX_CLUSTERS`` cells are returned, largest first.
+    """
+    zoom = request.args.get("zoom", default=13, type=int)
+    if not request.args.get("bbox"):
+        return jsonify({"error": "bbox is required"}), 400
+    try:
+        query = build_detection_filter(request.args)
+        clusters = repository.detections.aggregate(cluster_pipeline(query, cluster_cell_size(zoom)))
+        return jsonify([format_cluster(cluster) for cluster in clusters]), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"❌ Failed to cluster detections: {e}")
+        return jsonify({"error": "Failed to cluster detections"}), 500
+
+
+@app.route("/api/analytics", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def get_analytics():
+    """Dashboard rollups: counts and average confidence per status and prediction.
+
+    ``totals`` covers everything; ``daily`` the last ``days`` (default 30),
+    ``hourly`` the last ``hours`` (default 48), plus ``cells`` (geohash
+    prefixes) and ``locations``. Served from a short-lived in-memory cache.
+    """
+    days = request.args.get("days", default=30, type=int)
+    hours = request.args.get("hours", default=48, type=int)
+    if not 1 <= days <= 366 or not 1 <= hours <= 24 * 14:
+        return jsonify({"error": "days must be between 1 and 366 and hours between 1 and 336"}), 400
+    try:
+        return jsonify(analytics.summary(days, hours)), 200
+    except Exception as e:
+        logger.error(f"❌ Failed to read analytics: {e}")
+        return jsonify({"error": "Failed to read analytics"}), 500
+
+
+@app.route("/api/analytics/refresh", methods=["POST"])
+@role_required(ADMIN_ROLE)
+def refresh_analytics():
+    """Recount the rollups from the detections in the background, e.g. after editing data by hand."""
+    analytics.request_rebuild()
+    return jsonify({"status": "rebuilding"}), 202
+
+
+@app.route("/api/detections/<detection_id>", methods=["GET"])
+@role_required()
+def get_detection(detection_id):
+    """Fetch one detection; the uploader polls this until the background job has filled in the address.
+
+    404 also covers a detection that was just uploaded and is still being stored.
+    """
+    try:
+        detection = repository.find_detection(detection_id)
+        if detection is None:
+            return jsonify({"error": "Detection not found"}), 404
+        return jsonify(serialize_detection(detection)), 200
+    except Exception as e:
+        logger.error(f"❌ Failed to fetch detection: {e}")
+        return jsonify({"error": "Failed to fetch detection"}), 500
+
+
 @app.route("/api/detections/<detection_id>", methods=["DELETE"])
+@role_required(ADMIN_ROLE)
 def delete_detection(detection_id):
     """Delete a detection by ID."""
     try:
-        result = db.detections.delete_one({"_id": ObjectId(detection_id)})
-        if result.deleted_count == 0:
+        deleted = repository.delete_detection(detection_id)
+        if deleted is None:
             return jsonify({"error": "Detection not found"}), 404
 
-        socketio.emit("delete_detection", detection_id)  # Notify frontend
+        analytics.apply(before=deleted)
+        change_feed.record(DELETE, ObjectId(detection_id))
         return jsonify({"message": "Detection deleted"}), 200
     except Exception as e:
         logger.error(f"❌ Failed to delete detection: {e}")
         return jsonify({"error": "Failed to delete detection"}), 500
 
 
+@app.route("/api/health/live", methods=["GET"])
+@limiter.exempt
+@talisman(force_https=False)
+def liveness():
+    """Liveness probe: the process serves requests and, once loaded, the inference threads are running."""
+    body = {"status": "alive", "startup": startup.state, "uptime_seconds": round(startup.uptime(), 1)}
+    active = model_registry.active
+    if active and not active.engine.stats()["running"]:
+        return jsonify({**body, "status": "inference stopped"}), 503
+    return jsonify(body), 200
+
+
+@app.route("/api/health/ready", methods=["GET"])
+@limiter.exempt
+@talisman(force_https=False)
+def readiness():
+    """Readiness probe: the model is loaded and warmed up, with at least one live worker in pool mode."""
+    body = startup.stats()
+    ready = startup.ready
+    active = model_registry.active
+    if active:
+        body["model_version"] = active.version
+    if active and active.pool:
+        body["ready_workers"] = active.pool.ready_workers
+        ready = ready and body["ready_workers"] > 0
+    body["ready"] = ready
+    return jsonify(body), 200 if ready else 503
+
+
+@app.route("/api/inference/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def inference_stats():
+    """Expose queue depth and batch-size histograms of the inference worker."""
+    active = model_registry.active
+    if not active:
+        return jsonify({"error": "Model not loaded"}), 503
+    stats = active.engine.stats()
+    stats["model_version"] = active.version
+    if active.pool:
+        stats["pool"] = active.pool.stats()
+    return jsonify(stats), 200
+
+
+@app.route("/api/models", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def list_models():
+    """Registered model versions, the active and shadow versions, and shadow agreement per version."""
+    return jsonify(model_registry.stats()), 200
+
+
+@app.route("/api/models/active", methods=["POST"])
+@role_required(ADMIN_ROLE)
+def activate_model():
+    """Load a registered version in the background and swap it in once it is warmed up."""
+    version = (request.get_json(silent=True) or {}).get("version")
+    try:
+        model_registry.manifest(version or "")
+    except KeyError:
+        return jsonify({"error": f"Unknown model version '{version}'"}), 404
+    if not model_registry.in_background(model_registry.activate, version):
+        return jsonify({"error": "Another model is still loading"}), 409
+    return jsonify({"status": "loading", "version": version}), 202
+
+
+@app.route("/api/models/shadow", methods=["POST"])
+@role_required(ADMIN_ROLE)
+def shadow_model():
+    """Start shadow scoring a sample of uploads with a version, or stop it with ``{"version": null}``."""
+    data = request.get_json(silent=True) or {}
+    version = data.get("version")
+    try:
+        sample_rate = float(data.get("sample_rate", SHADOW_SAMPLE_RATE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "sample_rate must be a number"}), 400
+    if not 0.0 <= sample_rate <= 1.0:
+        return jsonify({"error": "sample_rate must be between 0 and 1"}), 400
+    if version:
+        try:
+            model_registry.manifest(version)
+        except KeyError:
+            return jsonify({"error": f"Unknown model version '{version}'"}), 404
+    if not model_registry.in_background(model_registry.set_shadow, version, sample_rate):
+        return jsonify({"error": "Another model is still loading"}), 409
+    return jsonify({"status": "loading" if version else "stopped", "version": version}), 202
+
+
+@app.route("/metrics", methods=["GET"])
+@limiter.exempt
+@talisman(force_https=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint: request, stage and prediction metrics plus queue gauges."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/metrics/tracing", methods=["POST"])
+@role_required(ADMIN_ROLE)
+def set_tracing():
+    """Turn per-stage latency tracing on or off without a restart."""
+    enabled = (request.get_json(silent=True) or {}).get("enabled")
+    if not isinstance(enabled, bool):
+        return jsonify({"error": "enabled must be true or false"}), 400
+    metrics.tracing = enabled
+    logger.info(f"⏱️ Stage tracing {'enabled' if enabled else 'disabled'}")
+    return jsonify({"tracing": metrics.tracing}), 200
+
+
+@app.route("/api/jobs/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def job_stats():
+    """Expose background job queue depth and counters."""
+    return jsonify(job_pipeline.stats()), 200
+
+
+@app.route("/api/notifications/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def notification_stats():
+    """Expose email queue depth, digest and SMTP connection counters."""
+    return jsonify(notifier.stats()), 200
+
+
+@app.route("/api/changefeed/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def change_feed_stats():
+    """Expose the change feed mode, head token and broadcast counters."""
+    return jsonify(change_feed.stats()), 200
+
+
+@app.route("/api/analytics/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def analytics_stats():
+    """Expose rollup update, rebuild and cache counters."""
+    return jsonify(analytics.stats()), 200
+
+
+@app.route("/api/auth/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def auth_stats():
+    """Expose token issue/verification and bcrypt pool counters."""
+    return jsonify({"tokens": auth_tokens.stats(), "passwords": password_hasher.stats()}), 200
+
+
+@app.route("/api/geocode/stats", methods=["GET"])
+@role_required(ADMIN_ROLE)
+def geocode_stats():
+    """Expose reverse-geocoding cache hit/miss counters."""
+    return jsonify(geocode_cache.stats()), 200
+
+
 # Serve static files from the uploads directory
-@app.route("/uploads/<filename>")
+@app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    """Serve uploads and derivatives with conditional and Range request support.
+
+    Content-addressed files get their hash as a strong ETag and are cached
+    as immutable; legacy flat uploads keep the default headers.
+    """
+    etag = content_etag(filename)
+    if not etag:
+        return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+
+    response = send_from_directory(
+        app.config["UPLOAD_FOLDER"], filename, etag=etag, max_age=IMMUTABLE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/api/detections/status", methods=["PATCH"])
+@role_required(ADMIN_ROLE)
+def update_detection_statuses():
+    """Set one status on up to ``MAX_PAGE_SIZE`` detections: ``{"ids": [...], "status": ...}``."""
+    data = request.get_json(silent=True) or {}
+    ids, new_status = data.get("ids"), data.get("status")
+    if new_status not in VALID_STATUSES:
+        return jsonify({"error": "Invalid status"}), 400
+    if not isinstance(ids, list) or not 0 < len(ids) <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"ids must be a list of 1 to {MAX_PAGE_SIZE} detection ids"}), 400
+    if not all(isinstance(i, str) and ObjectId.is_valid(i) for i in ids):
+        return jsonify({"error": "Invalid detection id"}), 400
+    try:
+        previous = repository.update_statuses(ids, new_status)
+    except Exception as e:
+        logger.error(f"❌ Failed to update statuses: {e}")
+        return jsonify({"error": "Failed to update status"}), 500
+
+    analytics.apply_many([(detection, {**detection, "status": new_status}) for detection in previous])
+    change_feed.record_many(UPSERT, [detection["_id"] for detection in previous])
+    found = {str(detection["_id"]) for detection in previous}
+    return jsonify({"updated": sorted(found), "not_found": [i for i in ids if i not in found]}), 200
 
 
 @app.route("/api/detections/<detection_id>/status", methods=["PATCH"])
+@role_required(ADMIN_ROLE)
 def update_detection_status(detection_id):
     """Update the status of a detection."""
     try:
@@ -355,42 +1594,82 @@ def update_detection_status(detection_id):
         new_status = data.get("status")
 
         # Validate the new status
-        valid_statuses = ["pending", "in_progress", "completed"]
-        if new_status not in valid_statuses:
+        if new_status not in VALID_STATUSES:
             return jsonify({"error": "Invalid status"}), 400
 
-        # Update the status in MongoDB
-        result = db.detections.update_one(
-            {"_id": ObjectId(detection_id)}, {"$set": {"status": new_status}}
-        )
+        # One round trip: the previous version comes back for the rollups
+        previous = repository.update_status(detection_id, new_status)
 
-        if result.matched_count == 0:
+        if previous is None:
             return jsonify({"error": "Detection not found"}), 404
 
-        # Fetch the updated detection
-        updated_detection = db.detections.find_one({"_id": ObjectId(detection_id)})
-        updated_detection["id"] = str(updated_detection["_id"])
-        del updated_detection["_id"]
-
-        # Emit WebSocket event to notify clients
-        socketio.emit("status_update", updated_detection)
+        updated_detection = {**previous, "status": new_status}
+        analytics.apply(previous, updated_detection)
+        change_feed.record(UPSERT, ObjectId(detection_id))
 
-        return jsonify(updated_detection), 200
+        return jsonify(serialize_detection(updated_detection)), 200
     except Exception as e:
         logger.error(f"❌ Failed to update status: {e}")
         return jsonify({"error": "Failed to update status"}), 500
 
 
+@app.errorhandler(413)
+def request_too_large(e):
+    if request.path == "/upload/batch":
+        return jsonify({"error": f"Batch exceeds the maximum size of {BATCH_MAX_BYTES // (1024 * 1024)}MB."}), 413
+    return jsonify({"error": "File size exceeds the maximum limit of 5MB."}), 413
+
+
 # WebSocket event handlers
+def socket_role(auth):
+    """Role in the access token of the connection's auth payload; anonymous clients are plain users."""
+    try:
+        return auth_tokens.verify((auth or {}).get("token"), ACCESS).get("role", "user")
+    except InvalidToken:
+        return "user"
+
+
+def join_regions(regions):
+    """Replace the client's region rooms; returns the cells joined."""
+    cells = parse_regions(regions, SOCKETIO_REGION_PRECISION)
+    for room in rooms():
+        if room.startswith("region:"):
+            leave_room(room)
+    for cell in cells:
+        join_room(region_room(cell))
+    return cells
+
+
 @socketio.on("connect")
-def handle_connect():
-    logger.info("✅ Client connected via WebSocket")
+def handle_connect(auth=None):
+    websocket_clients.inc()
+    role = socket_role(auth)
+    join_room(role_room(role))
+    try:
+        cells = join_regions((auth or {}).get("regions", []))
+    except ValueError as e:
+        logger.warning(f"⚠️ Ignoring WebSocket regions: {e}")
+        cells = []
+    logger.info(f"✅ Client connected via WebSocket (role {role}, {len(cells)} regions)")
+
+
+@socketio.on("subscribe")
+def handle_subscribe(data):
+    """Switch the regions a client receives detection changes for; the return value is the ack."""
+    try:
+        return {"regions": join_regions((data or {}).get("regions", []))}
+    except ValueError as e:
+        return {"error": str(e)}
 
 
 @socketio.on("disconnect")
 def handle_disconnect():
+    websocket_clients.dec()
     logger.info("❌ Client disconnected")
 
 
 if __name__ == "__main__":
+    # With debug on, the reloader runs this file twice; only the child that serves starts the services
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_services()
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)
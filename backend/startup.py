@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def parse_batch_sizes(value, max_batch_size):
+    """Warm-up batch sizes from a config string: ``all`` (1..max), ``none``, or ``1,4,16``."""
+    value = value.strip().lower()
+    if value == "all":
+        return list(range(1, max_batch_size + 1))
+    if value in ("", "none", "0"):
+        return []
+    return sorted({min(int(size), max_batch_size) for size in value.split(",") if size.strip()})
+
+
+def warm_up(predict, make_batch, batch_sizes):
+    """Run one prediction at every batch size so tracing/allocation never lands on a user request.
+
+    Returns ``{batch_size: milliseconds}``.
+    """
+    timings = {}
+    for size in batch_sizes:
+        start = time.perf_counter()
+        predict(make_batch(size))
+        timings[size] = round((time.perf_counter() - start) * 1000, 1)
+    return timings
+
+
+class Startup:
+    """Times the startup phases and tracks whether the model is ready to serve.
+
+    ``state`` moves from ``starting`` through ``loading`` to ``ready``, or to
+    ``failed`` with the error kept for the readiness endpoint, instead of
+    leaving the app silently without a model.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.state = "starting"
+        self.error = None
+        self.phases = {}
+        self.warmup = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time a named startup step and log how long it took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = round(elapsed, 3)
+            logger.info(f"⏱️ Startup phase '{name}' took {elapsed:.2f}s")
+
+    def run_in_background(self, load):
+        """Run ``load`` on a daemon thread and mark the app ready when it returns."""
+        self.state = "loading"
+        threading.Thread(target=self._run, args=(load,), name="startup-loader", daemon=True).start()
+
+    def _run(self, load):
+        try:
+            load()
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"❌ Model startup failed: {e}")
+            return
+        self.state = "ready"
+        self._ready.set()
+        logger.info(f"✅ Ready to serve predictions {self.uptime():.1f}s after start")
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def uptime(self):
+        return time.monotonic() - self.started_at
+
+    def stats(self):
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "state": self.state,
+            "error": self.error,
+            "uptime_seconds": round(self.uptime(), 1),
+            "phases": phases,
+            "warmup_ms": self.warmup,
+        }
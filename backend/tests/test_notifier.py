@@ -0,0 +1,152 @@
+"""Notifier and SMTP pool against a local aiosmtpd server."""
+import socket
+import time
+from datetime import datetime, timezone
+from email import message_from_bytes
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from notifier import Notifier, SMTPConnectionPool, TokenBucket
+
+SENDER = "alerts@example.com"
+RECIPIENT = "ward@example.com"
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.peers = []  # (host, port) of the connection each message came in on
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content))
+        self.peers.append(session.peer)
+        return "250 Message accepted"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield handler, controller.port
+    controller.stop()
+
+
+@pytest.fixture
+def pool(smtp_server):
+    _, port = smtp_server
+    pool = SMTPConnectionPool("127.0.0.1", port, size=1, use_tls=False)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def make_notifier(pool):
+    notifiers = []
+
+    def make(**kwargs):
+        notifier = Notifier(pool, SENDER, [RECIPIENT], **kwargs)
+        notifier.start()
+        notifiers.append(notifier)
+        return notifier
+
+    yield make
+    for notifier in notifiers:
+        notifier.stop()
+
+
+def detection(lat=28.6139, lon=77.2090):
+    return {
+        "prediction": "Garbage",
+        "confidence": 0.93,
+        "latitude": lat,
+        "longitude": lon,
+        "location_name": "Connaught Place, New Delhi",
+        "timestamp": datetime.now(timezone.utc),
+    }
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_pool_reuses_one_connection(smtp_server, make_notifier):
+    handler, _ = smtp_server
+    notifier = make_notifier()
+
+    for sent in range(1, 4):
+        notifier.notify(detection())
+        assert wait_for(lambda: len(handler.messages) == sent)
+
+    assert len(set(handler.peers)) == 1
+    assert notifier.stats()["smtp_connects"] == 1
+
+
+def test_pending_detections_are_sent_as_one_digest(smtp_server, make_notifier):
+    handler, _ = smtp_server
+    notifier = make_notifier(digest_window=1.0)
+
+    for _ in range(3):
+        notifier.notify(detection())
+
+    assert wait_for(lambda: handler.messages)
+    time.sleep(0.6)  # nothing else should follow
+    assert len(handler.messages) == 1
+    assert handler.messages[0]["Subject"] == "Garbage Detection Digest: 3 detections"
+    assert notifier.stats()["detections_sent"] == 3
+
+
+def test_rate_limit_defers_sends(smtp_server, make_notifier):
+    handler, _ = smtp_server
+    notifier = make_notifier(rate_limit_per_hour=1)
+
+    notifier.notify(detection())
+    assert wait_for(lambda: len(handler.messages) == 1)
+
+    notifier.notify(detection())
+    assert wait_for(lambda: notifier.stats()["rate_limited"] >= 1)
+    time.sleep(0.6)
+    assert len(handler.messages) == 1
+    stats = notifier.stats()
+    assert stats["pending_digests"] == 1
+    assert stats["pending_detections"] == 1
+
+
+def test_rate_limited_digests_are_merged_and_capped(smtp_server, make_notifier):
+    handler, _ = smtp_server
+    notifier = make_notifier(rate_limit_per_hour=1, digest_precision=5, max_digest_size=3)
+
+    notifier.notify(detection())
+    assert wait_for(lambda: len(handler.messages) == 1)
+
+    # Two areas far apart, more detections than a digest keeps
+    for i in range(3):
+        notifier.notify(detection(28.6139, 77.2090 + i * 1e-4))
+        notifier.notify(detection(19.0760, 72.8777 + i * 1e-4))
+
+    assert wait_for(lambda: notifier.stats()["queued"] == 7 and notifier.stats()["queue_depth"] == 0)
+    assert wait_for(lambda: notifier.stats()["pending_digests"] == 1)
+    stats = notifier.stats()
+    assert stats["pending_detections"] == 3
+    assert stats["omitted"] == 3
+    assert len(handler.messages) == 1
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(2, period=0.2)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    time.sleep(0.15)
+    assert bucket.take()
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024  # 5MB
+READ_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of each accepted format -> (mime type, stored file extension)
+MAGIC_NUMBERS = [
+    (b"\xff\xd8\xff", ("image/jpeg", "jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("image/png", "png")),
+]
+
+# Paths produced by ContentAddressedStore: ab/cd/<sha256>[_<variant>].<ext>
+CONTENT_ADDRESSED_PATH = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:_[a-z]+)?)\.[a-z]+$")
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeded the size limit while it was being read."""
+
+
+class InMemoryUploadRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling them to a temp file.
+
+    Werkzeug already enforces ``MAX_CONTENT_LENGTH`` while parsing, so
+    the buffer is bounded. Paths listed in ``max_content_length_overrides``
+    (batch ingestion) get their own limit. Bodies larger than a single
+    upload, or of unknown length (chunked transfer encoding), are spooled
+    to disk as usual.
+    """
+
+    max_content_length_overrides = {}
+
+    @property
+    def max_content_length(self):
+        limit = self.max_content_length_overrides.get(self.path)
+        return limit if limit is not None else super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= MAX_UPLOAD_BYTES + 64 * 1024:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+def read_upload(stream, max_bytes=MAX_UPLOAD_BYTES, chunk_size=READ_CHUNK_SIZE):
+    """Read an upload stream once, enforcing ``max_bytes`` and hashing as it goes.
+
+    Returns ``(buffer, sha256 hexdigest)`` with the buffer rewound. Raises
+    UploadTooLarge as soon as the limit is crossed; no declared
+    Content-Length is trusted. A ``BytesIO`` (how InMemoryUploadRequest
+    holds the file) is hashed in place and returned itself rather than
+    copied into a second buffer.
+    """
+    if isinstance(stream, io.BytesIO):
+        with stream.getbuffer() as view:
+            if view.nbytes > max_bytes:
+                raise UploadTooLarge(f"File size exceeds the maximum limit of {max_bytes // (1024 * 1024)}MB.")
+            sha256 = hashlib.sha256(view).hexdigest()
+        stream.seek(0)
+        return stream, sha256
+
+    digest = hashlib.sha256()
+    buffer = io.BytesIO()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"File size exceeds the maximum limit of {max_bytes // (1024 * 1024)}MB.")
+        digest.update(chunk)
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer, digest.hexdigest()
+
+
+def sniff_image_type(buffer):
+    """Identify an image from its magic bytes; returns ``(mime, ext)`` or None."""
+    header = bytes(buffer.getbuffer()[:8])
+    for magic, kind in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return kind
+    return None
+
+
+class ContentAddressedStore:
+    """Stores files under the SHA-256 of their content, sharded two levels deep.
+
+    ``ab/cd/abcd...ef.jpg`` keeps directories small, identical uploads map to
+    one file, and user-supplied filenames never reach the filesystem.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def relative_path(sha256, ext, variant=None):
+        name = f"{sha256}_{variant}" if variant else sha256
+        return f"{sha256[:2]}/{sha256[2:4]}/{name}.{ext}"
+
+    def path(self, sha256, ext, variant=None):
+        return os.path.join(self.root, *self.relative_path(sha256, ext, variant).split("/"))
+
+    def save(self, sha256, ext, data, variant=None):
+        """Write ``data`` atomically; a no-op when the content is already stored.
+
+        ``variant`` names a file derived from the same original (e.g. a thumbnail).
+        """
+        path = self.path(sha256, ext, variant)
+        if os.path.exists(path):
+            return path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        logger.info(f"📤 Saved file: {path}")
+        return path
+
+
+def content_etag(relative_path):
+    """Strong ETag for a content-addressed path, or None for legacy uploads."""
+    match = CONTENT_ADDRESSED_PATH.match(relative_path)
+    return match.group(1) if match else None
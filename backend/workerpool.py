@@ -0,0 +1,299 @@
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import inference_worker
+from inference import Overloaded
+from preprocessing import IMG_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSaturated(Overloaded):
+    """Every worker slot is busy; the caller should back off."""
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process died or hung while holding the request."""
+
+
+_spawn_lock = threading.Lock()
+
+
+@contextmanager
+def _worker_main_module():
+    # spawn re-imports the parent's __main__ in every child; point it at the small worker module meanwhile
+    with _spawn_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = inference_worker
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+class _Worker:
+    def __init__(self, worker_id, slots, layout):
+        self.id = worker_id
+        self.slots = slots
+        _, max_batch, height, width, channels, num_outputs = layout
+        self.in_shm = shared_memory.SharedMemory(
+            create=True, size=slots * max_batch * height * width * channels
+        )
+        self.out_shm = shared_memory.SharedMemory(create=True, size=slots * max_batch * num_outputs * 4)
+        self.inputs = np.ndarray((slots, max_batch, height, width, channels), dtype=np.uint8, buffer=self.in_shm.buf)
+        self.outputs = np.ndarray((slots, max_batch, num_outputs), dtype=np.float32, buffer=self.out_shm.buf)
+        self.process = None
+        self.tasks = None
+        self.ready = False
+        self.free_slots = []
+        self.inflight = {}  # task_id -> (slot, n, future, started_at)
+        self.restarts = 0
+        self.completed = 0
+
+
+class InferenceWorkerPool:
+    """Pool of inference processes, each with its own copy of the model.
+
+    Batches travel to the workers as uint8 pixels in per-worker
+    shared-memory ring buffers of ``slots_per_worker`` slots, and the
+    probabilities come back the same way. Only small ``(slot, n, id)``
+    tuples cross the process boundary. Each worker runs a prediction at
+    every size in ``warmup_batch_sizes`` before it reports ready. A monitor
+    thread restarts workers that die or hang, and ``predict`` raises
+    ``PoolSaturated`` when no slot frees up within ``acquire_timeout``
+    seconds.
+    """
+
+    def __init__(
+        self,
+        runtime_name,
+        runtime_kwargs=None,
+        num_workers=None,
+        slots_per_worker=2,
+        max_batch_size=16,
+        image_size=IMG_SIZE,
+        num_outputs=2,
+        acquire_timeout=1.0,
+        task_timeout=30.0,
+        health_interval=1.0,
+        warmup_batch_sizes=(),
+    ):
+        self.runtime_name = runtime_name
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.slots_per_worker = slots_per_worker
+        self.max_batch_size = max_batch_size
+        self.layout = (slots_per_worker, max_batch_size, image_size[1], image_size[0], 3, num_outputs)
+        self.acquire_timeout = acquire_timeout
+        self.task_timeout = task_timeout
+        self.health_interval = health_interval
+        self.warmup_batch_sizes = [n for n in warmup_batch_sizes if n <= max_batch_size]
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        # Runtimes with their own thread pool (TFLite) get the per-worker share too
+        self.runtime_kwargs = {**(runtime_kwargs or {}), "num_threads": self.threads_per_worker}
+
+        self._ctx = mp.get_context("spawn")  # never fork a process that has TensorFlow loaded
+        self._results = None
+        self._workers = []
+        self._cond = threading.Condition()
+        self._task_ids = itertools.count()
+        self._next_worker = 0
+        self._running = threading.Event()
+        self.saturated = 0
+
+    @property
+    def capacity(self):
+        """Number of batches that can be in flight at once."""
+        return self.num_workers * self.slots_per_worker
+
+    def start(self):
+        """Allocate shared memory, spawn the workers and start the listener/monitor threads."""
+        self._results = self._ctx.Queue()
+        self._running.set()
+        for worker_id in range(self.num_workers):
+            worker = _Worker(worker_id, self.slots_per_worker, self.layout)
+            self._workers.append(worker)
+            self._spawn(worker)
+        threading.Thread(target=self._listen, name="pool-listener", daemon=True).start()
+        threading.Thread(target=self._monitor, name="pool-monitor", daemon=True).start()
+        logger.info(f"✅ Inference pool starting {self.num_workers} workers ({self.runtime_name})")
+
+    def _spawn(self, worker):
+        worker.tasks = self._ctx.Queue()
+        worker.process = self._ctx.Process(
+            target=inference_worker.worker_main,
+            args=(
+                worker.id,
+                self.runtime_name,
+                self.runtime_kwargs,
+                self.layout,
+                worker.in_shm.name,
+                worker.out_shm.name,
+                worker.tasks,
+                self._results,
+                self.threads_per_worker,
+                self.warmup_batch_sizes,
+            ),
+            name=f"inference-worker-{worker.id}",
+            daemon=True,
+        )
+        with _worker_main_module():
+            worker.process.start()
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded and warmed up; returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not all(worker.ready for worker in self._workers):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    @property
+    def ready_workers(self):
+        with self._cond:
+            return sum(1 for worker in self._workers if worker.ready)
+
+    def stop(self, timeout=5.0):
+        """Shut the workers down and release the shared memory."""
+        self._running.clear()
+        for worker in self._workers:
+            if worker.process and worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self._workers:
+            if worker.process:
+                worker.process.join(timeout)
+                if worker.process.is_alive():
+                    worker.process.terminate()
+            worker.in_shm.close()
+            worker.in_shm.unlink()
+            worker.out_shm.close()
+            worker.out_shm.unlink()
+        self._workers = []
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                for offset in range(len(self._workers)):
+                    worker = self._workers[(self._next_worker + offset) % len(self._workers)]
+                    if worker.ready and worker.free_slots:
+                        self._next_worker = (worker.id + 1) % len(self._workers)
+                        return worker, worker.free_slots.pop()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.saturated += 1
+                    raise PoolSaturated("All inference workers are busy")
+                self._cond.wait(remaining)
+
+    def predict(self, batch):
+        """Score a ``(N, H, W, 3)`` uint8 batch on the next worker with a free slot."""
+        n = len(batch)
+        if n > self.max_batch_size:
+            raise ValueError(f"Batch of {n} exceeds max_batch_size {self.max_batch_size}")
+
+        worker, slot = self._acquire()
+        worker.inputs[slot, :n] = batch
+        future = Future()
+        task_id = next(self._task_ids)
+        with self._cond:
+            worker.inflight[task_id] = (slot, n, future, time.monotonic())
+        worker.tasks.put((slot, n, task_id))
+        return future.result(timeout=self.task_timeout + self.health_interval * 2)
+
+    def _listen(self):
+        while self._running.is_set():
+            try:
+                kind, worker_id, task_id, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            worker = self._workers[worker_id]
+            with self._cond:
+                if kind == "ready":
+                    worker.ready = True
+                    worker.free_slots = list(range(worker.slots))
+                    logger.info(f"✅ Inference worker {worker_id} ready (pid {worker.process.pid})")
+                    self._cond.notify_all()
+                    continue
+
+                entry = worker.inflight.pop(task_id, None)
+                if entry is None:
+                    continue  # Result from a worker incarnation that was already restarted
+                slot, n, future, _ = entry
+                output = None if error else worker.outputs[slot, :n].copy()
+                worker.free_slots.append(slot)
+                worker.completed += 1
+                self._cond.notify()
+
+            if error:
+                future.set_exception(RuntimeError(f"Inference worker {worker_id} failed: {error}"))
+            else:
+                future.set_result(output)
+
+    def _monitor(self):
+        while self._running.is_set():
+            time.sleep(self.health_interval)
+            now = time.monotonic()
+            for worker in self._workers:
+                with self._cond:
+                    started = [entry[3] for entry in worker.inflight.values()]
+                hung = any(now - t > self.task_timeout for t in started)
+                if worker.process.is_alive() and not hung:
+                    continue
+                if not self._running.is_set():
+                    return
+                self._restart(worker, "hung" if hung else f"exit code {worker.process.exitcode}")
+
+    def _restart(self, worker, reason):
+        logger.error(f"❌ Inference worker {worker.id} {reason}, restarting")
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join(5.0)
+
+        with self._cond:
+            failed = list(worker.inflight.values())
+            worker.inflight.clear()
+            worker.ready = False
+            worker.free_slots = []
+            worker.restarts += 1
+        for _, _, future, _ in failed:
+            future.set_exception(WorkerCrashed(f"Inference worker {worker.id} {reason}"))
+        self._spawn(worker)
+
+    def stats(self):
+        """Return per-worker health and slot usage."""
+        with self._cond:
+            workers = [
+                {
+                    "id": w.id,
+                    "pid": w.process.pid if w.process else None,
+                    "alive": bool(w.process and w.process.is_alive()),
+                    "ready": w.ready,
+                    "inflight": len(w.inflight),
+                    "free_slots": len(w.free_slots),
+                    "completed": w.completed,
+                    "restarts": w.restarts,
+                }
+                for w in self._workers
+            ]
+        return {
+            "num_workers": self.num_workers,
+            "slots_per_worker": self.slots_per_worker,
+            "saturated": self.saturated,
+            "workers": workers,
+        }
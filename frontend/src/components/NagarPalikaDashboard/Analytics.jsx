@@ -14,10 +14,11 @@ import {
   Legend,
 } from 'recharts';
 import { format, parseISO } from 'date-fns';
+import { sumByBucket } from '../../hooks/useAnalytics';
 
-const Analytics = ({ detections, activeTab }) => {
-  // Check if detections is null, undefined, or empty
-  if (!detections || detections.length === 0) {
+const Analytics = ({ analytics, activeTab }) => {
+  // Check if the rollups are still loading or empty
+  if (!analytics || analytics.totals.length === 0) {
     return (
       <div className="bg-white rounded-lg shadow-lg p-6">
         <h3 className="text-lg font-semibold mb-4">Detection Trends</h3>
@@ -26,58 +27,15 @@ const Analytics = ({ detections, activeTab }) => {
     );
   }
 
-  // Process data for the chart
-  const processData = (detections) => {
-    const dailyData = detections.reduce((acc, detection) => {
-      // Skip if timestamp is missing or prediction is not "Garbage"
-      if (!detection.timestamp || detection.prediction !== "Garbage") return acc;
+  // Daily garbage counts for the active tab, from the server-side rollups
+  const chartData = Object.entries(sumByBucket(analytics.daily, activeTab))
+    .map(([date, count]) => ({ date, count }))
+    .sort((a, b) => new Date(a.date) - new Date(b.date));
 
-      // Filter based on activeTab
-      const matchesStatus =
-        activeTab === "all" || detection.status === activeTab;
-      if (!matchesStatus) return acc;
-
-      const date = format(parseISO(detection.timestamp), 'yyyy-MM-dd');
-      if (!acc[date]) {
-        acc[date] = { date, count: 0 };
-      }
-      acc[date].count++;
-      return acc;
-    }, {});
-
-    const result = Object.values(dailyData).sort((a, b) =>
-      new Date(a.date) - new Date(b.date)
-    );
-    console.log("Processed Data:", result); // Log the processed data
-    return result;
-  };
-
-  // Process location data for the bar chart
-  const processLocationData = (detections) => {
-    const locationData = detections.reduce((acc, detection) => {
-      // Skip if location_name is missing or prediction is not "Garbage"
-      if (!detection.location_name || detection.prediction !== "Garbage") return acc;
-
-      // Filter based on activeTab
-      const matchesStatus =
-        activeTab === "all" || detection.status === activeTab;
-      if (!matchesStatus) return acc;
-
-      const location = detection.location_name;
-      if (!acc[location]) {
-        acc[location] = { location, count: 0 };
-      }
-      acc[location].count++;
-      return acc;
-    }, {});
-
-    const result = Object.values(locationData).sort((a, b) => b.count - a.count);
-    console.log("Location Data:", result); // Log the location data
-    return result;
-  };
-
-  const chartData = processData(detections);
-  const locationData = processLocationData(detections);
+  // Counts per location for the bar chart
+  const locationData = Object.entries(sumByBucket(analytics.locations, activeTab))
+    .map(([location, count]) => ({ location, count }))
+    .sort((a, b) => b.count - a.count);
 
   // Calculate average detections per day
   const totalDetections = chartData.reduce((sum, entry) => sum + entry.count, 0);
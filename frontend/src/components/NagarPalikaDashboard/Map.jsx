@@ -1,8 +1,7 @@
-import { useEffect, useState } from "react";
-import { MapContainer, TileLayer, Marker, Popup, useMap } from "react-leaflet";
+import { useCallback, useEffect, useRef, useState } from "react";
+import { MapContainer, TileLayer, Marker, Popup, useMap, useMapEvents } from "react-leaflet";
 import L from "leaflet";
 import "leaflet/dist/leaflet.css";
-import MarkerClusterGroup from "react-leaflet-cluster";
 import { format } from "date-fns";
 import LoadingSpinner from "../userDashboard/LoadingSpinner"; // Import your spinner component
 
@@ -26,22 +25,132 @@ const statusIcons = {
   default: createCustomIcon("grey"),
 };
 
-// Component to auto-zoom to markers
-const AutoZoom = ({ detections }) => {
+// Badge marker for a server-side cluster of several detections
+const createClusterIcon = (count) =>
+  L.divIcon({
+    html: `<span>${count}</span>`,
+    className:
+      "flex items-center justify-center rounded-full bg-indigo-500/80 text-white text-sm font-semibold border-2 border-white shadow",
+    iconSize: [36, 36],
+  });
+
+// Status of a single-detection cluster, taken from its status counts
+const clusterStatus = (cluster) =>
+  Object.keys(cluster.status_counts).find((status) => cluster.status_counts[status] > 0);
+
+const clamp = (value, min, max) => Math.min(Math.max(value, min), max);
+
+// Fetch clusters for the visible bounding box whenever the viewport settles
+const ViewportClusters = ({ authFetch, activeStatus, onClusters, onError }) => {
   const map = useMap();
+  // authFetch changes identity on every auth render; keep it out of the deps
+  const fetchRef = useRef(authFetch);
+  fetchRef.current = authFetch;
 
-  useEffect(() => {
-    if (detections.length > 0) {
-      const group = new L.featureGroup(
-        detections.map((d) => L.marker([d.latitude, d.longitude]))
+  const load = useCallback(async () => {
+    const bounds = map.getBounds();
+    const bbox = [
+      clamp(bounds.getWest(), -180, 180),
+      clamp(bounds.getSouth(), -90, 90),
+      clamp(bounds.getEast(), -180, 180),
+      clamp(bounds.getNorth(), -90, 90),
+    ].join(",");
+    const params = new URLSearchParams({ bbox, zoom: String(map.getZoom()) });
+    if (activeStatus) params.set("status", activeStatus);
+
+    try {
+      const response = await fetchRef.current(
+        `http://localhost:5000/api/detections/clusters?${params}`
       );
-      map.fitBounds(group.getBounds(), { padding: [50, 50] });
+      if (!response.ok) throw new Error("Failed to fetch map clusters");
+      onClusters(await response.json());
+      onError(null);
+    } catch (error) {
+      onError(error.message);
     }
-  }, [detections, map]);
+  }, [map, activeStatus, onClusters, onError]);
+
+  useMapEvents({ moveend: load });
+
+  useEffect(() => {
+    load();
+  }, [load]);
 
   return null;
 };
 
+// Popup body for a single detection, fetched when the popup opens
+const DetectionPopup = ({ id, authFetch }) => {
+  const [detection, setDetection] = useState(null);
+
+  useEffect(() => {
+    let cancelled = false;
+    authFetch(`http://localhost:5000/api/detections/${id}`)
+      .then((response) => (response.ok ? response.json() : null))
+      .then((data) => !cancelled && setDetection(data))
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [id, authFetch]);
+
+  if (!detection) {
+    return <p className="text-sm text-gray-500">Loading...</p>;
+  }
+
+  return (
+    <div className="min-w-[200px]">
+      <img
+        src={detection.thumbnail_url || detection.image_url}
+        alt="Detection"
+        className="w-full h-32 object-cover rounded-t"
+      />
+      <div className="p-2 space-y-1">
+        <p className="font-semibold capitalize">
+          {detection.status.replace("_", " ")}
+        </p>
+        <p className="text-sm">{detection.location_name}</p>
+        <p className="text-xs text-gray-500">
+          {format(new Date(detection.timestamp), "MMM d, yyyy h:mm a")}
+        </p>
+        <div className="flex justify-between items-center">
+          <span className="text-sm">Confidence:</span>
+          <span className="font-semibold text-blue-600">
+            {(detection.confidence * 100).toFixed(1)}%
+          </span>
+        </div>
+      </div>
+    </div>
+  );
+};
+
+// Single detections open a popup; clusters zoom in on click
+const ClusterMarker = ({ cluster, authFetch }) => {
+  const map = useMap();
+  const position = [cluster.latitude, cluster.longitude];
+
+  if (cluster.count === 1) {
+    const status = clusterStatus(cluster);
+    return (
+      <Marker position={position} icon={statusIcons[status] || statusIcons.default}>
+        <Popup className="custom-popup">
+          <DetectionPopup id={cluster.id} authFetch={authFetch} />
+        </Popup>
+      </Marker>
+    );
+  }
+
+  return (
+    <Marker
+      position={position}
+      icon={createClusterIcon(cluster.count)}
+      eventHandlers={{
+        click: () => map.setView(position, Math.min(map.getZoom() + 2, map.getMaxZoom())),
+      }}
+    />
+  );
+};
+
 const MapControls = ({ activeStatus, setActiveStatus }) => (
   <div className="leaflet-top leaflet-right">
     <div className="leaflet-control leaflet-bar bg-white p-2 space-y-2">
@@ -61,10 +170,10 @@ const MapControls = ({ activeStatus, setActiveStatus }) => (
   </div>
 );
 
-const GarbageMap = ({ detections }) => {
+const GarbageMap = ({ authFetch }) => {
   const [activeStatus, setActiveStatus] = useState(null);
-  const [isLoading, setIsLoading] = useState(true);
-  const [validDetections, setValidDetections] = useState([]);
+  const [clusters, setClusters] = useState(null);
+  const [clusterError, setClusterError] = useState(null);
   const [userLocation, setUserLocation] = useState(null);
   const [locationError, setLocationError] = useState(null);
 
@@ -90,19 +199,7 @@ const GarbageMap = ({ detections }) => {
     }
   }, []);
 
-  // Validate coordinates and filter by status
-  useEffect(() => {
-    const filtered = detections.filter(
-      (d) =>
-        typeof d.latitude === "number" &&
-        typeof d.longitude === "number" &&
-        (!activeStatus || d.status === activeStatus)
-    );
-    setValidDetections(filtered);
-    setIsLoading(false);
-  }, [detections, activeStatus]);
-
-  if (isLoading || !userLocation) {
+  if (!userLocation) {
     return (
       <div className="h-[400px] flex flex-col items-center justify-center bg-gradient-to-r from-emerald-400 via-blue-300 to-indigo-400 text-black border-2 border-indigo-400 shadow-xl rounded-xl p-6">
         <LoadingSpinner text="Loading map..." />
@@ -133,49 +230,19 @@ const GarbageMap = ({ detections }) => {
           url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
         />
 
-        <MarkerClusterGroup
-          chunkedLoading
-          spiderfyDistanceMultiplier={2}
-          showCoverageOnHover={false}
-        >
-          {validDetections.map((detection) => (
-            <Marker
-              key={detection._id}
-              position={[detection.latitude, detection.longitude]}
-              icon={statusIcons[detection.status] || statusIcons.default}
-            >
-              <Popup className="custom-popup">
-                <div className="min-w-[200px]">
-                  <img
-                    src={detection.image_url}
-                    alt="Detection"
-                    className="w-full h-32 object-cover rounded-t"
-                  />
-                  <div className="p-2 space-y-1">
-                    <p className="font-semibold capitalize">
-                      {detection.status.replace("_", " ")}
-                    </p>
-                    <p className="text-sm">{detection.location_name}</p>
-                    <p className="text-xs text-gray-500">
-                      {format(
-                        new Date(detection.timestamp),
-                        "MMM d, yyyy h:mm a"
-                      )}
-                    </p>
-                    <div className="flex justify-between items-center">
-                      <span className="text-sm">Confidence:</span>
-                      <span className="font-semibold text-blue-600">
-                        {(detection.confidence * 100).toFixed(1)}%
-                      </span>
-                    </div>
-                  </div>
-                </div>
-              </Popup>
-            </Marker>
-          ))}
-        </MarkerClusterGroup>
-
-        <AutoZoom detections={validDetections} />
+        <ViewportClusters
+          authFetch={authFetch}
+          activeStatus={activeStatus}
+          onClusters={setClusters}
+          onError={setClusterError}
+        />
+        {(clusters ?? []).map((cluster) => (
+          <ClusterMarker
+            key={`${cluster.latitude},${cluster.longitude},${cluster.count}`}
+            cluster={cluster}
+            authFetch={authFetch}
+          />
+        ))}
         {/* <MapControls 
           activeStatus={activeStatus} 
           setActiveStatus={setActiveStatus} 
@@ -203,9 +270,15 @@ const GarbageMap = ({ detections }) => {
         </div>
       </div>
 
-      {validDetections.length === 0 && (
+      {clusterError && (
         <div className="absolute inset-0 bg-white/80 flex items-center justify-center">
-          <p className="text-gray-500">No valid detections to display</p>
+          <p className="text-red-500">{clusterError}</p>
+        </div>
+      )}
+
+      {!clusterError && clusters?.length === 0 && (
+        <div className="absolute inset-0 bg-white/80 flex items-center justify-center pointer-events-none">
+          <p className="text-gray-500">No detections in this area</p>
         </div>
       )}
     </div>
@@ -4,6 +4,7 @@ import StatusBadge from "./StatusBadge";
 const NotificationCard = ({ notification, onStatusUpdate, onDelete }) => {
   const confidence = (notification?.confidence ?? 0) * 100;
   const imageUrl =
+    notification?.thumbnail_url ||
     notification?.image_url ||
     "https://e3.365dm.com/25/03/1600x900/skynews-india-delhi-garbage-mountain_6848989.jpg?20250307131130";
   const detectedAt = notification?.timestamp || new Date().toISOString();
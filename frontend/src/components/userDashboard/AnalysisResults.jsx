@@ -61,7 +61,7 @@ const AnalysisResults = () => {
           </div>
 
           {/* Location Card */}
-          {(result.latitude && result.longitude) || result.location_name ? (
+          {(result.latitude && result.longitude) || result.location_name || result.location_status ? (
             <div className="bg-gradient-to-r from-blue-50 to-indigo-50 rounded-lg p-5 shadow-inner">
               <h4 className="text-gray-700 font-medium mb-4 flex items-center">
                 <svg
@@ -116,7 +116,7 @@ const AnalysisResults = () => {
                   </div>
                 )}
 
-                {result.location_name && (
+                {(result.location_name || result.location_status) && (
                   <div className="flex items-center">
                     <div className="bg-white p-2 rounded-lg shadow-sm flex items-center justify-center mr-3">
                       <svg
@@ -138,9 +138,19 @@ const AnalysisResults = () => {
                       <span className="text-sm text-gray-500 block">
                         Address
                       </span>
-                      <span className="text-gray-700 text-sm">
-                        {result.location_name}
-                      </span>
+                      {result.location_name ? (
+                        <span className="text-gray-700 text-sm">
+                          {result.location_name}
+                        </span>
+                      ) : result.location_status === 'pending' ? (
+                        <span className="text-gray-400 text-sm italic animate-pulse">
+                          Looking up address...
+                        </span>
+                      ) : (
+                        <span className="text-gray-400 text-sm italic">
+                          Address unavailable
+                        </span>
+                      )}
                     </div>
                   </div>
                 )}
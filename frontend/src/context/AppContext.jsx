@@ -9,12 +9,12 @@ const AppContext = createContext();
 
 export const AppProvider = ({ children }) => {
   const { toast } = useToast();
-  const { user } = useAuth();
+  const { currentUser: user, authFetch, accessToken } = useAuth();
   const { getLocation } = useLocation();
 
   // Use custom hooks
-  const { notifications, setNotifications, deleteDetection, socket } =
-    useNotifications(user);
+  const { notifications, setNotifications, deleteDetection, socket, loadMore, hasMore, loadingMore } =
+    useNotifications(user, authFetch, accessToken);
   const {
     file,
     preview,
@@ -24,7 +24,7 @@ export const AppProvider = ({ children }) => {
     handleFileChange,
     handleUpload,
     resetFileInput,
-  } = useFileUpload();
+  } = useFileUpload(authFetch);
 
   // Date formatting function
   const formatDetectionDate = (dateString) => {
@@ -72,7 +72,7 @@ export const AppProvider = ({ children }) => {
   // Handle status update
   const updateDetectionStatus = async (detectionId, newStatus) => {
     try {
-      const response = await fetch(
+      const response = await authFetch(
         `http://localhost:5000/api/detections/${detectionId}/status`, // Add /status
         {
           method: "PATCH",
@@ -108,6 +108,9 @@ export const AppProvider = ({ children }) => {
         loading,
         error,
         notifications,
+        loadMoreNotifications: loadMore,
+        hasMoreNotifications: hasMore,
+        loadingMoreNotifications: loadingMore,
         formatDetectionDate,
         handleFileChange,
         handleUpload: handleUploadWithToast,
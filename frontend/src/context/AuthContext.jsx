@@ -1,22 +1,78 @@
-import { createContext, useContext, useState, useEffect } from "react";
+import { createContext, useContext, useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom"; // Import navigation
 
 const AuthContext = createContext();
+const TOKENS_KEY = "auth_tokens";
 
 export const AuthProvider = ({ children }) => {
   const [currentUser, setCurrentUser] = useState(null);
   const [loading, setLoading] = useState(true);
   const navigate = useNavigate(); // Initialize navigation
+  const tokens = useRef(JSON.parse(localStorage.getItem(TOKENS_KEY)));
+  const refreshing = useRef(null);
+
+  const saveSession = (data) => {
+    tokens.current = { access_token: data.access_token, refresh_token: data.refresh_token };
+    localStorage.setItem(TOKENS_KEY, JSON.stringify(tokens.current));
+    setCurrentUser(data.user);
+    localStorage.setItem("user", JSON.stringify(data.user));
+  };
 
-  // Load user from localStorage on startup
+  const clearSession = () => {
+    tokens.current = null;
+    localStorage.removeItem(TOKENS_KEY);
+    localStorage.removeItem("user");
+    setCurrentUser(null);
+  };
+
+  // Load user from localStorage on startup; without tokens the stored user has to log in again
   useEffect(() => {
     const storedUser = JSON.parse(localStorage.getItem("user"));
-    if (storedUser) {
+    if (storedUser && tokens.current) {
       setCurrentUser(storedUser);
     }
     setLoading(false);
   }, []);
 
+  // Trade the refresh token for a new pair; concurrent callers share one request
+  const refreshSession = () => {
+    if (!refreshing.current) {
+      refreshing.current = (async () => {
+        try {
+          const response = await fetch("http://localhost:5000/api/token/refresh", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ refresh_token: tokens.current?.refresh_token }),
+          });
+          if (!response.ok) throw new Error("Session expired");
+          saveSession(await response.json());
+          return true;
+        } catch (error) {
+          clearSession();
+          navigate("/login");
+          return false;
+        } finally {
+          refreshing.current = null;
+        }
+      })();
+    }
+    return refreshing.current;
+  };
+
+  // fetch() with the access token attached, refreshing it once when it has expired
+  const authFetch = async (url, options = {}) => {
+    const send = () =>
+      fetch(url, {
+        ...options,
+        headers: { ...options.headers, Authorization: `Bearer ${tokens.current?.access_token}` },
+      });
+    const response = await send();
+    if (response.status !== 401 || !tokens.current) return response;
+    return (await refreshSession()) ? send() : response;
+  };
+
+  const accessToken = () => tokens.current?.access_token;
+
   // Register Function
   const register = async (email, password) => {
     try {
@@ -61,8 +117,7 @@ export const AuthProvider = ({ children }) => {
         throw new Error("Invalid user data received");
       }
 
-      setCurrentUser(data.user);
-      localStorage.setItem("user", JSON.stringify(data.user));
+      saveSession(data);
 
       console.log("Redirecting to dashboard...");
       navigate("/dashboard"); // 🔥 Redirect user after successful login
@@ -76,13 +131,13 @@ export const AuthProvider = ({ children }) => {
 
   // Logout Function
   const logout = () => {
-    localStorage.removeItem("user");
-    setCurrentUser(null);
+    authFetch("http://localhost:5000/api/logout", { method: "POST" }).catch(() => {});
+    clearSession();
     navigate("/login"); // 🔥 Redirect to login after logout
   };
 
   return (
-    <AuthContext.Provider value={{ currentUser, login, logout, register }}>
+    <AuthContext.Provider value={{ currentUser, login, logout, register, authFetch, accessToken }}>
       {!loading && children}
     </AuthContext.Provider>
   );
@@ -0,0 +1,36 @@
+import { useState, useEffect } from "react";
+
+const REFRESH_DELAY_MS = 1000;
+
+// Sum the rows of one rollup dimension per bucket, keeping garbage detections in the given status
+export const sumByBucket = (rows = [], status = "all") => {
+  const totals = {};
+  rows.forEach((row) => {
+    if (row.prediction !== "Garbage") return;
+    if (status !== "all" && row.status !== status) return;
+    totals[row.bucket] = (totals[row.bucket] ?? 0) + row.count;
+  });
+  return totals;
+};
+
+// Server-side rollups for the dashboard; refetched shortly after `refreshKey` changes
+export const useAnalytics = (refreshKey, authFetch) => {
+  const [analytics, setAnalytics] = useState(null);
+
+  useEffect(() => {
+    // A burst of live updates triggers a single request
+    const timer = setTimeout(async () => {
+      try {
+        const response = await authFetch("http://localhost:5000/api/analytics?days=90");
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error);
+        setAnalytics(data);
+      } catch (error) {
+        console.error("Failed to fetch analytics:", error);
+      }
+    }, REFRESH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [refreshKey]);
+
+  return analytics;
+};
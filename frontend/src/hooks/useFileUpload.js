@@ -1,11 +1,50 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 
-export const useFileUpload = () => {
+const ADDRESS_POLL_INTERVAL_MS = 2000;
+const ADDRESS_POLL_ATTEMPTS = 15;
+
+export const useFileUpload = (authFetch) => {
   const [file, setFile] = useState(null);
   const [preview, setPreview] = useState(null);
   const [result, setResult] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const pollTimer = useRef(null);
+
+  const stopAddressPolling = () => {
+    clearTimeout(pollTimer.current);
+    pollTimer.current = null;
+  };
+
+  // The address is looked up in the background after /upload returns; poll the detection until it is filled in
+  const pollAddress = (detectionId, attempt = 1) => {
+    pollTimer.current = setTimeout(async () => {
+      try {
+        const response = await authFetch(`http://localhost:5000/api/detections/${detectionId}`);
+        // 404 while the detection is still being stored
+        if (response.ok) {
+          const detection = await response.json();
+          if (detection.location_name) {
+            setResult((prev) =>
+              prev?.id === detectionId
+                ? { ...prev, location_name: detection.location_name, location_status: "found" }
+                : prev
+            );
+            return;
+          }
+        }
+      } catch (err) {
+        console.error("Failed to fetch detection address:", err);
+      }
+      if (attempt < ADDRESS_POLL_ATTEMPTS) {
+        pollAddress(detectionId, attempt + 1);
+      } else {
+        setResult((prev) => (prev?.id === detectionId ? { ...prev, location_status: "unavailable" } : prev));
+      }
+    }, ADDRESS_POLL_INTERVAL_MS);
+  };
+
+  useEffect(() => stopAddressPolling, []);
 
   // Clean up preview URL
   useEffect(() => {
@@ -49,6 +88,7 @@ export const useFileUpload = () => {
 
     setLoading(true);
     setError(null);
+    stopAddressPolling();
 
     try {
       const locationData = await getLocation().catch(() => ({
@@ -72,7 +112,12 @@ export const useFileUpload = () => {
       }
 
       const data = await response.json();
-      setResult(data);
+      if (data.location_name) {
+        setResult({ ...data, location_status: "found" });
+      } else {
+        setResult({ ...data, location_status: "pending" });
+        pollAddress(data.id);
+      }
 
       if (data.prediction === "Garbage") {
         const newDetection = {
@@ -113,6 +158,7 @@ export const useFileUpload = () => {
     handleFileChange,
     handleUpload,
     resetFileInput: () => {
+      stopAddressPolling();
       setFile(null);
       setPreview(null);
       setResult(null);
@@ -1,39 +1,133 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { io } from "socket.io-client";
 
 const STORAGE_KEY = "garbage_detections";
+const PAGE_SIZE = 50;
 
-export const useNotifications = (user) => {
+// Apply a batch of coalesced changes from the change feed (one entry per detection)
+const applyChanges = (prev, changes) => {
+  const byId = new Map(changes.map((change) => [change.id, change]));
+  const kept = prev
+    .filter((n) => byId.get(n.id)?.op !== "delete")
+    .map((n) => (byId.has(n.id) ? byId.get(n.id).detection : n));
+  const known = new Set(prev.map((n) => n.id));
+  const added = changes
+    .filter((change) => change.op === "upsert" && !known.has(change.id))
+    .map((change) => change.detection);
+  return [...added.reverse(), ...kept];
+};
+
+export const useNotifications = (user, authFetch, accessToken) => {
   const [socket, setSocket] = useState(null);
   const [notifications, setNotifications] = useState([]);
+  const [reloadKey, setReloadKey] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const changesToken = useRef(null);
+
+  // Each room gets its own share of a batch, so batches sharing a token are all
+  // applied; older ones were already covered by a (fresher) catch-up read
+  const applyBatch = (batch) => {
+    const current = changesToken.current;
+    if (current === null) return; // Still loading; the catch-up after the load covers it
+    if (Number(batch.token) < Number(current)) return;
+    setNotifications((prev) => applyChanges(prev, batch.changes));
+    changesToken.current = batch.token;
+  };
 
-  // Initialize WebSocket connection
+  // After a (re)connect or the initial load, fetch only what changed since our token
+  const catchUp = async () => {
+    if (changesToken.current === null) return;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const response = await authFetch(
+          `http://localhost:5000/api/detections/changes?since=${changesToken.current}`
+        );
+        if (response.status === 410) {
+          setReloadKey((key) => key + 1); // Token too old: reload the full list
+          return;
+        }
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error);
+        applyBatch(data);
+        hasMore = data.has_more && data.token !== data.since;
+      }
+    } catch (error) {
+      console.error("Failed to fetch detection changes:", error);
+    }
+  };
+
+  // Initialize WebSocket connection; the role in the access token decides which rooms it joins
   useEffect(() => {
-    const newSocket = io("http://localhost:5000"); // Connect to the backend
+    // A callback, so every reconnect sends the current (possibly refreshed) token
+    const newSocket = io("http://localhost:5000", { auth: (cb) => cb({ token: accessToken() }) });
+    newSocket.on("detections_changed", applyBatch);
+    newSocket.on("connect", catchUp);
     setSocket(newSocket);
 
     // Cleanup on unmount
     return () => {
       newSocket.disconnect();
     };
-  }, []);
+  }, [user?.id]);
 
   // Fetch notifications from backend on mount or user login
   useEffect(() => {
+    let cancelled = false;
+
+    // Only the first page; older detections are fetched with loadMore
     const fetchNotifications = async () => {
       try {
-        const response = await fetch("http://localhost:5000/api/detections");
+        changesToken.current = null;
+        const response = await authFetch(`http://localhost:5000/api/detections?limit=${PAGE_SIZE}`);
         const data = await response.json();
-        setNotifications(Array.isArray(data) ? data : []); // Ensure data is an array
-        localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
+        if (cancelled) return;
+        if (!response.ok) throw new Error(data.error);
+
+        setNotifications(Array.isArray(data.items) ? data.items : []);
+        setNextCursor(data.next_cursor ?? null);
+
+        // Start applying live changes, after fetching what changed during the load
+        changesToken.current = data.changes_token ?? null;
+        catchUp();
       } catch (error) {
         console.error("Failed to fetch notifications:", error);
-        setNotifications([]); // Fallback to empty array on error
+        if (!cancelled) {
+          setNotifications([]); // Fallback to empty array on error
+          setNextCursor(null);
+        }
       }
     };
 
     fetchNotifications();
-  }, [user]); // Refetch when user changes (e.g., logs in)
+    return () => {
+      cancelled = true;
+    };
+  }, [user, reloadKey]); // Refetch when user changes (e.g., logs in)
+
+  // Fetch the next (older) page from the last page's cursor
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const params = new URLSearchParams({ limit: PAGE_SIZE, cursor: nextCursor });
+      const response = await authFetch(`http://localhost:5000/api/detections?${params}`);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.error);
+
+      // Live updates may already have delivered some of these
+      setNotifications((prev) => {
+        const known = new Set(prev.map((n) => n.id));
+        return [...prev, ...(data.items ?? []).filter((n) => !known.has(n.id))];
+      });
+      setNextCursor(data.next_cursor ?? null);
+    } catch (error) {
+      console.error("Failed to fetch more notifications:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   // Sync notifications with local storage
   useEffect(() => {
@@ -43,7 +137,7 @@ export const useNotifications = (user) => {
   // Handle deletion of detections
   const deleteDetection = async (detectionId) => {
     try {
-      const response = await fetch(`http://localhost:5000/api/detections/${detectionId}`, {
+      const response = await authFetch(`http://localhost:5000/api/detections/${detectionId}`, {
         method: "DELETE",
       });
 
@@ -64,5 +158,8 @@ export const useNotifications = (user) => {
     setNotifications,
     deleteDetection,
     socket,
+    loadMore,
+    hasMore: nextCursor !== null,
+    loadingMore,
   };
 };
\ No newline at end of file
@@ -16,6 +16,8 @@ import AISummary from "../components/NagarPalikaDashboard/AISummary";
 import NotificationCard from "../components/NagarPalikaDashboard/NotificationCard";
 import GarbageMap from "../components/NagarPalikaDashboard/Map";
 import Analytics from "../components/NagarPalikaDashboard/Analytics";
+import { useAnalytics } from "../hooks/useAnalytics";
+import { useAuth } from "../context/AuthContext";
 
 const NagarpalikaGarbageDashboard = () => {
   const {
@@ -24,6 +26,9 @@ const NagarpalikaGarbageDashboard = () => {
     handleFileChange,
     updateDetectionStatus,
     deleteDetection,
+    loadMoreNotifications,
+    hasMoreNotifications,
+    loadingMoreNotifications,
   } = useAppContext();
   const [searchTerm, setSearchTerm] = useState("");
   const [filteredNotifications, setFilteredNotifications] = useState([]);
@@ -52,12 +57,18 @@ const NagarpalikaGarbageDashboard = () => {
     setFilteredNotifications(filtered);
   }, [searchTerm, notifications, activeTab]);
 
-  // Calculate stats for the stats cards
+  // Stats cards come from the server-side rollups, refreshed as live updates arrive
+  const { authFetch } = useAuth();
+  const analytics = useAnalytics(notifications, authFetch);
+  const countGarbage = (status) =>
+    (analytics?.totals ?? [])
+      .filter((row) => row.prediction === "Garbage" && (!status || row.status === status))
+      .reduce((sum, row) => sum + row.count, 0);
   const stats = {
-    total: notifications.filter((n) => (n.prediction==="Garbage")).length,
-    pending: notifications.filter((n) => (n.prediction==="Garbage" && n.status === "pending")).length,
-    completed: notifications.filter((n) => (n.prediction==="Garbage" && n.status === "completed")).length,
-    inProgress: notifications.filter((n) => (n.prediction==="Garbage" && n.status === "in_progress")).length,
+    total: countGarbage(),
+    pending: countGarbage("pending"),
+    completed: countGarbage("completed"),
+    inProgress: countGarbage("in_progress"),
   };
 
   // Handle file upload
@@ -74,9 +85,9 @@ const NagarpalikaGarbageDashboard = () => {
   const renderView = () => {
     switch (view) {
       case "map":
-        return <GarbageMap detections={filteredNotifications ?? []} />;
+        return <GarbageMap authFetch={authFetch} />;
       case "analytics":
-        return <Analytics detections={notifications ?? []} activeTab={activeTab} />;
+        return <Analytics analytics={analytics} activeTab={activeTab} />;
       default:
         return (
           <div className="space-y-4">
@@ -99,6 +110,17 @@ const NagarpalikaGarbageDashboard = () => {
                 No detections found matching your criteria
               </div>
             )}
+            {hasMoreNotifications && (
+              <div className="text-center">
+                <button
+                  onClick={loadMoreNotifications}
+                  disabled={loadingMoreNotifications}
+                  className="px-4 py-2 rounded-lg bg-emerald-600 text-white hover:bg-emerald-700 disabled:opacity-50"
+                >
+                  {loadingMoreNotifications ? "Loading..." : "Load more"}
+                </button>
+              </div>
+            )}
           </div>
         );
     }